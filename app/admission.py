@@ -0,0 +1,187 @@
+"""
+Admission control: concurrency limits with bounded wait queues, and
+per-client rate limits
+
+Work beyond a limiter's concurrency waits in a FIFO queue, each waiter with
+its own deadline. When the queue is full, or a waiter's deadline passes,
+the request is shed with Overloaded (429 with Retry-After) instead of piling
+onto the upstreams and slowing down every request in flight.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Deque, Dict, Optional, Tuple
+
+from app.config import settings
+from app.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_REJECTED
+
+
+class Overloaded(Exception):
+    """Request shed by admission control; retry_after is a hint in seconds"""
+
+    def __init__(self, name: str, retry_after: float, reason: str):
+        super().__init__(f"{name} is overloaded ({reason}), retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionLimiter:
+    """
+    At most `max_concurrency` holders at once, and at most `max_queue` waiting
+
+    A released slot goes straight to the longest waiter. Waiters that give up
+    (deadline passed or cancelled) leave the queue. A `max_concurrency` of 0
+    disables the limit. Not thread-safe: use from one event loop.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long a slot is held, for Retry-After
+        self._hold_time: Optional[float] = None
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "timeout": 0}
+
+    def retry_after(self) -> float:
+        """Rough time until a new request would get a slot"""
+        hold_time = self._hold_time or 1.0
+        return max(1.0, hold_time * (len(self._waiters) + 1) / max(self.max_concurrency, 1))
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        raise Overloaded(self.name, self.retry_after(), reason)
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE.labels(self.name).set(self.active)
+        ADMISSION_QUEUED.labels(self.name).set(len(self._waiters))
+
+    async def acquire(self, timeout: Optional[float] = None):
+        """Take a slot, waiting at most `timeout` seconds (None = no deadline)"""
+        if self.max_concurrency <= 0:
+            return
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            self._update_gauges()
+            return
+        if len(self._waiters) >= self.max_queue or (timeout is not None and timeout <= 0):
+            self._reject("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except BaseException as e:
+            if waiter.done():
+                # The slot was handed over just as we gave up: pass it on
+                self._release_slot()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                self._update_gauges()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("timeout")
+            raise
+        self.admitted += 1
+
+    def _release_slot(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot moves to the waiter; active stays the same
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+    def release(self, held: float = None):
+        if self.max_concurrency <= 0:
+            return
+        if held is not None:
+            self._hold_time = held if self._hold_time is None else 0.9 * self._hold_time + 0.1 * held
+        self._release_slot()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        """Hold a slot for the duration of the block"""
+        await self.acquire(timeout)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "hold_time_ms": self._hold_time * 1000 if self._hold_time is not None else None
+        }
+
+
+class ClientRateLimiter:
+    """
+    Token bucket per client: `rate` requests per second, bursts of up to `burst`
+
+    Buckets of the least recently seen clients are dropped beyond `max_clients`;
+    a dropped client starts again with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> (tokens, last update)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.rejected = 0
+
+    def acquire(self, client: str, cost: int = 1):
+        """Take `cost` tokens from the client's bucket or raise Overloaded"""
+        now = time.monotonic()
+        # A cost above the burst could never be paid
+        cost = min(cost, self.burst)
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        self._buckets[client] = (tokens - cost if tokens >= cost else tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        if tokens < cost:
+            self.rejected += 1
+            ADMISSION_REJECTED.labels("client", "rate_limited").inc()
+            raise Overloaded("client", max(1.0, (cost - tokens) / self.rate), "rate_limited")
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_minute": self.rate * 60,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "rejected": self.rejected
+        }
+
+
+@lru_cache()
+def get_chat_admission() -> AdmissionLimiter:
+    """Admission for chat requests, held from arrival until the response is sent"""
+    return AdmissionLimiter("chat", settings.ADMISSION_MAX_CONCURRENCY, settings.ADMISSION_MAX_QUEUE)
+
+
+@lru_cache()
+def get_client_rate_limiter() -> Optional[ClientRateLimiter]:
+    """Per-client rate limiter, None when RATE_LIMIT_PER_MINUTE is 0"""
+    if settings.RATE_LIMIT_PER_MINUTE <= 0:
+        return None
+    return ClientRateLimiter(settings.RATE_LIMIT_PER_MINUTE / 60, settings.RATE_LIMIT_BURST)
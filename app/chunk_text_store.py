@@ -0,0 +1,79 @@
+"""
+Chunk texts kept outside the vector store, keyed by point id
+
+With CHUNK_TEXT_STORE_PATH set, Qdrant payloads carry only the small fields
+used for filtering and display, and search hits get their text from this
+SQLite file. Like the BM25 index, the file is written by the ingest script and
+deployed with the API.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+# SQLite's default limit on host parameters per statement is 999
+MAX_PARAMETERS = 900
+
+
+class ChunkTextStore:
+    """Key-value file of chunk texts; one connection shared under a lock"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, text TEXT NOT NULL)")
+        self._connection.commit()
+
+    def put_many(self, items: Iterable[Tuple[str, str]]) -> int:
+        """Insert or replace (point id, text) pairs"""
+        items = list(items)
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO chunks (id, text) VALUES (?, ?)", items)
+            self._connection.commit()
+        return len(items)
+
+    def get_many(self, ids: Sequence[str]) -> Dict[str, str]:
+        """Texts of the ids that are stored"""
+        texts = {}
+        ids = list(dict.fromkeys(ids))
+        with self._lock:
+            for i in range(0, len(ids), MAX_PARAMETERS):
+                batch = ids[i:i + MAX_PARAMETERS]
+                rows = self._connection.execute(
+                    f"SELECT id, text FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                )
+                texts.update(rows)
+        return texts
+
+    def delete_many(self, ids: Sequence[str]) -> int:
+        with self._lock:
+            self._connection.executemany("DELETE FROM chunks WHERE id = ?", [(point_id,) for point_id in ids])
+            self._connection.commit()
+        return len(ids)
+
+    def hydrate(self, hits: List) -> List:
+        """Fill in payload["text"] of search hits from the store, in place"""
+        texts = self.get_many([str(hit.id) for hit in hits if hit.payload is not None])
+        for hit in hits:
+            if hit.payload is not None:
+                hit.payload["text"] = texts.get(str(hit.id), "")
+        return hits
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+
+def get_chunk_text_store() -> Optional[ChunkTextStore]:
+    """Store for CHUNK_TEXT_STORE_PATH, None when texts live in the payloads"""
+    if not settings.CHUNK_TEXT_STORE_PATH:
+        return None
+    return ChunkTextStore(settings.CHUNK_TEXT_STORE_PATH)
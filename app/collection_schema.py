@@ -0,0 +1,73 @@
+from typing import Dict, Optional
+
+from qdrant_client.models import (
+    Distance,
+    HnswConfigDiff,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+)
+
+from app.config import settings
+
+# Output dimensions of the embedding models we've used
+EMBEDDING_DIMENSIONS: Dict[str, int] = {
+    "text-embedding-004": 768,
+    "embedding-001": 768,
+    "gemini-embedding-001": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# Payload fields used in search filters or ingest bookkeeping, indexed as keywords
+PAYLOAD_INDEX_FIELDS = ("module", "chapter", "file_path")
+
+
+def embedding_dimension(model: Optional[str] = None) -> Optional[int]:
+    """
+    Vector size produced by the embedding model
+
+    EMBEDDING_DIMENSION overrides the lookup, e.g. for models that aren't in
+    EMBEDDING_DIMENSIONS or that are asked for a reduced output size.
+    """
+    if settings.EMBEDDING_DIMENSION:
+        return settings.EMBEDDING_DIMENSION
+    model = model or settings.EMBEDDING_MODEL
+    # Gemini model names are sometimes given as "models/text-embedding-004"
+    return EMBEDDING_DIMENSIONS.get(model.split("/")[-1])
+
+
+def vectors_config(vector_size: int) -> VectorParams:
+    return VectorParams(size=vector_size, distance=Distance.COSINE)
+
+
+def hnsw_config() -> HnswConfigDiff:
+    return HnswConfigDiff(m=settings.QDRANT_HNSW_M, ef_construct=settings.QDRANT_HNSW_EF_CONSTRUCT)
+
+
+def quantization_config() -> Optional[ScalarQuantization]:
+    """int8 scalar quantization kept in RAM, or None when disabled"""
+    if not settings.QDRANT_QUANTIZATION:
+        return None
+    return ScalarQuantization(
+        scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+    )
+
+
+def search_params() -> Optional[SearchParams]:
+    """Per-query HNSW ef and quantization rescoring, or None for Qdrant's defaults"""
+    quantization = None
+    if settings.QDRANT_QUANTIZATION:
+        # Over-fetch on the quantized vectors, then rescore with the originals
+        quantization = QuantizationSearchParams(
+            rescore=True,
+            oversampling=settings.QDRANT_QUANTIZATION_OVERSAMPLING
+        )
+    if settings.QDRANT_SEARCH_EF is None and quantization is None:
+        return None
+    return SearchParams(hnsw_ef=settings.QDRANT_SEARCH_EF, quantization=quantization)
+
@@ -1,5 +1,6 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -9,38 +10,195 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: str
     GEMINI_BASE_URL: str = "https://generativelanguage.googleapis.com/v1beta/openai/"
     EMBEDDING_MODEL: str = "text-embedding-004"  # Gemini embedding model
+    EMBEDDING_DIMENSION: Optional[int] = None  # detected from EMBEDDING_MODEL when unset
     CHAT_MODEL: str = "gemini-1.0-pro"  # Use available model for OpenAI compatibility
     MAX_TOKENS: int = 500
     TEMPERATURE: float = 0.7
     
-    # Qdrant Configuration
-    QDRANT_URL: str
-    QDRANT_API_KEY: str
+    # Vector Store Configuration ("qdrant" or "local" for the in-process NumPy backend)
+    VECTOR_BACKEND: str = "qdrant"
+    LOCAL_VECTOR_STORE_PATH: str = "data/vectors"
+    
+    # Qdrant Configuration (required when VECTOR_BACKEND is "qdrant")
+    QDRANT_URL: str = ""
+    QDRANT_API_KEY: str = ""
     QDRANT_COLLECTION_NAME: str = "book_content"
+    # Collection schema, applied to existing collections by scripts/migrate_collection.py
+    QDRANT_HNSW_M: int = 16
+    QDRANT_HNSW_EF_CONSTRUCT: int = 100
+    QDRANT_SEARCH_EF: Optional[int] = None  # HNSW ef at query time, None = Qdrant default
+    QDRANT_QUANTIZATION: bool = False  # int8 scalar quantization, rescored with full vectors
+    QDRANT_QUANTIZATION_OVERSAMPLING: float = 2.0
+    # Keep chunk texts out of Qdrant payloads, in a local SQLite file keyed by point id (None = in the payloads)
+    CHUNK_TEXT_STORE_PATH: Optional[str] = None
     
     # Database Configuration
     DATABASE_URL: str
+    # Write-behind conversation persistence
+    CONVERSATION_QUEUE_SIZE: int = 1000
+    CONVERSATION_BATCH_SIZE: int = 50
+    CONVERSATION_FLUSH_INTERVAL: float = 1.0  # seconds
+    CONVERSATION_ENQUEUE_TIMEOUT: float = 0.5  # seconds to wait for queue space before dropping
+    # Retention: scripts/archive_conversations.py moves older rows to gzipped JSONL files
+    CONVERSATION_RETENTION_DAYS: int = 90
+    CONVERSATION_ARCHIVE_PATH: str = "data/archive"
+    CONVERSATION_ARCHIVE_BATCH_SIZE: int = 5000  # rows per archive file and per delete
+    # Admin export and analytics (/admin/conversations/...)
+    CONVERSATION_EXPORT_PAGE_SIZE: int = 1000  # rows per keyset page, each read on its own connection
+    CONVERSATION_ROLLUP_LAG: float = 300.0  # seconds; newer rows wait for a later rollup refresh
     
     # Application Configuration
     ENVIRONMENT: str = "development"
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
     CORS_ORIGINS: str = "http://localhost:3000"
+    # Modules labelled on cache and error metrics (comma-separated); anything else counts as "other"
+    METRICS_MODULES: str = "intro,module1,module2,module3,module4"
     
     # RAG Configuration
-    CHUNK_SIZE: int = 500
-    CHUNK_OVERLAP: int = 50
+    CHUNK_SIZE: int = 128  # estimated tokens per chunk
+    CHUNK_OVERLAP: int = 16  # tokens of whole sentences repeated in the next chunk
     TOP_K_RESULTS: int = 5
     
+    # Context Packing Configuration
+    CONTEXT_CANDIDATES: int = 20  # results over-fetched before MMR selection
+    CONTEXT_TOKEN_BUDGET: int = 2000  # estimated tokens of context per prompt
+    MMR_LAMBDA: float = 0.7  # 1.0 = pure relevance, lower favours diverse chunks
+    
+    # Reranking Configuration ("local" rescores over-fetched candidates in NumPy, "none" disables it)
+    RERANKER: str = "none"
+    RERANK_CANDIDATES: int = 50  # dense hits fetched with their vectors for reranking
+    RERANK_HEADING_WEIGHT: float = 0.1  # boost for query terms in the chunk's headings
+    RERANK_KEYWORD_WEIGHT: float = 0.05  # boost for query terms in the chunk's text
+    RERANK_SHORT_CHUNK_TOKENS: int = 24  # chunks shorter than this are penalized
+    RERANK_SHORT_CHUNK_PENALTY: float = 0.1  # penalty for an empty chunk, scaled down with length
+    
+    # Batch Chat Configuration
+    BATCH_MAX_ITEMS: int = 32  # questions per /api/chat/batch request
+    BATCH_CONCURRENCY: int = 4  # completions in flight per batch
+    
+    # Hybrid Retrieval Configuration (BM25 fused with vector search)
+    HYBRID_SEARCH_ENABLED: bool = True
+    LEXICAL_INDEX_PATH: Optional[str] = None  # defaults to data/<collection>_bm25.json
+    HYBRID_CANDIDATES: int = 20  # candidates taken from each retriever before fusion
+    RRF_K: int = 60
+    DENSE_WEIGHT: float = 1.0
+    LEXICAL_WEIGHT: float = 1.0
+    
+    # Ingestion Configuration
+    INGEST_BATCH_SIZE: int = 100  # chunks per embeddings request
+    INGEST_CONCURRENCY: int = 4  # embeddings requests in flight
+    INGEST_RATE_LIMIT: float = 10.0  # max embeddings requests/sec, 0 = unlimited
+    INGEST_MAX_RETRIES: int = 5
+    INGEST_MANIFEST_PATH: str = "data/ingest_manifest.json"  # content hashes of ingested files, doubles as checkpoint
+    INGEST_CHUNK_WORKERS: int = 0  # chunking processes, 0 = one per CPU
+    INGEST_UPLOAD_WORKERS: int = 2  # vector store uploads in flight
+    INGEST_UPLOAD_BATCH_SIZE: int = 256  # points per upload request
+    INGEST_QUEUE_SIZE: int = 32  # files buffered between pipeline stages
+    INGEST_CHECKPOINT_INTERVAL: float = 5.0  # seconds between manifest saves
+    
+    # Upstream Client Configuration (Gemini and Qdrant calls)
+    UPSTREAM_MAX_CONNECTIONS: int = 100
+    UPSTREAM_MAX_KEEPALIVE: int = 20  # idle connections kept open per client
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0
+    UPSTREAM_EMBEDDING_TIMEOUT: float = 10.0  # deadline per call, retries included
+    UPSTREAM_COMPLETION_TIMEOUT: float = 60.0  # streams included, until the last token
+    UPSTREAM_SEARCH_TIMEOUT: float = 5.0
+    UPSTREAM_MAX_RETRIES: int = 2  # on 429, 5xx, timeouts and connection errors
+    UPSTREAM_RETRY_BASE_DELAY: float = 0.1
+    UPSTREAM_RETRY_MAX_DELAY: float = 2.0
+    UPSTREAM_BREAKER_THRESHOLD: int = 5  # consecutive failures that open the circuit breaker
+    UPSTREAM_BREAKER_RESET: float = 30.0  # seconds open before a trial call is let through
+    UPSTREAM_HEDGING: bool = False  # duplicate slow embedding/search calls
+    UPSTREAM_HEDGE_QUANTILE: float = 0.95  # hedge after this quantile of recent latency
+    UPSTREAM_HEDGE_MIN_DELAY_MS: float = 20.0
+    
+    # Embedding Batching Configuration (max wait 0 disables micro-batching)
+    EMBEDDING_BATCH_MAX_SIZE: int = 64  # query embeddings per upstream call
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0  # how long the first query waits for others
+    
+    # Embedding Cache Configuration (size 0 disables the cache)
+    EMBEDDING_CACHE_SIZE: int = 10000
+    EMBEDDING_CACHE_TTL: int = 86400  # seconds
+    EMBEDDING_CACHE_PATH: Optional[str] = None  # e.g. data/embedding_cache.json
+    
+    # Semantic Answer Cache Configuration (size 0 disables the cache)
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95  # minimum cosine similarity for a hit
+    SEMANTIC_CACHE_SIZE: int = 2000
+    SEMANTIC_CACHE_TTL: int = 86400  # seconds
+    
+    # Conversation History Configuration (max turns 0 makes every turn stateless)
+    HISTORY_MAX_TURNS: int = 10  # recent turns loaded per conversation
+    HISTORY_TOKEN_BUDGET: int = 1000  # estimated tokens of past turns replayed to the model
+    HISTORY_SUMMARY_TOKENS: int = 200  # older turns beyond the budget are summarized in this many
+    HISTORY_CACHE_SIZE: int = 1000  # conversations kept in memory (0 = read the database every turn)
+    HISTORY_CACHE_TTL: int = 1800  # seconds
+    
+    # Admission Control Configuration (concurrency 0 disables a limit)
+    ADMISSION_MAX_CONCURRENCY: int = 64  # chat requests processed at once
+    ADMISSION_MAX_QUEUE: int = 128  # chat requests waiting for a slot; more are answered 429
+    ADMISSION_QUEUE_TIMEOUT: float = 2.0  # seconds a chat request may wait for a slot; adds to its latency
+    UPSTREAM_EMBEDDING_MAX_CONCURRENCY: int = 16  # calls in flight per upstream
+    UPSTREAM_COMPLETION_MAX_CONCURRENCY: int = 32
+    UPSTREAM_SEARCH_MAX_CONCURRENCY: int = 32
+    UPSTREAM_MAX_QUEUE: int = 256  # calls waiting per upstream; they wait at most their deadline
+    RATE_LIMIT_PER_MINUTE: int = 0  # chat requests per client, 0 disables rate limiting
+    RATE_LIMIT_BURST: int = 20
+    RATE_LIMIT_CLIENT_HEADER: Optional[str] = None  # e.g. X-Forwarded-For behind a proxy; default is the peer address
+    
+    # Startup and Readiness Configuration
+    STARTUP_WARMUP: bool = True  # prime upstream connections and check the collection before serving
+    STARTUP_WARMUP_TIMEOUT: float = 5.0  # seconds; startup continues after this either way
+    READINESS_CHECK_TIMEOUT: float = 2.0  # seconds per dependency check
+    READINESS_CACHE_TTL: float = 10.0  # seconds a check result is reused by /health/ready
+    
+    # Admin API Configuration (admin endpoints are disabled when unset)
+    ADMIN_API_KEY: Optional[str] = None
+    # Admin cache invalidation endpoint the ingest script calls after re-ingestion
+    CACHE_INVALIDATION_URL: Optional[str] = None
+    
+    @property
+    def lexical_index_path(self) -> str:
+        """BM25 index file, kept next to the collection's local data"""
+        return self.LEXICAL_INDEX_PATH or f"data/{self.QDRANT_COLLECTION_NAME}_bm25.json"
+    
     @property
     def cors_origins_list(self) -> List[str]:
         """Convert comma-separated CORS origins to list"""
         return [origin.strip() for origin in self.CORS_ORIGINS.split(",")]
+
+    @property
+    def metrics_modules_list(self) -> List[str]:
+        """Convert comma-separated metric modules to list"""
+        return [module.strip() for module in self.METRICS_MODULES.split(",") if module.strip()]
     
     class Config:
         env_file = ".env"
         case_sensitive = True
 
 
+@lru_cache()
+def get_settings() -> Settings:
+    """Settings, read from the environment on first use"""
+    return Settings()
+
+
+class _LazySettings:
+    """
+    Forwards to get_settings()
+
+    Importing a module doesn't read (or validate) the environment; the first
+    attribute access does. Assignments, as scripts use for overrides, go to the
+    same cached instance.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name, value):
+        setattr(get_settings(), name, value)
+
+
 # Global settings instance
-settings = Settings()
+settings = _LazySettings()
@@ -0,0 +1,185 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from app.lexical_index import tokenize
+from app.utils.tokens import estimate_tokens, truncate_to_tokens
+from app.vector_store import ScoredChunk
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+# Shortest shared prefix/suffix treated as chunk overlap rather than coincidence
+MIN_OVERLAP_CHARS = 10
+
+# Don't bother appending a truncated block smaller than this
+MIN_BLOCK_TOKENS = 32
+
+
+@dataclass
+class ContextBlock:
+    """One passage of the prompt context: a chunk, or a run of adjacent chunks from one file"""
+    text: str
+    score: float
+    payload: Dict
+    # Position of the block's best chunk in the MMR selection
+    rank: int = 0
+    file_path: Optional[str] = None
+    first_index: Optional[int] = None
+    last_index: Optional[int] = None
+    # Point ids of the block's chunks, in file order
+    ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class PackedContext:
+    """Prompt context assembled within a token budget"""
+    text: str
+    blocks: List[ContextBlock] = field(default_factory=list)
+    tokens: int = 0
+    # Tokens the plain top-k join would have used; the difference is what packing saved
+    baseline_tokens: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.baseline_tokens - self.tokens)
+
+
+def _similarity(a: set, b: set) -> float:
+    """Jaccard similarity of two token sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def mmr_select(results: Sequence[ScoredChunk], limit: int, diversity_lambda: float = 0.7) -> List[ScoredChunk]:
+    """
+    Pick up to `limit` results by maximal marginal relevance
+
+    Relevance is the retrieval score min-max normalized over the candidates,
+    so it works the same for cosine and fused RRF scores. Redundancy is token
+    overlap with the chunks already picked, which is what repeated text in the
+    prompt actually costs.
+    """
+    if len(results) <= 1 or limit <= 0:
+        return list(results[:limit])
+
+    scores = [result.score for result in results]
+    low, high = min(scores), max(scores)
+    relevance = [(score - low) / (high - low) if high > low else 1.0 for score in scores]
+    token_sets = [set(tokenize(result.payload.get("text", ""))) for result in results]
+
+    remaining = list(range(len(results)))
+    # Highest similarity of each remaining candidate to anything already selected
+    redundancy = [0.0] * len(results)
+    selected: List[int] = []
+    while remaining and len(selected) < limit:
+        best = max(
+            remaining,
+            key=lambda i: diversity_lambda * relevance[i] - (1 - diversity_lambda) * redundancy[i]
+        )
+        selected.append(best)
+        remaining.remove(best)
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], _similarity(token_sets[i], token_sets[best]))
+
+    return [results[i] for i in selected]
+
+
+def strip_overlap(previous: str, following: str) -> str:
+    """Drop the start of `following` that repeats the end of `previous`"""
+    previous = previous.rstrip()
+    following = following.lstrip()
+    for size in range(min(len(previous), len(following)), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return following[size:].lstrip()
+    return following
+
+
+def merge_adjacent(results: Sequence[ScoredChunk]) -> List[ContextBlock]:
+    """
+    Merge chunks that follow each other in the same file into single blocks
+
+    Blocks keep the order of their best-ranked chunk, and the overlap the
+    chunker carried from one chunk into the next is included only once.
+    """
+    blocks: List[ContextBlock] = []
+    for rank, result in enumerate(results):
+        payload = result.payload
+        blocks.append(ContextBlock(
+            text=payload.get("text", ""),
+            score=result.score,
+            payload=payload,
+            rank=rank,
+            file_path=payload.get("file_path"),
+            first_index=payload.get("chunk_index"),
+            last_index=payload.get("chunk_index"),
+            ids=[str(result.id)]
+        ))
+
+    merged = True
+    while merged:
+        merged = False
+        by_end = {
+            (block.file_path, block.last_index): block
+            for block in blocks if block.file_path and block.last_index is not None
+        }
+        for block in blocks:
+            if not block.file_path or block.first_index is None:
+                continue
+            before = by_end.get((block.file_path, block.first_index - 1))
+            if before is None or before is block:
+                continue
+            before.text = f"{before.text.rstrip()} {strip_overlap(before.text, block.text)}".rstrip()
+            before.last_index = block.last_index
+            before.ids.extend(block.ids)
+            before.score = max(before.score, block.score)
+            before.rank = min(before.rank, block.rank)
+            blocks = [b for b in blocks if b is not block]
+            merged = True
+            break
+
+    blocks.sort(key=lambda block: block.rank)
+    return blocks
+
+
+def pack_context(
+    results: Sequence[ScoredChunk],
+    token_budget: int,
+    limit: int,
+    diversity_lambda: float = 0.7
+) -> PackedContext:
+    """
+    Assemble prompt context from over-fetched retrieval results
+
+    Selects `limit` chunks by MMR, merges adjacent chunks and their duplicated
+    overlap, then packs blocks in rank order until `token_budget` is reached,
+    truncating the last block that only partly fits.
+    """
+    baseline = CONTEXT_SEPARATOR.join(result.payload.get("text", "") for result in results[:limit])
+    baseline_tokens = estimate_tokens(baseline)
+
+    blocks = merge_adjacent(mmr_select(results, limit, diversity_lambda))
+
+    separator_tokens = estimate_tokens(CONTEXT_SEPARATOR)
+    packed: List[ContextBlock] = []
+    used = 0
+    for block in blocks:
+        cost = estimate_tokens(block.text) + (separator_tokens if packed else 0)
+        if used + cost <= token_budget:
+            packed.append(block)
+            used += cost
+            continue
+
+        available = token_budget - used - (separator_tokens if packed else 0)
+        if available >= MIN_BLOCK_TOKENS or not packed:
+            block.text = truncate_to_tokens(block.text, available)
+            if block.text:
+                packed.append(block)
+        break
+
+    text = CONTEXT_SEPARATOR.join(block.text for block in packed)
+    return PackedContext(
+        text=text,
+        blocks=packed,
+        tokens=estimate_tokens(text),
+        baseline_tokens=baseline_tokens
+    )
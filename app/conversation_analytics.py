@@ -0,0 +1,299 @@
+"""
+Conversation export and aggregates for the admin API
+
+Exports page through the conversations table with keyset pagination on
+(created_at, id). Each page is read from a server-side cursor in its own
+short read, so memory and lock time stay constant however much is exported.
+
+Top queries and per-module volumes come from rollup tables. A refresh folds
+in only the rows saved since the watermark, the key of the last row it
+processed, so the table is never rescanned. Rows younger than
+CONVERSATION_ROLLUP_LAG are left for the next refresh, because the
+write-behind writer can commit a row some time after its created_at.
+"""
+
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.database import (
+    Conversation, ModuleDailyCount, QueryCount, RollupWatermark, conversations_page, get_async_engine
+)
+from app.metrics import timed
+
+EXPORT_COLUMNS = [
+    Conversation.id,
+    Conversation.session_id,
+    Conversation.created_at,
+    Conversation.module,
+    Conversation.chapter,
+    Conversation.query,
+    Conversation.response,
+    Conversation.selected_text,
+    Conversation.context_refs
+]
+
+# Rollups of the conversations table share one watermark
+WATERMARK = "conversations"
+
+# Normalized queries are cut to this many characters
+MAX_QUERY_LENGTH = 500
+
+# Response body chunk size; rows are buffered up to it rather than sent one by one
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"\s+")
+
+# One refresh at a time per process; across processes the watermark update decides
+_refresh_lock = asyncio.Lock()
+
+
+def to_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC datetime, as created_at is stored, from a possibly timezone-aware one"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def export_conditions(
+    module: Optional[str] = None,
+    chapter: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> List:
+    """WHERE conditions for an export: module, chapter and created_at in [since, until)"""
+    conditions = []
+    if module is not None:
+        conditions.append(Conversation.module == module)
+    if chapter is not None:
+        conditions.append(Conversation.chapter == chapter)
+    if since is not None:
+        conditions.append(Conversation.created_at >= to_utc(since))
+    if until is not None:
+        conditions.append(Conversation.created_at < to_utc(until))
+    return conditions
+
+
+async def aexport_rows(conditions: List, page_size: int = None) -> AsyncIterator[Dict]:
+    """Conversation rows matching `conditions` in (created_at, id) order, one page per read"""
+    page_size = page_size or settings.CONVERSATION_EXPORT_PAGE_SIZE
+    after = None
+    while True:
+        statement = conversations_page(after, page_size, *conditions, columns=EXPORT_COLUMNS)
+        rows = 0
+        async with get_async_engine().connect() as connection:
+            # stream() reads from a server-side cursor where the driver has one
+            result = await connection.stream(statement)
+            async for row in result.mappings():
+                rows += 1
+                after = (row["created_at"], row["id"])
+                yield dict(row)
+        if rows < page_size:
+            return
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Can't serialize {type(value).__name__}")
+
+
+def _csv_line(values: List) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+async def aexport_lines(rows: AsyncIterator[Dict], format: str) -> AsyncIterator[str]:
+    """NDJSON or CSV (with a header row) of `rows`, in chunks of about CHUNK_SIZE characters"""
+    names = [column.name for column in EXPORT_COLUMNS]
+    buffer = [_csv_line(names)] if format == "csv" else []
+    size = sum(map(len, buffer))
+    async for row in rows:
+        if format == "csv":
+            line = _csv_line([_csv_value(row[name]) for name in names])
+        else:
+            line = json.dumps(row, default=_json_default) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def normalize_query(query: str) -> str:
+    """Lowercased, whitespace collapsed and trailing punctuation dropped, so rewordings count together"""
+    return _WHITESPACE.sub(" ", query).strip().rstrip("?!. ").lower()[:MAX_QUERY_LENGTH]
+
+
+def query_key(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _upsert(connection):
+    """INSERT ... ON CONFLICT builder for the database in use"""
+    return postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+
+
+def _at_watermark(watermark: Optional[Tuple[datetime, str]]):
+    if watermark is None:
+        return RollupWatermark.created_at.is_(None)
+    return and_(RollupWatermark.created_at == watermark[0], RollupWatermark.last_id == watermark[1])
+
+
+async def _aread_watermark(connection) -> Optional[Tuple[datetime, str]]:
+    row = (await connection.execute(
+        select(RollupWatermark.created_at, RollupWatermark.last_id).where(RollupWatermark.name == WATERMARK)
+    )).first()
+    return None if row is None or row.created_at is None else (row.created_at, row.last_id)
+
+
+async def _acreate_watermark():
+    """Insert the watermark row before the first refresh, so it can be updated conditionally"""
+    engine = get_async_engine()
+    async with engine.connect() as connection:
+        exists = (await connection.execute(
+            select(RollupWatermark.name).where(RollupWatermark.name == WATERMARK)
+        )).first()
+    if exists:
+        return
+    try:
+        async with engine.begin() as connection:
+            await connection.execute(RollupWatermark.__table__.insert().values(name=WATERMARK))
+    except IntegrityError:
+        # Another process created it first
+        pass
+
+
+async def _afold_page(connection, rows: List) -> None:
+    """Add a page of (created_at, id, query, module) rows to the rollup counts"""
+    queries: Dict[str, Dict] = {}
+    volumes: Dict[Tuple[date, str], int] = {}
+    for row in rows:
+        normalized = normalize_query(row.query)
+        key = query_key(normalized)
+        entry = queries.setdefault(key, {"query_key": key, "query": normalized, "count": 0})
+        entry["count"] += 1
+        entry["last_seen"] = row.created_at
+        day_module = (row.created_at.date(), row.module or "all")
+        volumes[day_module] = volumes.get(day_module, 0) + 1
+
+    insert = _upsert(connection)
+    statement = insert(QueryCount)
+    await connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[QueryCount.query_key],
+            set_={"count": QueryCount.count + statement.excluded.count, "last_seen": statement.excluded.last_seen}
+        ),
+        list(queries.values())
+    )
+    statement = insert(ModuleDailyCount)
+    await connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[ModuleDailyCount.day, ModuleDailyCount.module],
+            set_={"count": ModuleDailyCount.count + statement.excluded.count}
+        ),
+        [{"day": day, "module": module, "count": count} for (day, module), count in volumes.items()]
+    )
+
+
+async def arefresh_rollups(lag: float = None, page_size: int = None) -> int:
+    """
+    Fold the conversations saved since the watermark into the rollups
+
+    Each page is counted and the watermark moved past it in one transaction.
+    The watermark is only moved if it still holds the value read, so when
+    two processes refresh at once the second stops instead of counting the
+    same rows twice. Returns the number of rows folded in.
+    """
+    lag = settings.CONVERSATION_ROLLUP_LAG if lag is None else lag
+    page_size = page_size or settings.CONVERSATION_EXPORT_PAGE_SIZE
+    cutoff = datetime.utcnow() - timedelta(seconds=lag)
+    columns = [Conversation.created_at, Conversation.id, Conversation.query, Conversation.module]
+    folded = 0
+    async with _refresh_lock:
+        with timed("rollup"):
+            await _acreate_watermark()
+            while True:
+                async with get_async_engine().begin() as connection:
+                    watermark = await _aread_watermark(connection)
+                    statement = conversations_page(watermark, page_size, Conversation.created_at < cutoff, columns=columns)
+                    rows = (await connection.execute(statement)).all()
+                    if not rows:
+                        break
+                    moved = await connection.execute(
+                        update(RollupWatermark)
+                        .where(RollupWatermark.name == WATERMARK, _at_watermark(watermark))
+                        .values(created_at=rows[-1].created_at, last_id=rows[-1].id)
+                    )
+                    if moved.rowcount == 0:
+                        break
+                    await _afold_page(connection, rows)
+                folded += len(rows)
+                if len(rows) < page_size:
+                    break
+    return folded
+
+
+async def aconversation_stats(
+    top: int = 20,
+    since: Optional[date] = None,
+    until: Optional[date] = None
+) -> Dict:
+    """
+    Top queries and conversations per module, from the rollups
+
+    Query counts are all-time; module volumes cover the days in [since, until].
+    """
+    volume_conditions = []
+    if since is not None:
+        volume_conditions.append(ModuleDailyCount.day >= since)
+    if until is not None:
+        volume_conditions.append(ModuleDailyCount.day <= until)
+    async with get_async_engine().connect() as connection:
+        watermark = await _aread_watermark(connection)
+        top_queries = (await connection.execute(
+            select(QueryCount.query, QueryCount.count, QueryCount.last_seen)
+            .order_by(QueryCount.count.desc(), QueryCount.last_seen.desc())
+            .limit(top)
+        )).all()
+        modules = (await connection.execute(
+            select(ModuleDailyCount.module, func.sum(ModuleDailyCount.count).label("count"))
+            .where(*volume_conditions)
+            .group_by(ModuleDailyCount.module)
+            .order_by(func.sum(ModuleDailyCount.count).desc())
+        )).all()
+        daily = (await connection.execute(
+            select(ModuleDailyCount.day, ModuleDailyCount.module, ModuleDailyCount.count)
+            .where(*volume_conditions)
+            .order_by(ModuleDailyCount.day, ModuleDailyCount.module)
+        )).all()
+    return {
+        "through": watermark[0].isoformat() if watermark else None,
+        "top_queries": [
+            {"query": row.query, "count": row.count, "last_seen": row.last_seen.isoformat()}
+            for row in top_queries
+        ],
+        "modules": [{"module": row.module, "count": int(row.count)} for row in modules],
+        "daily": [{"day": row.day.isoformat(), "module": row.module, "count": row.count} for row in daily]
+    }
@@ -0,0 +1,207 @@
+"""
+History of multi-turn conversations, fitted into a token budget
+
+A conversation is the turns saved under one session id (the conversation_id
+clients send back). Recent turns are loaded from the conversations table
+once, then kept in an in-process LRU that each new turn is appended to, so a
+follow-up usually needs no database round trip. Turns that no longer fit
+HISTORY_TOKEN_BUDGET are folded into a short extractive summary.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.database import aload_turns
+from app.metrics import record_cache, timed
+from app.utils.tokens import estimate_tokens, truncate_to_tokens
+
+# End of the first sentence of an answer, for summaries
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+@dataclass
+class Turn:
+    """One question and the answer it got"""
+    query: str
+    response: str
+
+
+@dataclass
+class HistoryWindow:
+    """The turns that fit the history budget, oldest first, and a summary of those before them"""
+    turns: List[Turn] = field(default_factory=list)
+    summary: str = ""
+    tokens: int = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.turns or self.summary)
+
+    def contextualize(self, query: str) -> str:
+        """
+        Text to retrieve with for a follow-up
+
+        Follow-ups like "what about its limits?" don't say what they're about,
+        so the previous question is searched along with them.
+        """
+        if not self.turns:
+            return query
+        return f"{self.turns[-1].query}\n{query}"
+
+    def messages(self) -> List[Dict]:
+        """Chat messages replaying the conversation before the current question"""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Earlier in this conversation:\n{self.summary}"})
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn.query})
+            messages.append({"role": "assistant", "content": turn.response})
+        return messages
+
+
+def _summarize_turn(turn: Turn) -> str:
+    first_sentence = _SENTENCE_END.split(turn.response.strip(), maxsplit=1)[0]
+    return f"- Asked: {turn.query.strip()} Answered: {first_sentence}"
+
+
+def fit_history(turns: List[Turn], token_budget: int, summary_tokens: int) -> HistoryWindow:
+    """
+    Keep the newest turns that fit `token_budget`, summarize older ones
+
+    The summary is each older turn's question and the first sentence of its
+    answer, newest first until `summary_tokens` is spent, then put back in
+    conversation order.
+    """
+    kept: List[Turn] = []
+    used = 0
+    index = len(turns)
+    while index > 0:
+        cost = estimate_tokens(turns[index - 1].query) + estimate_tokens(turns[index - 1].response)
+        if used + cost > token_budget:
+            break
+        kept.insert(0, turns[index - 1])
+        used += cost
+        index -= 1
+
+    lines: List[str] = []
+    summary_used = 0
+    for turn in reversed(turns[:index]):
+        line = _summarize_turn(turn)
+        cost = estimate_tokens(line)
+        if summary_used + cost > summary_tokens:
+            if not lines:
+                # A single long turn still gets a truncated mention
+                lines.append(truncate_to_tokens(line, summary_tokens))
+                summary_used += estimate_tokens(lines[0])
+            break
+        lines.insert(0, line)
+        summary_used += cost
+
+    return HistoryWindow(turns=kept, summary="\n".join(lines), tokens=used + summary_used)
+
+
+class ConversationHistory:
+    """
+    LRU of recent turns per session id
+
+    A session is loaded from the database on first use and then kept up to
+    date by record(). Turns written by another worker process since the load
+    aren't seen until the entry expires after `ttl` seconds. A `max_size` of
+    0 disables caching: every lookup reads the database.
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None, max_turns: int = None):
+        self.max_size = settings.HISTORY_CACHE_SIZE if max_size is None else max_size
+        self.ttl = settings.HISTORY_CACHE_TTL if ttl is None else ttl
+        self.max_turns = settings.HISTORY_MAX_TURNS if max_turns is None else max_turns
+        self.hits = 0
+        self.misses = 0
+        # session id -> (expires_at, turns oldest first); ordered for LRU eviction
+        self._entries: "OrderedDict[str, Tuple[float, List[Turn]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, session_id: str) -> Optional[List[Turn]]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(session_id, None)
+                self.misses += 1
+                record_cache("history", False)
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            record_cache("history", True)
+            return list(entry[1])
+
+    def _last_turns(self, turns: List[Turn]) -> List[Turn]:
+        return turns[max(len(turns) - self.max_turns, 0):]
+
+    def _store(self, session_id: str, turns: List[Turn]):
+        # Without history (max_turns 0) nothing would ever read the entry
+        if self.max_size <= 0 or self.max_turns <= 0:
+            return
+        with self._lock:
+            self._entries[session_id] = (time.monotonic() + self.ttl, self._last_turns(turns))
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    async def load(self, session_id: str) -> List[Turn]:
+        """The session's last `max_turns` turns, oldest first"""
+        turns = self._cached(session_id)
+        if turns is not None:
+            return turns
+        with timed("history"):
+            rows = await aload_turns(session_id, self.max_turns)
+        turns = [Turn(query, response) for query, response in rows]
+        self._store(session_id, turns)
+        return turns
+
+    async def window(self, session_id: Optional[str]) -> Optional[HistoryWindow]:
+        """The session's history fitted into the budget, None for a new conversation"""
+        if not session_id or self.max_turns <= 0:
+            return None
+        try:
+            turns = await self.load(session_id)
+        except Exception as e:
+            # Like conversation writes, history is best effort: answer the question on its own
+            print(f"[WARNING] Couldn't load the history of conversation {session_id}: {e}")
+            return None
+        if not turns:
+            return None
+        return fit_history(turns, settings.HISTORY_TOKEN_BUDGET, settings.HISTORY_SUMMARY_TOKENS)
+
+    def record(self, session_id: str, query: str, response: str):
+        """Append a turn to a cached session; uncached sessions are loaded on their next use"""
+        if self.max_turns <= 0:
+            return
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            expires_at, turns = entry
+            self._entries[session_id] = (expires_at, self._last_turns(turns + [Turn(query, response)]))
+
+    def start(self, session_id: str):
+        """Cache a new session as empty, so its turns are recorded without a load"""
+        if self.max_turns <= 0:
+            return
+        self._store(session_id, [])
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+@lru_cache()
+def get_conversation_history() -> ConversationHistory:
+    return ConversationHistory()
@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import random
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.database import asave_conversations, build_conversation_record
+from app.metrics import timed, CONVERSATION_QUEUE_DEPTH, CONVERSATIONS_DROPPED
+
+
+class ConversationWriter:
+    """
+    Write-behind persistence for conversations
+
+    The request path enqueues a record and gets its pre-generated id back
+    immediately; a background task bulk-inserts queued records when a batch
+    fills up or the flush interval passes. The queue is bounded: when it is
+    full, enqueue waits up to `enqueue_timeout` for space (backpressure) and
+    then drops the record rather than failing the chat request.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = None,
+        batch_size: int = None,
+        flush_interval: float = None,
+        enqueue_timeout: float = None
+    ):
+        self.max_queue_size = max_queue_size or settings.CONVERSATION_QUEUE_SIZE
+        self.batch_size = batch_size or settings.CONVERSATION_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.CONVERSATION_FLUSH_INTERVAL
+        self.enqueue_timeout = settings.CONVERSATION_ENQUEUE_TIMEOUT if enqueue_timeout is None else enqueue_timeout
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        """Start the background flush task on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        # Run in a fresh context so the task doesn't inherit the first caller's request state
+        self._task = contextvars.Context().run(loop.create_task, self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the background task"""
+        if self._task is None:
+            return
+        self._stopping = True
+        await self._task
+        self._task = None
+
+    async def enqueue(
+        self,
+        query: str,
+        response: str,
+        context: str = None,
+        module: str = None,
+        chapter: str = None,
+        selected_text: str = None,
+        session_id: str = None,
+        sources: List[Dict] = None
+    ) -> str:
+        """Queue a conversation for persistence and return its session id"""
+        record = build_conversation_record(
+            query, response, context, module, chapter, selected_text, session_id, sources
+        )
+        await self.enqueue_record(record)
+        return record["session_id"]
+
+    async def enqueue_record(self, record: Dict):
+        """Queue a prepared conversation row, see build_conversation_record"""
+        # Started lazily so callers that skip the app's startup hooks still persist
+        self.start()
+        try:
+            with timed("persist"):
+                await asyncio.wait_for(self._queue.put(record), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            CONVERSATIONS_DROPPED.inc()
+            print(f"[WARNING] Conversation queue full, dropped conversation {record['id']}")
+
+    async def _next_batch(self) -> List[Dict]:
+        """Wait for a batch to fill up or the flush interval to pass"""
+        batch = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[Dict]):
+        """Insert a batch, retrying with backoff while the database is unavailable"""
+        attempt = 0
+        while True:
+            try:
+                self.written += await asave_conversations(batch)
+                return
+            except Exception as e:
+                self.failed_flushes += 1
+                attempt += 1
+                # While draining on shutdown, give up after a few attempts
+                if self._stopping and attempt >= 3:
+                    self.dropped += len(batch)
+                    CONVERSATIONS_DROPPED.inc(len(batch))
+                    print(f"[ERROR] Dropped {len(batch)} conversations on shutdown: {e}")
+                    return
+                delay = random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+                print(f"[WARNING] Conversation flush failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _run(self):
+        while not (self._stopping and self._queue.empty()):
+            batch = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+
+    def stats(self) -> dict:
+        """Queue depth and write counters for monitoring"""
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes
+        }
+
+
+@lru_cache()
+def get_conversation_writer() -> ConversationWriter:
+    """Shared writer used by the request path, built on first use"""
+    writer = ConversationWriter()
+    CONVERSATION_QUEUE_DEPTH.set_function(lambda: writer.stats()["queued"])
+    return writer
@@ -1,18 +1,55 @@
-from sqlalchemy import create_engine, Column, String, Text, DateTime
+from sqlalchemy import (
+    create_engine, insert, inspect, select, text, tuple_, Column, String, Text, Date, DateTime, Index, Integer, JSON
+)
+from sqlalchemy.sql import Select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.metrics import timed
 from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 import uuid
 
-# Create engine - explicitly use psycopg driver
-# Convert postgresql:// to postgresql+psycopg:// if needed
-database_url = settings.DATABASE_URL
-if database_url.startswith("postgresql://"):
-    database_url = database_url.replace("postgresql://", "postgresql+psycopg://", 1)
 
-engine = create_engine(database_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _database_url() -> str:
+    # Explicitly use the psycopg driver:
+    # convert postgresql:// to postgresql+psycopg:// if needed
+    database_url = settings.DATABASE_URL
+    if database_url.startswith("postgresql://"):
+        database_url = database_url.replace("postgresql://", "postgresql+psycopg://", 1)
+    return database_url
+
+
+# Engines are created on first use rather than at import, so importing the
+# app doesn't need a configured database
+
+@lru_cache()
+def get_engine() -> Engine:
+    return create_engine(_database_url())
+
+
+@lru_cache()
+def get_sessionmaker() -> sessionmaker:
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+@lru_cache()
+def get_async_engine() -> AsyncEngine:
+    """Async engine for the request path - psycopg 3 supports asyncio natively, SQLite needs aiosqlite"""
+    async_database_url = _database_url()
+    if async_database_url.startswith("sqlite://"):
+        async_database_url = async_database_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return create_async_engine(async_database_url)
+
+
+@lru_cache()
+def get_async_sessionmaker() -> async_sessionmaker:
+    return async_sessionmaker(bind=get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
 Base = declarative_base()
 
 
@@ -23,50 +60,189 @@ class Conversation(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     query = Column(Text, nullable=False)
     response = Column(Text, nullable=False)
+    # Joined context text; only rows saved before context_refs have it
     context = Column(Text)
+    # Chunks the answer was grounded on: [{"ids": [point ids], "score": score}] per source
+    context_refs = Column(JSON)
     module = Column(String)
     chapter = Column(String)
     selected_text = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Turns of one multi-turn conversation share a session id; the first turn's id starts it
+    session_id = Column(String)
+
+    __table_args__ = (
+        # History lookups: a session's latest turns
+        Index("ix_conversations_session_created", "session_id", "created_at"),
+        # Time ranges and keyset pagination in (created_at, id) order, e.g. archival
+        Index("ix_conversations_created_id", "created_at", "id"),
+        Index("ix_conversations_module", "module"),
+        Index("ix_conversations_chapter", "chapter"),
+    )
+
+
+# Rollups of the conversations table for the admin analytics endpoint. They're
+# updated incrementally from the rows saved since the watermark, and outlive
+# the rows themselves once those are archived.
+
+class QueryCount(Base):
+    """How often each question was asked, by its normalized text"""
+    __tablename__ = "conversation_query_counts"
+
+    # Hash of the normalized query, so long questions make short keys
+    query_key = Column(String(64), primary_key=True)
+    query = Column(Text, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    last_seen = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_conversation_query_counts_count", "count"),
+    )
+
+
+class ModuleDailyCount(Base):
+    """Conversations per module per day"""
+    __tablename__ = "conversation_module_daily"
+
+    day = Column(Date, primary_key=True)
+    # "all" for questions asked outside a module
+    module = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class RollupWatermark(Base):
+    """Key of the last conversation row folded into the rollups"""
+    __tablename__ = "conversation_rollup_watermarks"
+
+    name = Column(String, primary_key=True)
+    created_at = Column(DateTime)
+    last_id = Column(String)
+
+
+def context_refs(sources: Optional[List[Dict]]) -> Optional[List[Dict]]:
+    """What a conversation row keeps of its context: the point ids and score of each source"""
+    if sources is None:
+        return None
+    return [{"ids": source.get("chunk_ids", []), "score": source.get("score")} for source in sources]
+
+
+def build_conversation_record(
+    query: str,
+    response: str,
+    context: str = None,
+    module: str = None,
+    chapter: str = None,
+    selected_text: str = None,
+    session_id: str = None,
+    sources: List[Dict] = None
+) -> Dict:
+    """
+    Conversation row for bulk inserts, with its id assigned up front
+
+    A new session starts at the row's id. Pass the answer's sources rather
+    than its context text: only their chunk ids and scores are stored.
+    """
+    record_id = str(uuid.uuid4())
+    return {
+        "id": record_id,
+        "query": query,
+        "response": response,
+        "context": context,
+        "context_refs": context_refs(sources),
+        "module": module,
+        "chapter": chapter,
+        "selected_text": selected_text,
+        "created_at": datetime.utcnow(),
+        "session_id": session_id or record_id
+    }
+
+
+def conversations_page(
+    after: Optional[Tuple[datetime, str]],
+    limit: int,
+    *conditions,
+    columns: Optional[List] = None
+) -> Select:
+    """
+    One page of conversation rows in (created_at, id) order, starting after the key `after`
+
+    Keyset pagination: every page is a range scan of the (created_at, id)
+    index from where the previous page ended, so late pages cost as much as
+    the first, unlike OFFSET. Selects every column unless `columns` is given.
+    """
+    statement = select(*(columns or [Conversation.__table__])).where(*conditions)
+    if after is not None:
+        statement = statement.where(tuple_(Conversation.created_at, Conversation.id) > tuple_(*after))
+    return statement.order_by(Conversation.created_at, Conversation.id).limit(limit)
 
 
 def init_db():
     """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
     print("[SUCCESS] Database tables created successfully")
+    migrate_db()
+
+
+def migrate_db():
+    """
+    Bring a conversations table created by an older version up to date
+
+    Adds missing columns (existing turns each start their own session) and
+    indexes. create_all only creates missing tables, so columns and indexes
+    added since have to be added here.
+    """
+    engine = get_engine()
+    table = Conversation.__table__
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        with engine.begin() as connection:
+            column_type = column.type.compile(dialect=engine.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            if column.name == "session_id":
+                connection.execute(text(f"UPDATE {table.name} SET session_id = id WHERE session_id IS NULL"))
+        print(f"[SUCCESS] Added {table.name}.{column.name}")
+
+    for index in Conversation.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+async def aping_database():
+    """Round trip to the database, raising if it can't be reached"""
+    async with get_async_engine().connect() as connection:
+        await connection.execute(text("SELECT 1"))
 
 
 def get_db():
     """Get database session"""
-    db = SessionLocal()
+    db = get_sessionmaker()()
     try:
         yield db
     finally:
         db.close()
 
 
-def save_conversation(
-    query: str,
-    response: str,
-    context: str = None,
-    module: str = None,
-    chapter: str = None,
-    selected_text: str = None
-) -> str:
-    """Save conversation to database"""
-    db = SessionLocal()
-    try:
-        conversation = Conversation(
-            query=query,
-            response=response,
-            context=context,
-            module=module,
-            chapter=chapter,
-            selected_text=selected_text
-        )
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
-        return conversation.id
-    finally:
-        db.close()
+async def aload_turns(session_id: str, limit: int) -> List[Tuple[str, str]]:
+    """(query, response) of a session's last `limit` turns, oldest first"""
+    statement = (
+        select(Conversation.query, Conversation.response)
+        .where(Conversation.session_id == session_id)
+        .order_by(Conversation.created_at.desc())
+        .limit(limit)
+    )
+    async with get_async_sessionmaker()() as db:
+        rows = (await db.execute(statement)).all()
+    return [(row.query, row.response) for row in reversed(rows)]
+
+
+async def asave_conversations(records: List[Dict]) -> int:
+    """Bulk insert conversation rows (dicts of Conversation columns) in one transaction"""
+    if not records:
+        return 0
+
+    async with get_async_sessionmaker()() as db:
+        with timed("db_write"):
+            await db.execute(insert(Conversation), records)
+            await db.commit()
+    return len(records)
@@ -0,0 +1,98 @@
+import asyncio
+import contextvars
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into multi-input calls
+
+    The first request to arrive opens a batch. The batch is sent when it
+    reaches `max_batch_size` texts or `max_wait` seconds after it opened,
+    whichever comes first, and each caller gets back its own vector. Identical
+    texts in one batch are embedded once. If the upstream call fails, every
+    caller in the batch sees the exception.
+    """
+
+    def __init__(
+        self,
+        embed_many: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_batch_size: int = 64,
+        max_wait: float = 0.005
+    ):
+        self.embed_many = embed_many
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.texts = 0
+        # text -> futures waiting for its vector
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch_size > 1 and self.max_wait > 0
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed one text as part of the next batch"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A new event loop (e.g. tests or scripts calling asyncio.run twice)
+            self._loop = loop
+            self._pending = {}
+            self._timer = None
+
+        future = loop.create_future()
+        self._pending.setdefault(text, []).append(future)
+        self.texts += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            # Empty context so the batch isn't attributed to whichever request opened it
+            self._timer = loop.call_later(self.max_wait, self._flush, context=contextvars.Context())
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        self.batches += 1
+        task = contextvars.Context().run(self._loop.create_task, self._send(batch))
+        # Keep a reference so the task isn't garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: Dict[str, List[asyncio.Future]]):
+        texts = list(batch)
+        try:
+            embeddings = await self.embed_many(texts)
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for text, embedding in zip(texts, embeddings):
+            for future in batch[text]:
+                # Callers that were cancelled have already gone away
+                if not future.done():
+                    future.set_result(embedding)
+
+    def stats(self) -> dict:
+        """Batching counters for monitoring"""
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.metrics import record_cache
+
+
+class EmbeddingCache:
+    """Bounded LRU cache of query embeddings with TTL expiry and optional file persistence"""
+
+    def __init__(self, model: str, max_size: int = 10000, ttl: float = 86400, path: Optional[str] = None):
+        self.model = model
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires_at, embedding); wall-clock expiry so entries survive restarts
+        self._entries: "OrderedDict[str, tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize text so trivially different queries share a cache entry"""
+        return " ".join(text.split()).casefold()
+
+    def _key(self, text: str) -> str:
+        raw = f"{self.model}\x00{self.normalize(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """Return the cached embedding for text, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        key = self._key(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache("embedding", True)
+                return entry[1]
+
+            # Expired entries are dropped lazily on lookup
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            record_cache("embedding", False)
+            return None
+
+    def set(self, text: str, embedding: List[float]):
+        """Store an embedding, evicting the least recently used entries past max_size"""
+        if not self.enabled:
+            return
+
+        key = self._key(text)
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached embeddings"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def load(self) -> int:
+        """Load persisted entries, skipping expired ones and those from another model"""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Could not load embedding cache from {self.path}: {e}")
+            return 0
+
+        if data.get("model") != self.model:
+            return 0
+
+        now = time.time()
+        with self._lock:
+            for key, expires_at, embedding in data.get("entries", []):
+                if expires_at > now:
+                    self._entries[key] = (expires_at, embedding)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return len(self._entries)
+
+    def save(self):
+        """Persist entries atomically so a crash mid-write never corrupts the file"""
+        if not self.path or not self.enabled:
+            return
+
+        with self._lock:
+            entries = [[key, expires_at, embedding] for key, (expires_at, embedding) in self._entries.items()]
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "entries": entries}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,160 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from app.vector_store import ScoredChunk
+
+# Identifiers such as rclpy, ros2, cmd_vel or URDF stay whole tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word/identifier tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    BM25 inverted index over chunk texts, keyed by the chunks' point ids
+
+    Built at ingest time alongside the vector collection and persisted as JSON;
+    the API reloads it when the file changes.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        # point id -> {"tf": {term: count}, "length": tokens, "payload": chunk payload}
+        self.docs: Dict[str, Dict] = {}
+        self._postings: Optional[Dict[str, Dict[str, int]]] = None
+        self._avg_length = 0.0
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def __contains__(self, point_id: str) -> bool:
+        return point_id in self.docs
+
+    def add(self, point_id: str, text: str, payload: Dict):
+        """Index a chunk, replacing any previous version with the same id"""
+        tokens = tokenize(text)
+        self.docs[point_id] = {"tf": dict(Counter(tokens)), "length": len(tokens), "payload": payload}
+        self._postings = None
+
+    def remove(self, point_ids: Sequence[str]) -> int:
+        """Drop chunks from the index"""
+        removed = sum(1 for point_id in point_ids if self.docs.pop(point_id, None) is not None)
+        if removed:
+            self._postings = None
+        return removed
+
+    def _build_postings(self):
+        postings: Dict[str, Dict[str, int]] = {}
+        total_length = 0
+        for point_id, doc in self.docs.items():
+            total_length += doc["length"]
+            for term, count in doc["tf"].items():
+                postings.setdefault(term, {})[point_id] = count
+        self._avg_length = total_length / len(self.docs) if self.docs else 0.0
+        self._postings = postings
+
+    def load(self) -> bool:
+        """Load the persisted index, returns False if there is none"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self._lock:
+            self.docs = data.get("docs", {})
+            self._postings = None
+            self._loaded_mtime = os.stat(self.path).st_mtime_ns
+        return True
+
+    def maybe_reload(self):
+        """Pick up an index rewritten by the ingest script"""
+        if not self.path:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            self.load()
+
+    def save(self):
+        """Persist atomically"""
+        if not self.path:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": self.docs}, f)
+        os.replace(tmp_path, self.path)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 5,
+        module_filter: Optional[str] = None,
+        chapter_filter: Optional[str] = None
+    ) -> List[ScoredChunk]:
+        """BM25-ranked chunks containing any query term, with optional filters"""
+        with self._lock:
+            if self._postings is None:
+                self._build_postings()
+            postings, avg_length, docs = self._postings, self._avg_length, self.docs
+
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            matches = postings.get(term)
+            if not matches:
+                continue
+            idf = math.log(1 + (len(docs) - len(matches) + 0.5) / (len(matches) + 0.5))
+            for point_id, tf in matches.items():
+                length_norm = 1 - self.b + self.b * docs[point_id]["length"] / (avg_length or 1.0)
+                scores[point_id] = scores.get(point_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        results = []
+        for point_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            payload = docs[point_id]["payload"]
+            if module_filter and payload.get("module") != module_filter:
+                continue
+            if chapter_filter and payload.get("chapter") != chapter_filter:
+                continue
+            results.append(ScoredChunk(id=point_id, score=score, payload=payload))
+            if len(results) >= limit:
+                break
+        return results
+
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[Sequence],
+    weights: Sequence[float],
+    k: int = 60
+) -> List[ScoredChunk]:
+    """
+    Combine ranked result lists with weighted reciprocal-rank fusion
+
+    Each hit scores sum(weight / (k + rank)) over the lists it appears in; the
+    payload (and vector, if any) of its first occurrence is kept.
+    """
+    fused: Dict[str, ScoredChunk] = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, hit in enumerate(results, start=1):
+            point_id = str(hit.id)
+            if point_id not in fused:
+                fused[point_id] = ScoredChunk(id=point_id, score=0.0, payload=hit.payload, vector=hit.vector)
+            fused[point_id].score += weight / (k + rank)
+
+    return sorted(fused.values(), key=lambda hit: hit.score, reverse=True)
@@ -0,0 +1,382 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.metrics import timed
+from app.collection_schema import embedding_dimension
+from app.vector_store import PAYLOAD_VERSION, ScoredChunk, build_payload, build_point_id
+
+
+class LocalVectorStore:
+    """
+    In-process vector store backed by NumPy, with the same interface as VectorStore
+
+    Embeddings live in a contiguous float32 matrix memory-mapped from
+    `<LOCAL_VECTOR_STORE_PATH>/<collection>/vectors.<generation>.f32`, with norms
+    precomputed and row indexes per module/chapter for filtered search.
+
+    Each write creates a new generation of the vector and norm files, then
+    atomically replaces meta.json, which names them. Readers pick up the new
+    generation on their next search, and only switch once the files match
+    the metadata, so a search never pairs new vectors with old ids.
+    """
+
+    def __init__(self, path: Optional[str] = None, collection_name: Optional[str] = None):
+        self.collection_name = collection_name or settings.QDRANT_COLLECTION_NAME
+        self.path = os.path.join(path or settings.LOCAL_VECTOR_STORE_PATH, self.collection_name)
+        self._lock = threading.Lock()
+        self._loaded_mtime = None
+        self._generation = 0
+        self._reset(0)
+        self._maybe_reload()
+
+    @property
+    def payload_format(self) -> str:
+        """Payloads live in-process and hits share them whole, so there's no field selection"""
+        return str(PAYLOAD_VERSION)
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def _data_files(self) -> List[str]:
+        """Vector and norm files of every generation on disk"""
+        if not os.path.isdir(self.path):
+            return []
+        return [
+            name for name in os.listdir(self.path)
+            if name.startswith(("vectors.", "norms.")) and name.endswith((".f32", ".npy"))
+        ]
+
+    def _reset(self, dim: int):
+        self.dim = dim
+        self.ids: List[str] = []
+        self.payloads: List[Dict] = []
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """Row indexes used for id lookups and module/chapter filters"""
+        self._rows_by_id = {point_id: row for row, point_id in enumerate(self.ids)}
+        by_module: Dict[str, List[int]] = {}
+        by_chapter: Dict[str, List[int]] = {}
+        for row, payload in enumerate(self.payloads):
+            by_module.setdefault(payload.get("module", ""), []).append(row)
+            by_chapter.setdefault(payload.get("chapter", ""), []).append(row)
+        self._module_rows = {key: np.asarray(rows, dtype=np.int64) for key, rows in by_module.items()}
+        self._chapter_rows = {key: np.asarray(rows, dtype=np.int64) for key, rows in by_chapter.items()}
+
+    def _load(self):
+        """
+        Map the collection files into memory if they exist
+
+        Everything is read and checked before any of it is swapped in, so a
+        failed load leaves the current collection in place.
+        """
+        if not os.path.exists(self._meta_path):
+            return
+
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+            mtime = os.fstat(f.fileno()).st_mtime_ns
+
+        dim, ids = meta["dim"], meta["ids"]
+        # Collections written before generations used fixed file names
+        vectors_path = os.path.join(self.path, meta.get("vectors", "vectors.f32"))
+        norms_path = os.path.join(self.path, meta.get("norms", "norms.npy"))
+        vectors = np.zeros((0, dim), dtype=np.float32)
+        norms = np.zeros(0, dtype=np.float32)
+        if ids:
+            size = os.path.getsize(vectors_path)
+            if size != len(ids) * dim * 4:
+                raise ValueError(f"{vectors_path} has {size} bytes, expected {len(ids)} x {dim} float32")
+            vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(len(ids), dim))
+            norms = np.load(norms_path)
+            if norms.shape != (len(ids),):
+                raise ValueError(f"{norms_path} has shape {norms.shape}, expected ({len(ids)},)")
+
+        self.dim = dim
+        self.ids = ids
+        self.payloads = meta["payloads"]
+        self.vectors = vectors
+        self.norms = norms
+        self._generation = meta.get("generation", 0)
+        self._loaded_mtime = mtime
+        self._build_indexes()
+
+    def _maybe_reload(self):
+        """Pick up a collection rewritten by another process (e.g. the ingest script)"""
+        try:
+            mtime = os.stat(self._meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            with self._lock:
+                for _ in range(3):
+                    try:
+                        self._load()
+                        return
+                    except (OSError, ValueError) as e:
+                        # A newer write replaced the files in between; its metadata names the new ones
+                        error = e
+                # Keep serving the loaded collection, retry on the next search
+                print(f"[WARNING] Couldn't reload collection '{self.collection_name}': {error}")
+
+    def _write(self, ids: List[str], payloads: List[Dict], vectors: np.ndarray):
+        """
+        Persist the collection as a new generation
+
+        The vector and norm files get new names, and replacing meta.json
+        switches to them atomically. Older generations are deleted after
+        that; readers that still map them keep their copy until they reload.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        generation = self._generation + 1
+        vectors_name, norms_name = f"vectors.{generation}.f32", f"norms.{generation}.npy"
+
+        with open(os.path.join(self.path, vectors_name), "wb") as f:
+            vectors.tofile(f)
+            os.fsync(f.fileno())
+        with open(os.path.join(self.path, norms_name), "wb") as f:
+            np.save(f, np.linalg.norm(vectors, axis=1).astype(np.float32))
+            os.fsync(f.fileno())
+        with open(f"{self._meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self.dim,
+                "generation": generation,
+                "vectors": vectors_name,
+                "norms": norms_name,
+                "ids": ids,
+                "payloads": payloads
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{self._meta_path}.tmp", self._meta_path)
+
+        for name in self._data_files():
+            if name not in (vectors_name, norms_name):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    # Still mapped where that isn't allowed (Windows); removed by a later write
+                    pass
+        self._load()
+
+    def create_collection(self, vector_size: Optional[int] = None) -> bool:
+        """Create an empty collection, returns False if it already exists"""
+        if os.path.exists(self._meta_path):
+            print(f"[WARNING] Collection '{self.collection_name}' already exists at {self.path}")
+            return False
+
+        vector_size = vector_size or embedding_dimension()
+        if not vector_size:
+            raise ValueError(
+                f"Unknown dimension for embedding model {settings.EMBEDDING_MODEL}, set EMBEDDING_DIMENSION"
+            )
+
+        with self._lock:
+            self._reset(vector_size)
+            self._write([], [], self.vectors)
+        print(f"[SUCCESS] Collection '{self.collection_name}' created at {self.path}")
+        return True
+
+    def vector_size(self) -> Optional[int]:
+        """Vector size of the existing collection"""
+        self._maybe_reload()
+        return self.dim or None
+
+    def apply_schema(self) -> Dict:
+        """
+        Same report as VectorStore.apply_schema
+
+        Search here is exact and module/chapter row indexes are built on load,
+        so only the vector size can be out of date.
+        """
+        self._maybe_reload()
+        expected_size = embedding_dimension()
+        return {
+            "indexed_fields": [],
+            "vector_size": self.dim,
+            "expected_vector_size": expected_size,
+            "dimension_mismatch": bool(expected_size and self.dim and expected_size != self.dim)
+        }
+
+    def recreate_collection(self, vector_size: Optional[int] = None) -> bool:
+        """Drop and recreate the collection; its points must be re-ingested"""
+        with self._lock:
+            if os.path.exists(self._meta_path):
+                os.remove(self._meta_path)
+            for name in self._data_files():
+                os.remove(os.path.join(self.path, name))
+        return self.create_collection(vector_size)
+
+    def upload_chunks(
+        self,
+        chunks: List[str],
+        embeddings: List[List[float]],
+        metadata: List[Dict],
+        batch_size: int = 256
+    ) -> int:
+        """Bulk-store chunks; the local store writes everything in one go"""
+        return self.upsert_chunks(chunks, embeddings, metadata)
+
+    def update_payloads(self, chunks: List[str], metadata: List[Dict]) -> int:
+        """Rewrite the payloads of existing points without touching their vectors"""
+        with self._lock:
+            payloads = list(self.payloads)
+            updated = 0
+            for chunk, meta in zip(chunks, metadata):
+                row = self._rows_by_id.get(build_point_id(meta))
+                if row is not None:
+                    payloads[row] = build_payload(chunk, meta)
+                    updated += 1
+            if updated:
+                self._write(list(self.ids), payloads, np.asarray(self.vectors, dtype=np.float32))
+        return updated
+
+    def upsert_chunks(self, chunks: List[str], embeddings: List[List[float]], metadata: List[Dict]):
+        """Store text chunks with embeddings, replacing points with the same id"""
+        with self._lock:
+            ids = list(self.ids)
+            payloads = list(self.payloads)
+            vectors = np.array(self.vectors, dtype=np.float32)
+            rows = dict(self._rows_by_id)
+
+            new_vectors = []
+            for chunk, embedding, meta in zip(chunks, embeddings, metadata):
+                point_id = build_point_id(meta)
+                payload = build_payload(chunk, meta)
+                if point_id in rows:
+                    vectors[rows[point_id]] = embedding
+                    payloads[rows[point_id]] = payload
+                else:
+                    rows[point_id] = len(ids)
+                    ids.append(point_id)
+                    payloads.append(payload)
+                    new_vectors.append(embedding)
+
+            if new_vectors:
+                vectors = np.vstack([vectors, np.asarray(new_vectors, dtype=np.float32)])
+            self._write(ids, payloads, vectors)
+        return len(chunks)
+
+    def delete_points(self, ids: List[str]) -> int:
+        """Delete points by id"""
+        with self._lock:
+            doomed = {self._rows_by_id[point_id] for point_id in ids if point_id in self._rows_by_id}
+            if not doomed:
+                return 0
+
+            keep = np.asarray([row for row in range(len(self.ids)) if row not in doomed], dtype=np.int64)
+            self._write(
+                [self.ids[row] for row in keep],
+                [self.payloads[row] for row in keep],
+                np.asarray(self.vectors, dtype=np.float32)[keep].reshape(len(keep), self.dim)
+            )
+        return len(doomed)
+
+    def _candidate_rows(self, module_filter: Optional[str], chapter_filter: Optional[str]) -> Optional[np.ndarray]:
+        """Rows matching the filters, or None when unfiltered"""
+        rows = None
+        if module_filter:
+            rows = self._module_rows.get(module_filter, np.zeros(0, dtype=np.int64))
+        if chapter_filter:
+            chapter_rows = self._chapter_rows.get(chapter_filter, np.zeros(0, dtype=np.int64))
+            rows = chapter_rows if rows is None else np.intersect1d(rows, chapter_rows, assume_unique=True)
+        return rows
+
+    def search(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        module_filter: Optional[str] = None,
+        chapter_filter: Optional[str] = None,
+        with_vectors: bool = False
+    ) -> List[ScoredChunk]:
+        """Exact cosine top-k with optional filters"""
+        with timed("search"):
+            return self._search(query_vector, limit, module_filter, chapter_filter, with_vectors)
+
+    def _search(
+        self,
+        query_vector: List[float],
+        limit: int,
+        module_filter: Optional[str],
+        chapter_filter: Optional[str],
+        with_vectors: bool = False
+    ) -> List[ScoredChunk]:
+        self._maybe_reload()
+
+        rows = self._candidate_rows(module_filter, chapter_filter)
+        vectors, norms = self.vectors, self.norms
+        if rows is not None:
+            vectors, norms = vectors[rows], norms[rows]
+        if len(norms) == 0 or limit <= 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query_norm = np.linalg.norm(query) or 1.0
+        scores = (vectors @ query) / (np.maximum(norms, 1e-12) * query_norm)
+
+        # Partial selection of the top k, then sort just those
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            row = int(rows[i]) if rows is not None else int(i)
+            results.append(ScoredChunk(
+                id=self.ids[row],
+                score=float(scores[i]),
+                payload=self.payloads[row],
+                vector=self.vectors[row] if with_vectors else None
+            ))
+        return results
+
+    async def asearch(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        module_filter: Optional[str] = None,
+        chapter_filter: Optional[str] = None,
+        with_vectors: bool = False
+    ) -> List[ScoredChunk]:
+        """In-process search is a few milliseconds of NumPy, so it runs inline"""
+        return self.search(query_vector, limit, module_filter, chapter_filter, with_vectors)
+
+    async def asearch_batch(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        filters: Optional[Sequence[Tuple[Optional[str], Optional[str]]]] = None,
+        with_vectors: bool = False
+    ) -> List[List[ScoredChunk]]:
+        """Same interface as VectorStore.asearch_batch; searches run back to back in-process"""
+        filters = filters or [(None, None)] * len(query_vectors)
+        with timed("search"):
+            return [
+                self._search(query_vector, limit, module_filter, chapter_filter, with_vectors)
+                for query_vector, (module_filter, chapter_filter) in zip(query_vectors, filters)
+            ]
+
+    async def acollection_exists(self) -> bool:
+        """Whether the collection files exist"""
+        self._maybe_reload()
+        return os.path.exists(self._meta_path)
+
+    def collection_info(self):
+        """Get collection information"""
+        self._maybe_reload()
+        return {
+            "name": self.collection_name,
+            "vectors_count": len(self.ids),
+            "points_count": len(self.ids),
+            "path": self.path
+        }
@@ -0,0 +1,172 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from starlette.datastructures import MutableHeaders
+
+from app.config import settings
+
+# Latency buckets tuned for upstream calls: sub-millisecond cache/local work up to slow completions
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_LATENCY = Histogram(
+    "rag_stage_duration_seconds",
+    "Latency of each RAG pipeline stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+CACHE_EVENTS = Counter(
+    "rag_cache_events_total",
+    "Cache lookups by cache, result (hit/miss) and module",
+    ["cache", "result", "module"]
+)
+STAGE_ERRORS = Counter(
+    "rag_stage_errors_total",
+    "Failed pipeline stages by module",
+    ["stage", "module"]
+)
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens",
+    "Estimated tokens of packed prompt context",
+    buckets=(100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+)
+CONTEXT_TOKENS_SAVED = Counter(
+    "rag_context_tokens_saved_total",
+    "Estimated prompt tokens saved by context packing versus joining the top-k chunks"
+)
+CONVERSATION_QUEUE_DEPTH = Gauge(
+    "rag_conversation_queue_depth",
+    "Conversations waiting for the write-behind writer"
+)
+CONVERSATIONS_DROPPED = Counter(
+    "rag_conversations_dropped_total",
+    "Conversations dropped because the write queue was full or the database stayed down"
+)
+UPSTREAM_RETRIES = Counter(
+    "rag_upstream_retries_total",
+    "Retried upstream calls",
+    ["upstream"]
+)
+UPSTREAM_HEDGES = Counter(
+    "rag_upstream_hedged_requests_total",
+    "Hedged (duplicate) upstream requests sent because the first was slow",
+    ["upstream"]
+)
+UPSTREAM_REJECTED = Counter(
+    "rag_upstream_rejected_total",
+    "Upstream calls failed fast by an open circuit breaker",
+    ["upstream"]
+)
+UPSTREAM_BREAKER_STATE = Gauge(
+    "rag_upstream_breaker_state",
+    "Circuit breaker state: 0 closed, 1 half-open, 2 open",
+    ["upstream"]
+)
+ADMISSION_ACTIVE = Gauge(
+    "rag_admission_active",
+    "Slots in use per admission limiter",
+    ["limiter"]
+)
+ADMISSION_QUEUED = Gauge(
+    "rag_admission_queued",
+    "Requests waiting for a slot per admission limiter",
+    ["limiter"]
+)
+ADMISSION_REJECTED = Counter(
+    "rag_admission_rejected_total",
+    "Requests shed by admission control",
+    ["limiter", "reason"]
+)
+STARTUP_SECONDS = Gauge(
+    "rag_startup_seconds",
+    "Time spent in app startup, building clients and warming up"
+)
+DEPENDENCY_READY = Gauge(
+    "rag_dependency_ready",
+    "Result of the last readiness check: 1 reachable, 0 not",
+    ["dependency"]
+)
+
+# Per-request state, set up by ServerTimingMiddleware and the chat endpoints
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+_request_module: ContextVar[str] = ContextVar("request_module", default="all")
+
+
+def set_request_module(module: Optional[str]):
+    """
+    Label this request's cache and error metrics with its module filter
+
+    The filter comes from the client, so only METRICS_MODULES get their own
+    label; any other value is counted as "other" rather than creating a new
+    time series per string.
+    """
+    if not module:
+        label = "all"
+    elif module in settings.metrics_modules_list:
+        label = module
+    else:
+        label = "other"
+    _request_module.set(label)
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup"""
+    CACHE_EVENTS.labels(cache, "hit" if hit else "miss", _request_module.get()).inc()
+
+
+def record_error(stage: str):
+    """Count a failed stage"""
+    STAGE_ERRORS.labels(stage, _request_module.get()).inc()
+
+
+@contextmanager
+def timed(stage: str):
+    """Observe a stage's latency in the histogram and the current request's Server-Timing"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record_error(stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_LATENCY.labels(stage).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+class ServerTimingMiddleware:
+    """
+    Adds a Server-Timing header with the per-stage breakdown of each request
+
+    Pure ASGI so it costs one dict per request. Streaming responses send their
+    headers before generation starts, so they only report the stages that ran
+    before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+                entries.append(f"total;dur={(time.perf_counter() - started) * 1000:.1f}")
+                MutableHeaders(scope=message).append("Server-Timing", ", ".join(entries))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
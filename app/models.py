@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 
@@ -19,8 +19,41 @@ class ChatResponse(BaseModel):
     sources: Optional[List[dict]] = None
 
 
+class BatchChatRequest(BaseModel):
+    """Request model for batch chat endpoint"""
+    requests: List[ChatRequest]
+
+
+class BatchChatItem(BaseModel):
+    """Result of one question in a batch; either response or error is set"""
+    index: int
+    response: Optional[str] = None
+    conversation_id: Optional[str] = None
+    sources: Optional[List[dict]] = None
+    error: Optional[str] = None
+
+
+class BatchChatResponse(BaseModel):
+    """Response model for batch chat endpoint"""
+    results: List[BatchChatItem]
+
+
 class HealthResponse(BaseModel):
     """Health check response"""
     status: str
     environment: str
     timestamp: datetime
+
+
+class DependencyStatus(BaseModel):
+    """Result of one readiness check"""
+    ok: bool
+    latency_ms: float
+    error: Optional[str] = None
+    age_s: float
+
+
+class ReadinessResponse(BaseModel):
+    """Readiness check response"""
+    status: str
+    checks: Dict[str, DependencyStatus]
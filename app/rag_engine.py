@@ -1,141 +1,563 @@
-from openai import OpenAI
-from app.vector_store import VectorStore
+import asyncio
+from functools import lru_cache
+from contextlib import aclosing
+from app.vector_store import get_vector_store
+from app.embedding_cache import EmbeddingCache
+from app.embedding_batcher import EmbeddingBatcher
+from app.semantic_cache import SemanticCache
+from app.lexical_index import BM25Index, reciprocal_rank_fusion
+from app.context_packer import pack_context
+from app.conversation_history import HistoryWindow
+from app.reranker import get_reranker
+from app.metrics import timed, CONTEXT_TOKENS, CONTEXT_TOKENS_SAVED
+from app.upstream import (
+    completion_upstream, create_async_openai_client, create_openai_client, embedding_upstream
+)
 from app.config import settings
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, AsyncIterator, Sequence
+
+
+SYSTEM_MESSAGE = """You are an expert assistant for the Physical AI & Humanoid Robotics textbook.
+Your role is to help students understand complex robotics concepts.
+
+Guidelines:
+- Answer questions based on the provided context from the book
+- Be clear, concise, and educational
+- If the answer isn't in the context, say so politely
+- Use examples when helpful
+- Reference specific modules or chapters when relevant"""
 
 
 class RAGEngine:
     """Retrieval-Augmented Generation engine using OpenAI SDK with Gemini API"""
-    
+
     def __init__(self):
-        # Configure OpenAI client to use Gemini's endpoint
-        self.client = OpenAI(
-            api_key=settings.GEMINI_API_KEY,
-            base_url=settings.GEMINI_BASE_URL
+        # OpenAI clients for Gemini's endpoint; timeouts and retries come from app.upstream
+        self.client = create_openai_client()
+        # Async client for the request path so upstream calls don't block the event loop
+        self.async_client = create_async_openai_client()
+        self.vector_store = get_vector_store()
+        self.embedding_cache = EmbeddingCache(
+            model=settings.EMBEDDING_MODEL,
+            max_size=settings.EMBEDDING_CACHE_SIZE,
+            ttl=settings.EMBEDDING_CACHE_TTL,
+            path=settings.EMBEDDING_CACHE_PATH
+        )
+        self.embedding_cache.load()
+        # Concurrent query embeddings share multi-input upstream calls
+        self.embedding_batcher = EmbeddingBatcher(
+            self._aembed_texts,
+            max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+            max_wait=settings.EMBEDDING_BATCH_MAX_WAIT_MS / 1000
         )
-        self.vector_store = VectorStore()
+        self.lexical_index = BM25Index(settings.lexical_index_path)
+        if settings.HYBRID_SEARCH_ENABLED and not self.lexical_index.load():
+            print(f"[WARNING] No lexical index at {settings.lexical_index_path}, using vector search only")
+        self.answer_cache = SemanticCache(
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+            max_size=settings.SEMANTIC_CACHE_SIZE,
+            ttl=settings.SEMANTIC_CACHE_TTL
+        )
+        # Optional second stage that rescores over-fetched dense hits
+        self.reranker = get_reranker()
+
 
-    
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using OpenAI SDK (Gemini endpoint)"""
-        response = self.client.embeddings.create(
+        cached = self.embedding_cache.get(text)
+        if cached is not None:
+            return cached
+
+        with timed("embedding"):
+            response = embedding_upstream.call_sync(lambda: self.client.embeddings.create(
+                model=settings.EMBEDDING_MODEL,
+                input=text
+            ))
+        embedding = response.data[0].embedding
+        self.embedding_cache.set(text, embedding)
+        return embedding
+
+    async def _aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        """One multi-input embeddings request, vectors returned in input order"""
+        response = await embedding_upstream.call(lambda: self.async_client.embeddings.create(
             model=settings.EMBEDDING_MODEL,
-            input=text
+            input=texts
+        ))
+        embeddings = [None] * len(texts)
+        for item in response.data:
+            embeddings[item.index] = item.embedding
+        return embeddings
+
+    async def agenerate_embedding(self, text: str) -> List[float]:
+        """Async variant of generate_embedding, micro-batched with concurrent callers"""
+        cached = self.embedding_cache.get(text)
+        if cached is not None:
+            return cached
+
+        # Timed per caller, so the batching wait shows up in each request's breakdown
+        with timed("embedding"):
+            if self.embedding_batcher.enabled:
+                embedding = await self.embedding_batcher.embed(text)
+            else:
+                embedding = (await self._aembed_texts([text]))[0]
+        self.embedding_cache.set(text, embedding)
+        return embedding
+
+    async def agenerate_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embed several texts with a single multi-input request for the cache misses"""
+        embeddings: Dict[str, List[float]] = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            cached = self.embedding_cache.get(text)
+            if cached is not None:
+                embeddings[text] = cached
+            else:
+                missing.append(text)
+
+        if missing:
+            with timed("embedding"):
+                vectors = await self._aembed_texts(missing)
+            for text, embedding in zip(missing, vectors):
+                embeddings[text] = embedding
+                self.embedding_cache.set(text, embedding)
+
+        return [embeddings[text] for text in texts]
+
+    @staticmethod
+    def _build_search_query(query: str, selected_text: Optional[str] = None) -> str:
+        """Build the text that gets embedded for retrieval"""
+        # If user selected text, prioritize it in the query
+        if selected_text:
+            return f"Selected text: {selected_text}\n\nQuestion: {query}"
+        return query
+
+    def embed_query(self, query: str, selected_text: Optional[str] = None) -> List[float]:
+        """Embed a query the way retrieval expects it"""
+        return self.generate_embedding(self._build_search_query(query, selected_text))
+
+    async def aembed_query(self, query: str, selected_text: Optional[str] = None) -> List[float]:
+        """Async variant of embed_query"""
+        return await self.agenerate_embedding(self._build_search_query(query, selected_text))
+
+    async def aembed_queries(self, queries: Sequence[tuple[str, Optional[str]]]) -> List[List[float]]:
+        """Embed (query, selected_text) pairs the way retrieval expects them, in one request"""
+        return await self.agenerate_embeddings(
+            [self._build_search_query(query, selected_text) for query, selected_text in queries]
+        )
+
+    @property
+    def hybrid_enabled(self) -> bool:
+        """Hybrid search needs the setting on and a non-empty lexical index"""
+        if not settings.HYBRID_SEARCH_ENABLED:
+            return False
+        self.lexical_index.maybe_reload()
+        return len(self.lexical_index) > 0
+
+    def _candidate_limit(self, limit: int) -> int:
+        """How many hits to fetch; context packing and hybrid fusion over-fetch"""
+        candidates = max(limit, settings.CONTEXT_CANDIDATES)
+        return max(candidates, settings.HYBRID_CANDIDATES) if self.hybrid_enabled else candidates
+
+    def _dense_limit(self, limit: int) -> int:
+        """How many dense hits to fetch; the reranker over-fetches further"""
+        candidates = self._candidate_limit(limit)
+        return max(candidates, settings.RERANK_CANDIDATES) if self.reranker else candidates
+
+    def _rerank(self, dense_results, query: str, query_vector: List[float], limit: int):
+        """Rescore over-fetched dense hits and keep the best `limit`"""
+        if self.reranker is None:
+            return dense_results
+        return self.reranker.rerank(query, query_vector, dense_results, limit)
+
+    def _fuse_lexical(
+        self,
+        dense_results,
+        query: str,
+        selected_text: Optional[str],
+        module: Optional[str],
+        chapter: Optional[str],
+        limit: int
+    ):
+        """Fuse dense hits with BM25 hits using reciprocal-rank fusion"""
+        if not self.hybrid_enabled:
+            return dense_results[:limit]
+
+        lexical_query = f"{selected_text} {query}" if selected_text else query
+        with timed("lexical_search"):
+            lexical_results = self.lexical_index.search(
+                lexical_query,
+                limit=settings.HYBRID_CANDIDATES,
+                module_filter=module,
+                chapter_filter=chapter
+            )
+        fused = reciprocal_rank_fusion(
+            [dense_results, lexical_results],
+            weights=[settings.DENSE_WEIGHT, settings.LEXICAL_WEIGHT],
+            k=settings.RRF_K
+        )
+        return fused[:limit]
+
+    @staticmethod
+    def _build_context(results, limit: int) -> tuple[str, List[Dict]]:
+        """Pack the best `limit` results into the context token budget and list their sources"""
+        packed = pack_context(
+            results,
+            token_budget=settings.CONTEXT_TOKEN_BUDGET,
+            limit=limit,
+            diversity_lambda=settings.MMR_LAMBDA
         )
-        return response.data[0].embedding
+        CONTEXT_TOKENS.observe(packed.tokens)
+        CONTEXT_TOKENS_SAVED.inc(packed.tokens_saved)
+
+        sources = []
+        for block in packed.blocks:
+            sources.append({
+                "text": block.text[:200] + "...",  # Preview
+                "heading": block.payload.get("heading", ""),
+                "module": block.payload.get("module", ""),
+                "chapter": block.payload.get("chapter", ""),
+                "score": block.score,
+                "chunk_ids": block.ids
+            })
+
+        return packed.text, sources
+
+    @staticmethod
+    def _build_messages(
+        query: str,
+        context: str,
+        selected_text: Optional[str] = None,
+        history: Optional[HistoryWindow] = None
+    ) -> List[Dict]:
+        """Build the chat completion messages for a query, after the conversation so far"""
+        user_message = f"Context from the book:\n\n{context}\n\n"
+
+        if selected_text:
+            user_message += f"User selected this text: \"{selected_text}\"\n\n"
+
+        user_message += f"Question: {query}"
+
+        return [
+            {"role": "system", "content": SYSTEM_MESSAGE},
+            *(history.messages() if history else []),
+            {"role": "user", "content": user_message}
+        ]
 
-    
     def retrieve_context(
-        self, 
-        query: str, 
+        self,
+        query: str,
         selected_text: Optional[str] = None,
         module: Optional[str] = None,
         chapter: Optional[str] = None,
-        limit: int = None
+        limit: int = None,
+        query_vector: Optional[List[float]] = None
     ) -> tuple[str, List[Dict]]:
         """Retrieve relevant context from vector store"""
         if limit is None:
             limit = settings.TOP_K_RESULTS
-        
-        # If user selected text, prioritize it in the query
-        search_query = query
-        if selected_text:
-            search_query = f"Selected text: {selected_text}\n\nQuestion: {query}"
-        
-        # Generate embedding for query
-        query_vector = self.generate_embedding(search_query)
-        
+
+        # Generate embedding for query unless the caller already has it
+        if query_vector is None:
+            query_vector = self.embed_query(query, selected_text)
+
         # Search vector store with optional filters
         results = self.vector_store.search(
             query_vector=query_vector,
-            limit=limit,
+            limit=self._dense_limit(limit),
             module_filter=module,
-            chapter_filter=chapter
+            chapter_filter=chapter,
+            with_vectors=self.reranker is not None
         )
-        
-        # Extract context and sources
-        context_chunks = []
-        sources = []
+        results = self._rerank(results, query, query_vector, self._candidate_limit(limit))
+        results = self._fuse_lexical(results, query, selected_text, module, chapter, self._candidate_limit(limit))
+
+        return self._build_context(results, limit)
+
+    async def aretrieve_context(
+        self,
+        query: str,
+        selected_text: Optional[str] = None,
+        module: Optional[str] = None,
+        chapter: Optional[str] = None,
+        limit: int = None,
+        query_vector: Optional[List[float]] = None
+    ) -> tuple[str, List[Dict]]:
+        """Async variant of retrieve_context"""
+        if limit is None:
+            limit = settings.TOP_K_RESULTS
+
+        if query_vector is None:
+            query_vector = await self.aembed_query(query, selected_text)
+
+        results = await self.vector_store.asearch(
+            query_vector=query_vector,
+            limit=self._dense_limit(limit),
+            module_filter=module,
+            chapter_filter=chapter,
+            with_vectors=self.reranker is not None
+        )
+        results = self._rerank(results, query, query_vector, self._candidate_limit(limit))
+        results = self._fuse_lexical(results, query, selected_text, module, chapter, self._candidate_limit(limit))
+
+        return self._build_context(results, limit)
+
+    async def aretrieve_context_batch(
+        self,
+        items: Sequence[Dict],
+        query_vectors: List[List[float]],
+        limit: int = None
+    ) -> List[tuple[str, List[Dict]]]:
+        """
+        Retrieve context for several queries with one batched vector search
+
+        Each item is a dict with query and optional selected_text, module and
+        chapter; results are returned in the same order.
+        """
+        if limit is None:
+            limit = settings.TOP_K_RESULTS
+        candidates = self._candidate_limit(limit)
+
+        batch_results = await self.vector_store.asearch_batch(
+            query_vectors,
+            limit=self._dense_limit(limit),
+            filters=[(item.get("module"), item.get("chapter")) for item in items],
+            with_vectors=self.reranker is not None
+        )
+
+        contexts = []
+        for item, query_vector, results in zip(items, query_vectors, batch_results):
+            results = self._rerank(results, item["query"], query_vector, candidates)
+            results = self._fuse_lexical(
+                results,
+                item["query"],
+                item.get("selected_text"),
+                item.get("module"),
+                item.get("chapter"),
+                candidates
+            )
+            contexts.append(self._build_context(results, limit))
+        return contexts
 
-        for result in results:
-            context_chunks.append(result.payload["text"])
-            sources.append({
-                "text": result.payload["text"][:200] + "...",  # Preview
-                "module": result.payload.get("module", ""),
-                "chapter": result.payload.get("chapter", ""),
-                "score": result.score
-            })
-        
-        context = "\n\n---\n\n".join(context_chunks)
-        return context, sources
-    
     def generate_response(
-        self, 
-        query: str, 
+        self,
+        query: str,
         context: str,
-        selected_text: Optional[str] = None
+        selected_text: Optional[str] = None,
+        history: Optional[HistoryWindow] = None
     ) -> str:
         """Generate response using OpenAI SDK (Gemini endpoint)"""
-        
-        # Build system message
-        system_message = """You are an expert assistant for the Physical AI & Humanoid Robotics textbook. 
-Your role is to help students understand complex robotics concepts.
+        with timed("completion"):
+            response = completion_upstream.call_sync(lambda: self.client.chat.completions.create(
+                model=settings.CHAT_MODEL,
+                messages=self._build_messages(query, context, selected_text, history),
+                temperature=settings.TEMPERATURE,
+                max_tokens=settings.MAX_TOKENS
+            ))
+
+        return response.choices[0].message.content
+
+    async def agenerate_response(
+        self,
+        query: str,
+        context: str,
+        selected_text: Optional[str] = None,
+        history: Optional[HistoryWindow] = None
+    ) -> str:
+        """Async variant of generate_response"""
+        with timed("completion"):
+            response = await completion_upstream.call(lambda: self.async_client.chat.completions.create(
+                model=settings.CHAT_MODEL,
+                messages=self._build_messages(query, context, selected_text, history),
+                temperature=settings.TEMPERATURE,
+                max_tokens=settings.MAX_TOKENS
+            ))
 
-Guidelines:
-- Answer questions based on the provided context from the book
-- Be clear, concise, and educational
-- If the answer isn't in the context, say so politely
-- Use examples when helpful
-- Reference specific modules or chapters when relevant"""
-        
-        # Build user message
-        user_message = f"Context from the book:\n\n{context}\n\n"
-        
-        if selected_text:
-            user_message += f"User selected this text: \"{selected_text}\"\n\n"
-        
-        user_message += f"Question: {query}"
-        
-        # Generate response
-        response = self.client.chat.completions.create(
-            model=settings.CHAT_MODEL,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=settings.TEMPERATURE,
-            max_tokens=settings.MAX_TOKENS
-        )
-        
         return response.choices[0].message.content
 
-    
+    async def astream_response(
+        self,
+        query: str,
+        context: str,
+        selected_text: Optional[str] = None,
+        history: Optional[HistoryWindow] = None
+    ) -> AsyncIterator[str]:
+        """Stream response tokens as they are generated"""
+        with timed("completion"):
+            # The completion slot and deadline are held until the stream is read to the end
+            stream = completion_upstream.stream(lambda: self.async_client.chat.completions.create(
+                model=settings.CHAT_MODEL,
+                messages=self._build_messages(query, context, selected_text, history),
+                temperature=settings.TEMPERATURE,
+                max_tokens=settings.MAX_TOKENS,
+                stream=True
+            ))
+
+            # Closed explicitly, so a consumer that stops early gives the slot back right away
+            async with aclosing(stream):
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+
+
     def chat(
-        self, 
-        query: str, 
+        self,
+        query: str,
         selected_text: Optional[str] = None,
         module: Optional[str] = None,
-        chapter: Optional[str] = None
+        chapter: Optional[str] = None,
+        history: Optional[HistoryWindow] = None
     ) -> Dict:
-        """Main RAG chat function"""
-        
+        """Main RAG chat function; `history` holds the earlier turns of a follow-up"""
+        search_query = history.contextualize(query) if history else query
+        query_vector = self.embed_query(search_query, selected_text)
+
+        # Near-duplicate questions in the same scope reuse a previous answer,
+        # unless earlier turns make the answer specific to this conversation
+        generation = self.answer_cache.generation
+        cached = None if history else self.answer_cache.get(query_vector, module, chapter, selected_text)
+        if cached is not None:
+            return cached
+
         # Retrieve relevant context
         context, sources = self.retrieve_context(
-            query=query,
+            query=search_query,
             selected_text=selected_text,
             module=module,
-            chapter=chapter
+            chapter=chapter,
+            query_vector=query_vector
         )
-        
+
         # Generate response
         response = self.generate_response(
             query=query,
             context=context,
-            selected_text=selected_text
+            selected_text=selected_text,
+            history=history
         )
-        
-        return {
+
+        result = {
             "response": response,
             "context": context,
             "sources": sources
         }
+        if not history:
+            self.answer_cache.set(query_vector, result, module, chapter, selected_text, generation)
+        return result
+
+    async def achat(
+        self,
+        query: str,
+        selected_text: Optional[str] = None,
+        module: Optional[str] = None,
+        chapter: Optional[str] = None,
+        history: Optional[HistoryWindow] = None
+    ) -> Dict:
+        """Async RAG chat function used by the API"""
+        search_query = history.contextualize(query) if history else query
+        query_vector = await self.aembed_query(search_query, selected_text)
+
+        generation = self.answer_cache.generation
+        cached = None if history else self.answer_cache.get(query_vector, module, chapter, selected_text)
+        if cached is not None:
+            return cached
+
+        context, sources = await self.aretrieve_context(
+            query=search_query,
+            selected_text=selected_text,
+            module=module,
+            chapter=chapter,
+            query_vector=query_vector
+        )
+
+        response = await self.agenerate_response(
+            query=query,
+            context=context,
+            selected_text=selected_text,
+            history=history
+        )
+
+        result = {
+            "response": response,
+            "context": context,
+            "sources": sources
+        }
+        if not history:
+            self.answer_cache.set(query_vector, result, module, chapter, selected_text, generation)
+        return result
+
+    async def abatch_chat(self, items: Sequence[Dict], concurrency: int = None) -> List[Any]:
+        """
+        Answer several questions together
+
+        Queries are embedded in one request and retrieved with one batched
+        search; completions run with at most `concurrency` in flight. An item's
+        optional "history" is the HistoryWindow of its conversation. Returns,
+        per item, the result dict or the exception its completion raised.
+        """
+        if not items:
+            return []
+
+        search_items = [
+            {**item, "query": item["history"].contextualize(item["query"])} if item.get("history") else item
+            for item in items
+        ]
+        query_vectors = await self.aembed_queries(
+            [(item["query"], item.get("selected_text")) for item in search_items]
+        )
+
+        generation = self.answer_cache.generation
+        outcomes: List[Any] = [None] * len(items)
+        pending = []
+        for i, (item, query_vector) in enumerate(zip(items, query_vectors)):
+            cached = None if item.get("history") else self.answer_cache.get(
+                query_vector, item.get("module"), item.get("chapter"), item.get("selected_text")
+            )
+            if cached is not None:
+                outcomes[i] = cached
+            else:
+                pending.append(i)
+
+        if not pending:
+            return outcomes
+
+        contexts = await self.aretrieve_context_batch(
+            [search_items[i] for i in pending],
+            [query_vectors[i] for i in pending]
+        )
+
+        semaphore = asyncio.Semaphore(concurrency or settings.BATCH_CONCURRENCY)
+
+        async def complete(i: int, context: str, sources: List[Dict]) -> Dict:
+            item = items[i]
+            async with semaphore:
+                response = await self.agenerate_response(
+                    query=item["query"],
+                    context=context,
+                    selected_text=item.get("selected_text"),
+                    history=item.get("history")
+                )
+            result = {
+                "response": response,
+                "context": context,
+                "sources": sources
+            }
+            if not item.get("history"):
+                self.answer_cache.set(
+                    query_vectors[i], result, item.get("module"), item.get("chapter"), item.get("selected_text"),
+                    generation
+                )
+            return result
+
+        completed = await asyncio.gather(
+            *(complete(i, context, sources) for i, (context, sources) in zip(pending, contexts)),
+            return_exceptions=True
+        )
+        for i, outcome in zip(pending, completed):
+            outcomes[i] = outcome
+        return outcomes
+
+
+@lru_cache()
+def get_rag_engine() -> RAGEngine:
+    """The process-wide engine, built on first use (normally during app startup)"""
+    return RAGEngine()
@@ -0,0 +1,92 @@
+"""
+Dependency checks behind /health/ready and the startup warm-up
+
+Each check makes one cheap round trip to a dependency: the vector store
+collection, the database and the LLM endpoint. Results are cached for
+READINESS_CACHE_TTL seconds and concurrent callers share a check in flight,
+so frequent probes don't turn into load on the dependencies.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict
+
+from openai import APIStatusError
+
+from app.config import settings
+from app.database import aping_database
+from app.metrics import DEPENDENCY_READY
+from app.rag_engine import get_rag_engine
+
+
+async def check_vector_store():
+    """The collection exists; on Qdrant this also opens the search connection"""
+    if not await get_rag_engine().vector_store.acollection_exists():
+        raise RuntimeError(f"Collection '{settings.QDRANT_COLLECTION_NAME}' does not exist")
+
+
+async def check_llm():
+    """The LLM endpoint answers; listing models costs nothing, unlike a completion"""
+    try:
+        await get_rag_engine().async_client.models.list()
+    except APIStatusError as e:
+        # Any answer means the endpoint is reachable, unless it's failing or rejects the key
+        if e.status_code in (401, 403) or e.status_code >= 500:
+            raise
+
+
+class ReadinessChecker:
+    """Cached, time-bounded dependency checks"""
+
+    def __init__(self, checks: Dict[str, Callable[[], Awaitable[None]]]):
+        self.checks = checks
+        self._results: Dict[str, Dict] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def _run(self, name: str) -> Dict:
+        timeout = settings.READINESS_CHECK_TIMEOUT
+        started = time.perf_counter()
+        error = None
+        try:
+            await asyncio.wait_for(self.checks[name](), timeout)
+        except asyncio.TimeoutError:
+            error = f"Timed out after {timeout}s"
+        except Exception as e:
+            # Client wrappers often have no message of their own; report the underlying error
+            cause = e.__cause__ or e.__context__
+            error = f"{type(e).__name__}: {str(e) or (repr(cause) if cause else '')}"
+
+        self._results[name] = {
+            "ok": error is None,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "error": error
+        }
+        self._checked_at[name] = time.monotonic()
+        DEPENDENCY_READY.labels(name).set(1 if error is None else 0)
+        return self._results[name]
+
+    async def check(self, name: str) -> Dict:
+        """Result of one check, at most READINESS_CACHE_TTL seconds old"""
+        checked_at = self._checked_at.get(name)
+        if checked_at is None or time.monotonic() - checked_at >= settings.READINESS_CACHE_TTL:
+            task = self._in_flight.get(name)
+            if task is None:
+                task = asyncio.ensure_future(self._run(name))
+                self._in_flight[name] = task
+                task.add_done_callback(lambda _: self._in_flight.pop(name, None))
+            # A caller giving up (e.g. a probe timing out) doesn't cancel the shared check
+            await asyncio.shield(task)
+        return {**self._results[name], "age_s": round(time.monotonic() - self._checked_at[name], 1)}
+
+    async def check_all(self) -> Dict[str, Dict]:
+        """All checks, run concurrently"""
+        results = await asyncio.gather(*(self.check(name) for name in self.checks))
+        return dict(zip(self.checks, results))
+
+
+readiness = ReadinessChecker({
+    "vector_store": check_vector_store,
+    "database": aping_database,
+    "llm": check_llm
+})
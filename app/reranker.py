@@ -0,0 +1,114 @@
+"""
+Second retrieval stage: rescore over-fetched candidates before context packing
+
+The vector store returns RERANK_CANDIDATES hits with their vectors, which may
+be ranked by approximate (HNSW, quantized) scores. The reranker rescores them
+locally and keeps the best few, so the first stage can be cheap without
+costing answer quality.
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.config import settings
+from app.lexical_index import tokenize
+from app.metrics import timed
+from app.vector_store import ScoredChunk
+
+# Words too common to say anything about a chunk's topic
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or "
+    "that the this to use what when where which who why with you your".split()
+)
+
+
+def query_terms(text: str) -> set:
+    """Content words of a query"""
+    return {token for token in tokenize(text) if token not in STOPWORDS}
+
+
+class LocalReranker:
+    """
+    Rescores candidates in one NumPy pass
+
+    score = exact cosine(query, chunk vector)
+            + heading_weight * share of query terms in the chunk's headings
+            + keyword_weight * share of query terms in the chunk's text
+            - short_penalty * how far the chunk falls short of min_tokens
+
+    Candidates without a vector (e.g. lexical-only hits) keep their score as
+    the cosine term.
+    """
+
+    def __init__(
+        self,
+        heading_weight: float = None,
+        keyword_weight: float = None,
+        short_penalty: float = None,
+        min_tokens: int = None
+    ):
+        self.heading_weight = settings.RERANK_HEADING_WEIGHT if heading_weight is None else heading_weight
+        self.keyword_weight = settings.RERANK_KEYWORD_WEIGHT if keyword_weight is None else keyword_weight
+        self.short_penalty = settings.RERANK_SHORT_CHUNK_PENALTY if short_penalty is None else short_penalty
+        self.min_tokens = settings.RERANK_SHORT_CHUNK_TOKENS if min_tokens is None else min_tokens
+
+    def scores(self, query: str, query_vector: Sequence[float], candidates: Sequence[ScoredChunk]) -> np.ndarray:
+        """Rerank score of each candidate"""
+        count = len(candidates)
+        cosine = np.array([hit.score for hit in candidates], dtype=np.float32)
+        with_vector = [i for i, hit in enumerate(candidates) if hit.vector is not None]
+        if with_vector:
+            vectors = np.asarray([candidates[i].vector for i in with_vector], dtype=np.float32)
+            query_array = np.asarray(query_vector, dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query_array) or 1.0)
+            cosine[with_vector] = (vectors @ query_array) / np.maximum(norms, 1e-12)
+
+        terms = query_terms(query)
+        heading_overlap = np.zeros(count, dtype=np.float32)
+        keyword_overlap = np.zeros(count, dtype=np.float32)
+        lengths = np.zeros(count, dtype=np.float32)
+        for i, hit in enumerate(candidates):
+            tokens = tokenize(hit.payload.get("text", ""))
+            lengths[i] = len(tokens)
+            if terms:
+                heading_overlap[i] = len(terms.intersection(tokenize(hit.payload.get("heading", ""))))
+                keyword_overlap[i] = len(terms.intersection(tokens))
+        if terms:
+            heading_overlap /= len(terms)
+            keyword_overlap /= len(terms)
+
+        shortfall = np.clip(1.0 - lengths / max(self.min_tokens, 1), 0.0, 1.0)
+        return (
+            cosine
+            + self.heading_weight * heading_overlap
+            + self.keyword_weight * keyword_overlap
+            - self.short_penalty * shortfall
+        )
+
+    def rerank(
+        self,
+        query: str,
+        query_vector: Sequence[float],
+        candidates: Sequence[ScoredChunk],
+        limit: int
+    ) -> List[ScoredChunk]:
+        """The best `limit` candidates by rerank score, which replaces their score"""
+        if not candidates:
+            return []
+        with timed("rerank"):
+            scores = self.scores(query, query_vector, candidates)
+            order = np.argsort(-scores, kind="stable")[:limit]
+            return [
+                ScoredChunk(id=str(candidates[i].id), score=float(scores[i]), payload=candidates[i].payload)
+                for i in order
+            ]
+
+
+def get_reranker() -> Optional[LocalReranker]:
+    """Reranker for the configured RERANKER, None when reranking is off"""
+    if settings.RERANKER == "none":
+        return None
+    if settings.RERANKER != "local":
+        raise ValueError(f"Unknown RERANKER: {settings.RERANKER}")
+    return LocalReranker()
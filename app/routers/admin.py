@@ -0,0 +1,103 @@
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.config import settings
+from app.conversation_analytics import (
+    aconversation_stats, aexport_lines, aexport_rows, arefresh_rollups, export_conditions
+)
+from app.rag_engine import RAGEngine, get_rag_engine
+from app.conversation_writer import get_conversation_writer
+from app.conversation_history import get_conversation_history
+from app.admission import get_chat_admission, get_client_rate_limiter
+from app.upstream import UPSTREAMS, upstream_stats
+
+
+def require_admin_key(x_admin_key: Optional[str] = Header(default=None)):
+    """Reject requests without the configured admin API key"""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if x_admin_key != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid admin API key")
+
+
+router = APIRouter(tags=["admin"], dependencies=[Depends(require_admin_key)])
+
+
+@router.get("/cache/stats")
+async def cache_stats(rag_engine: RAGEngine = Depends(get_rag_engine)):
+    """Hit/miss counters for the embedding, answer and conversation history caches"""
+    return {
+        "embedding_cache": rag_engine.embedding_cache.stats(),
+        "answer_cache": rag_engine.answer_cache.stats(),
+        "history_cache": get_conversation_history().stats()
+    }
+
+
+@router.post("/cache/invalidate")
+async def invalidate_cache(rag_engine: RAGEngine = Depends(get_rag_engine)):
+    """Drop cached answers, called after the collection is re-ingested"""
+    rag_engine.answer_cache.invalidate()
+    return {"status": "invalidated", "answer_cache": rag_engine.answer_cache.stats()}
+
+
+@router.get("/embedding/stats")
+async def embedding_stats(rag_engine: RAGEngine = Depends(get_rag_engine)):
+    """Micro-batching counters of the query embedding batcher"""
+    return rag_engine.embedding_batcher.stats()
+
+
+@router.get("/upstream/stats")
+async def upstream_statistics():
+    """Circuit breaker state, retries and hedging counters per upstream"""
+    return upstream_stats()
+
+
+@router.get("/writer/stats")
+async def writer_stats():
+    """Queue depth and counters of the write-behind conversation writer"""
+    return get_conversation_writer().stats()
+
+
+@router.get("/admission/stats")
+async def admission_statistics():
+    """Slots in use, queue depth and shed requests for chat admission, each upstream and the rate limiter"""
+    rate_limiter = get_client_rate_limiter()
+    return {
+        "chat": get_chat_admission().stats(),
+        "upstreams": {name: upstream.limiter.stats() for name, upstream in UPSTREAMS.items()},
+        "rate_limit": rate_limiter.stats() if rate_limiter else None
+    }
+
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+@router.get("/conversations/export")
+async def export_conversations(
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    module: Optional[str] = None,
+    chapter: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """Stream conversations created in [since, until) as NDJSON or CSV, oldest first"""
+    rows = aexport_rows(export_conditions(module, chapter, since, until))
+    return StreamingResponse(
+        aexport_lines(rows, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="conversations.{format}"'}
+    )
+
+
+@router.get("/conversations/stats")
+async def conversation_statistics(
+    top: int = Query(default=20, ge=1, le=1000),
+    since: Optional[date] = None,
+    until: Optional[date] = None
+):
+    """Top queries and conversations per module, after folding new rows into the rollups"""
+    folded = await arefresh_rollups()
+    stats = await aconversation_stats(top, since, until)
+    stats["folded"] = folded
+    return stats
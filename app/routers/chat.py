@@ -1,16 +1,93 @@
-from fastapi import APIRouter, HTTPException
-from app.models import ChatRequest, ChatResponse
-from app.rag_engine import RAGEngine
-from app.database import save_conversation
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from app.models import ChatRequest, ChatResponse, BatchChatRequest, BatchChatResponse, BatchChatItem
+from app.rag_engine import RAGEngine, get_rag_engine
+from app.conversation_writer import get_conversation_writer
+from app.conversation_history import get_conversation_history
+from app.database import asave_conversations, build_conversation_record
+from app.config import settings
+from app.metrics import set_request_module
+from app.admission import Overloaded, get_chat_admission, get_client_rate_limiter
+from app.upstream import UpstreamUnavailable
+import asyncio
+import json
+import math
+import time
+from typing import AsyncIterator
 
 router = APIRouter(tags=["chat"])
 
-# Initialize RAG engine
-rag_engine = RAGEngine()
 
+def _unavailable(error: UpstreamUnavailable) -> HTTPException:
+    """503 telling the client when the failing upstream will be tried again"""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
+    )
 
-@router.post("/", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+
+def _overloaded(error: Overloaded) -> HTTPException:
+    """429 telling the client when to try again"""
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
+    )
+
+
+def _client_key(http_request: Request) -> str:
+    """Who a request is rate-limited as: RATE_LIMIT_CLIENT_HEADER's first value, or the peer address"""
+    if settings.RATE_LIMIT_CLIENT_HEADER:
+        value = http_request.headers.get(settings.RATE_LIMIT_CLIENT_HEADER)
+        if value:
+            return value.split(",")[0].strip()
+    return http_request.client.host if http_request.client else "unknown"
+
+
+def _rate_limit(http_request: Request, cost: int = 1):
+    """Charge the client `cost` requests, 429 if its bucket is empty"""
+    limiter = get_client_rate_limiter()
+    if limiter is None:
+        return
+    try:
+        limiter.acquire(_client_key(http_request), cost)
+    except Overloaded as e:
+        raise _overloaded(e)
+
+
+def _remember_turn(request: ChatRequest, session_id: str, response: str):
+    """Add a turn to the cached history, so a follow-up sees it before the write-behind flush"""
+    history = get_conversation_history()
+    if not request.conversation_id:
+        history.start(session_id)
+    history.record(session_id, request.query, response)
+
+
+async def admit(http_request: Request):
+    """
+    Rate-limit the client, then wait for a chat admission slot
+
+    The slot is held until the response has been sent, including the whole
+    of a streamed response. Requests that find the queue full or wait longer
+    than ADMISSION_QUEUE_TIMEOUT get 429.
+    """
+    _rate_limit(http_request)
+    admission = get_chat_admission()
+    try:
+        await admission.acquire(settings.ADMISSION_QUEUE_TIMEOUT)
+    except Overloaded as e:
+        raise _overloaded(e)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        admission.release(time.monotonic() - started)
+
+
+@router.post("/", response_model=ChatResponse, dependencies=[Depends(admit)])
+async def chat(request: ChatRequest, rag_engine: RAGEngine = Depends(get_rag_engine)):
     """
     Chat endpoint for RAG queries
     
@@ -18,25 +95,32 @@ async def chat(request: ChatRequest):
     - General questions about the book
     - Text selection-based queries
     - Module/chapter-specific questions
+    - Follow-up questions: send the conversation_id of the previous answer
     """
+    set_request_module(request.module)
     try:
+        history = await get_conversation_history().window(request.conversation_id)
+
         # Get response from RAG engine
-        result = rag_engine.chat(
+        result = await rag_engine.achat(
             query=request.query,
             selected_text=request.selected_text,
             module=request.module,
-            chapter=request.chapter
+            chapter=request.chapter,
+            history=history
         )
         
-        # Save conversation to database
-        conversation_id = save_conversation(
+        # Queue conversation for persistence; the id is assigned up front
+        conversation_id = await get_conversation_writer().enqueue(
             query=request.query,
             response=result["response"],
-            context=result["context"],
+            sources=result["sources"],
             module=request.module,
             chapter=request.chapter,
-            selected_text=request.selected_text
+            selected_text=request.selected_text,
+            session_id=request.conversation_id
         )
+        _remember_turn(request, conversation_id, result["response"])
         
         return ChatResponse(
             response=result["response"],
@@ -44,6 +128,10 @@ async def chat(request: ChatRequest):
             sources=result.get("sources", [])
         )
         
+    except UpstreamUnavailable as e:
+        raise _unavailable(e)
+    except Overloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -51,11 +139,202 @@ async def chat(request: ChatRequest):
         )
 
 
-@router.get("/test")
-async def test_chat():
+@router.post("/batch", response_model=BatchChatResponse)
+async def chat_batch(
+    request: BatchChatRequest,
+    http_request: Request,
+    rag_engine: RAGEngine = Depends(get_rag_engine)
+):
+    """
+    Answer a batch of chat requests
+
+    Queries are embedded in one upstream call and retrieved with one batched
+    vector search. Each item gets its own response or error, and the
+    successful conversations are saved in a single transaction.
+    """
+    if not request.requests:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(request.requests) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch has {len(request.requests)} items, the limit is {settings.BATCH_MAX_ITEMS}"
+        )
+
+    # Each question counts against the client's rate limit; the batch takes one admission slot
+    _rate_limit(http_request, len(request.requests))
+    try:
+        async with get_chat_admission().slot(settings.ADMISSION_QUEUE_TIMEOUT):
+            histories = await asyncio.gather(
+                *(get_conversation_history().window(item.conversation_id) for item in request.requests)
+            )
+            outcomes = await rag_engine.abatch_chat([
+                {**item.model_dump(), "history": history}
+                for item, history in zip(request.requests, histories)
+            ])
+    except UpstreamUnavailable as e:
+        raise _unavailable(e)
+    except Overloaded as e:
+        raise _overloaded(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing batch chat request: {str(e)}"
+        )
+
+    results = []
+    records = []
+    for index, (item, outcome) in enumerate(zip(request.requests, outcomes)):
+        if isinstance(outcome, Exception):
+            results.append(BatchChatItem(index=index, error=f"Error processing chat request: {str(outcome)}"))
+            continue
+
+        record = build_conversation_record(
+            query=item.query,
+            response=outcome["response"],
+            sources=outcome["sources"],
+            module=item.module,
+            chapter=item.chapter,
+            selected_text=item.selected_text,
+            session_id=item.conversation_id
+        )
+        records.append(record)
+        _remember_turn(item, record["session_id"], outcome["response"])
+        results.append(BatchChatItem(
+            index=index,
+            response=outcome["response"],
+            conversation_id=record["session_id"],
+            sources=outcome.get("sources", [])
+        ))
+
+    try:
+        await asave_conversations(records)
+    except Exception as e:
+        # Hand the rows to the write-behind writer, which retries until the database is back
+        print(f"[WARNING] Batch conversation insert failed ({e}), queueing for retry")
+        for record in records:
+            await get_conversation_writer().enqueue_record(record)
+
+    return BatchChatResponse(results=results)
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _cached_tokens(response: str) -> AsyncIterator[str]:
+    """A cached answer, streamed as a single token"""
+    yield response
+
+
+@router.post("/stream", dependencies=[Depends(admit)])
+async def chat_stream(request: ChatRequest, rag_engine: RAGEngine = Depends(get_rag_engine)):
+    """
+    Streaming chat endpoint (server-sent events)
+    
+    Events:
+    - sources: retrieved sources, sent as soon as retrieval finishes
+    - token: a chunk of the generated response
+    - done: the conversation id to send with a follow-up
+    - error: generation failed part-way through
+
+    Retrieval errors, and a completion queue or breaker that refuses the
+    request, are returned as 500/429/503 before the stream starts.
+    """
+    set_request_module(request.module)
+    try:
+        history = await get_conversation_history().window(request.conversation_id)
+        search_query = history.contextualize(request.query) if history else request.query
+
+        # Retrieve before streaming so retrieval failures still map to a 500
+        query_vector = await rag_engine.aembed_query(search_query, request.selected_text)
+        generation = rag_engine.answer_cache.generation
+        # Answers to follow-ups depend on the conversation, so they bypass the answer cache
+        cached = None if history else rag_engine.answer_cache.get(
+            query_vector, request.module, request.chapter, request.selected_text
+        )
+        if cached is not None:
+            context, sources = cached["context"], cached["sources"]
+        else:
+            context, sources = await rag_engine.aretrieve_context(
+                query=search_query,
+                selected_text=request.selected_text,
+                module=request.module,
+                chapter=request.chapter,
+                query_vector=query_vector
+            )
+
+        token_stream = _cached_tokens(cached["response"]) if cached is not None else rag_engine.astream_response(
+            query=request.query,
+            context=context,
+            selected_text=request.selected_text,
+            history=history
+        )
+        # Open the upstream stream before answering, so a full completion queue or an
+        # open breaker is a 429/503 like on the other endpoints rather than an error event
+        first_token = await anext(token_stream, None)
+    except UpstreamUnavailable as e:
+        raise _unavailable(e)
+    except Overloaded as e:
+        raise _overloaded(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing chat request: {str(e)}"
+        )
+
+    async def event_stream():
+        yield _sse_event("sources", {"sources": sources})
+
+        tokens = []
+        try:
+            if first_token is not None:
+                tokens.append(first_token)
+                yield _sse_event("token", {"content": first_token})
+            async for token in token_stream:
+                tokens.append(token)
+                yield _sse_event("token", {"content": token})
+
+            response = "".join(tokens)
+            if cached is None and not history:
+                rag_engine.answer_cache.set(
+                    query_vector,
+                    {"response": response, "context": context, "sources": sources},
+                    request.module,
+                    request.chapter,
+                    request.selected_text,
+                    generation
+                )
+
+            # Persist once the full response is known
+            conversation_id = await get_conversation_writer().enqueue(
+                query=request.query,
+                response=response,
+                sources=sources,
+                module=request.module,
+                chapter=request.chapter,
+                selected_text=request.selected_text,
+                session_id=request.conversation_id
+            )
+            _remember_turn(request, conversation_id, response)
+            yield _sse_event("done", {"conversation_id": conversation_id})
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Error processing chat request: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Gives the completion slot back if the client disconnects before the stream ends
+        background=BackgroundTask(token_stream.aclose)
+    )
+
+
+@router.get("/test", dependencies=[Depends(admit)])
+async def test_chat(rag_engine: RAGEngine = Depends(get_rag_engine)):
     """Test endpoint to verify chat functionality"""
     try:
-        result = rag_engine.chat(
+        result = await rag_engine.achat(
             query="What is ROS 2?",
             module="module1"
         )
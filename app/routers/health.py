@@ -1,6 +1,7 @@
-from fastapi import APIRouter
-from app.models import HealthResponse
+from fastapi import APIRouter, Response
+from app.models import HealthResponse, ReadinessResponse
 from app.config import settings
+from app.readiness import readiness
 from datetime import datetime
 
 router = APIRouter(tags=["health"])
@@ -14,3 +15,19 @@ async def health_check():
         environment=settings.ENVIRONMENT,
         timestamp=datetime.utcnow()
     )
+
+
+@router.get("/health/ready", response_model=ReadinessResponse)
+async def readiness_check(response: Response):
+    """
+    Readiness check endpoint
+
+    Verifies the vector store collection, the database and the LLM endpoint
+    are reachable. Results are cached for READINESS_CACHE_TTL seconds; returns
+    503 if any dependency is down.
+    """
+    checks = await readiness.check_all()
+    ready = all(check["ok"] for check in checks.values())
+    if not ready:
+        response.status_code = 503
+    return ReadinessResponse(status="ready" if ready else "not_ready", checks=checks)
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.metrics import record_cache
+
+
+class SemanticCache:
+    """
+    Cache of generated answers looked up by query-embedding similarity
+
+    Entries are only matched within the same (module, chapter, selected_text)
+    scope, since the same question asked about a different chapter or
+    selection must be answered from different context.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_size: int = 2000, ttl: float = 86400):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Bumped on invalidation so answers generated from the old corpus are not stored
+        self.generation = 0
+        self._next_id = 0
+        # entry id -> (scope, expires_at, result); ordered for LRU eviction
+        self._entries: "OrderedDict[int, tuple[tuple, float, Dict]]" = OrderedDict()
+        # scope -> {entry id: normalized vector}
+        self._vectors: Dict[tuple, Dict[int, np.ndarray]] = {}
+        # scope -> (entry ids, stacked matrix), rebuilt lazily after a change
+        self._matrices: Dict[tuple, tuple[List[int], np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def _scope(module: Optional[str], chapter: Optional[str], selected_text: Optional[str]) -> tuple:
+        return (module or "", chapter or "", selected_text or "")
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _remove(self, entry_id: int):
+        scope, _, _ = self._entries.pop(entry_id)
+        vectors = self._vectors[scope]
+        del vectors[entry_id]
+        if not vectors:
+            del self._vectors[scope]
+        self._matrices.pop(scope, None)
+
+    def get(
+        self,
+        query_vector: List[float],
+        module: Optional[str] = None,
+        chapter: Optional[str] = None,
+        selected_text: Optional[str] = None
+    ) -> Optional[Dict]:
+        """Return the cached result of the most similar question in scope, if above threshold"""
+        if not self.enabled:
+            return None
+
+        scope = self._scope(module, chapter, selected_text)
+        with self._lock:
+            if scope not in self._vectors:
+                self.misses += 1
+                record_cache("answer", False)
+                return None
+
+            if scope not in self._matrices:
+                ids = list(self._vectors[scope])
+                self._matrices[scope] = (ids, np.stack([self._vectors[scope][i] for i in ids]))
+            ids, matrix = self._matrices[scope]
+
+            similarities = matrix @ self._normalize(query_vector)
+            best = int(np.argmax(similarities))
+            entry_id = ids[best]
+            _, expires_at, result = self._entries[entry_id]
+
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                record_cache("answer", False)
+                return None
+            if expires_at <= time.time():
+                self._remove(entry_id)
+                self.misses += 1
+                record_cache("answer", False)
+                return None
+
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            record_cache("answer", True)
+            return result
+
+    def set(
+        self,
+        query_vector: List[float],
+        result: Dict,
+        module: Optional[str] = None,
+        chapter: Optional[str] = None,
+        selected_text: Optional[str] = None,
+        generation: Optional[int] = None
+    ):
+        """Store a generated result; skipped if the cache was invalidated since `generation`"""
+        if not self.enabled:
+            return
+
+        scope = self._scope(module, chapter, selected_text)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, time.time() + self.ttl, result)
+            self._vectors.setdefault(scope, {})[entry_id] = self._normalize(query_vector)
+            self._matrices.pop(scope, None)
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. after the collection is re-ingested"""
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+            self._matrices.clear()
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        """Hit-rate counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,453 @@
+import asyncio
+import math
+import random
+import ssl
+import statistics
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, OpenAI
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+
+from app.admission import AdmissionLimiter
+from app.config import settings
+from app.metrics import UPSTREAM_BREAKER_STATE, UPSTREAM_HEDGES, UPSTREAM_REJECTED, UPSTREAM_RETRIES
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling the upstream while its circuit breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} upstream is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+@lru_cache()
+def ssl_context() -> ssl.SSLContext:
+    """One TLS context for every client; loading the CA bundle takes tens of ms each time"""
+    return ssl.create_default_context()
+
+
+def http_limits() -> httpx.Limits:
+    """Connection pool shared by all calls of one client"""
+    return httpx.Limits(
+        max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY
+    )
+
+
+def http_timeout(timeout: float) -> httpx.Timeout:
+    return httpx.Timeout(timeout, connect=settings.UPSTREAM_CONNECT_TIMEOUT)
+
+
+def create_openai_client(timeout: float = None) -> OpenAI:
+    """Sync OpenAI client for Gemini on a tuned keep-alive pool; retries are done by Upstream"""
+    timeout = http_timeout(timeout or settings.UPSTREAM_COMPLETION_TIMEOUT)
+    return OpenAI(
+        api_key=settings.GEMINI_API_KEY,
+        base_url=settings.GEMINI_BASE_URL,
+        max_retries=0,
+        timeout=timeout,
+        http_client=httpx.Client(limits=http_limits(), timeout=timeout, verify=ssl_context())
+    )
+
+
+def create_async_openai_client(timeout: float = None) -> AsyncOpenAI:
+    """Async variant of create_openai_client"""
+    timeout = http_timeout(timeout or settings.UPSTREAM_COMPLETION_TIMEOUT)
+    return AsyncOpenAI(
+        api_key=settings.GEMINI_API_KEY,
+        base_url=settings.GEMINI_BASE_URL,
+        max_retries=0,
+        timeout=timeout,
+        http_client=httpx.AsyncClient(limits=http_limits(), timeout=timeout, verify=ssl_context())
+    )
+
+
+def qdrant_client_options(timeout: Optional[float] = None) -> Dict:
+    """Keyword arguments for QdrantClient/AsyncQdrantClient, on a tuned keep-alive pool"""
+    options = {
+        "url": settings.QDRANT_URL,
+        "api_key": settings.QDRANT_API_KEY,
+        "limits": http_limits(),
+        "verify": ssl_context(),
+        # Skip the blocking server version request on construction
+        "check_compatibility": False
+    }
+    if timeout is not None:
+        # Qdrant only takes whole seconds
+        options["timeout"] = math.ceil(timeout)
+    return options
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP status of an upstream error, if it got that far"""
+    if isinstance(error, (APIStatusError, UnexpectedResponse)):
+        return error.status_code
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and connection failures are worth retrying"""
+    status = error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (
+        APIConnectionError,
+        ResponseHandlingException,
+        httpx.TransportError,
+        asyncio.TimeoutError,
+        TimeoutError
+    ))
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """The server's Retry-After hint in seconds, if it sent one"""
+    headers = None
+    if isinstance(error, APIStatusError):
+        headers = error.response.headers
+    elif isinstance(error, UnexpectedResponse):
+        headers = error.headers
+    elif isinstance(error, httpx.HTTPStatusError):
+        headers = error.response.headers
+    if not headers or not headers.get("retry-after"):
+        return None
+    try:
+        return float(headers["retry-after"])
+    except ValueError:
+        return None
+
+
+def retry_delay(error: Exception, attempt: int, base: float, cap: float) -> Optional[float]:
+    """Backoff before the next attempt, or None if the error is not retryable"""
+    if not is_retryable(error):
+        return None
+    hint = retry_after(error)
+    if hint is not None:
+        return hint
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `threshold` consecutive upstream failures
+
+    While open, calls are rejected without touching the upstream. After
+    `reset_timeout` seconds one trial call is let through (half-open); its
+    success closes the breaker and its failure opens it again.
+    """
+
+    def __init__(self, name: str, threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        # None means the setting, read on first use rather than at import
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        UPSTREAM_BREAKER_STATE.labels(name).set(0)
+
+    @property
+    def threshold(self) -> int:
+        return self._threshold or settings.UPSTREAM_BREAKER_THRESHOLD
+
+    @property
+    def reset_timeout(self) -> float:
+        return settings.UPSTREAM_BREAKER_RESET if self._reset_timeout is None else self._reset_timeout
+
+    def _set_state(self, state: str):
+        self.state = state
+        UPSTREAM_BREAKER_STATE.labels(self.name).set(_STATE_VALUES[state])
+
+    def before_call(self):
+        """Raise UpstreamUnavailable if the call shouldn't go out"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        UPSTREAM_REJECTED.labels(self.name).inc()
+        raise UpstreamUnavailable(self.name, max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                if self.state != OPEN:
+                    print(f"[WARNING] Circuit breaker for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def record_ignored(self):
+        """The call failed for a reason that says nothing about upstream health"""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class Upstream:
+    """
+    Calls to one upstream: deadline, jittered retries, circuit breaker and hedging
+
+    Each call gets one overall deadline that covers its retries. Retryable
+    failures (429, 5xx, timeouts, connection errors) are retried with
+    full-jitter backoff, honouring Retry-After, as long as the next attempt
+    still fits in the deadline. With hedging on, a second identical request is
+    sent if the first hasn't answered within the recent p95 latency, and
+    whichever finishes first wins; only use it for idempotent calls.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = None,
+        hedge: bool = None,
+        max_retries: int = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_concurrency: int = None
+    ):
+        self.name = name
+        # None means the setting (UPSTREAM_<NAME>_TIMEOUT, UPSTREAM_HEDGING,
+        # UPSTREAM_MAX_RETRIES, UPSTREAM_<NAME>_MAX_CONCURRENCY), read on first
+        # use rather than at import
+        self._timeout = timeout
+        self._hedge = hedge
+        self._max_retries = max_retries
+        self._max_concurrency = max_concurrency
+        self._limiter: Optional[AdmissionLimiter] = None
+        self.breaker = breaker or CircuitBreaker(name)
+        # Latencies of recent successful attempts, for the hedge delay
+        self.latencies = deque(maxlen=256)
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def timeout(self) -> float:
+        if self._timeout is not None:
+            return self._timeout
+        return getattr(settings, f"UPSTREAM_{self.name.upper()}_TIMEOUT")
+
+    @property
+    def hedge(self) -> bool:
+        return settings.UPSTREAM_HEDGING if self._hedge is None else self._hedge
+
+    @property
+    def max_retries(self) -> int:
+        return settings.UPSTREAM_MAX_RETRIES if self._max_retries is None else self._max_retries
+
+    @property
+    def limiter(self) -> AdmissionLimiter:
+        """Caps async calls in flight; callers beyond UPSTREAM_MAX_QUEUE waiting are shed"""
+        if self._limiter is None:
+            max_concurrency = self._max_concurrency
+            if max_concurrency is None:
+                # Upstreams without a setting aren't limited
+                max_concurrency = getattr(settings, f"UPSTREAM_{self.name.upper()}_MAX_CONCURRENCY", 0)
+            self._limiter = AdmissionLimiter(self.name, max_concurrency, settings.UPSTREAM_MAX_QUEUE)
+        return self._limiter
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, None until there's enough latency history"""
+        if not self.hedge or len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        quantile = ordered[min(len(ordered) - 1, int(settings.UPSTREAM_HEDGE_QUANTILE * len(ordered)))]
+        return max(quantile, settings.UPSTREAM_HEDGE_MIN_DELAY_MS / 1000)
+
+    async def _attempt(self, fn: Callable[[], Awaitable[T]]) -> T:
+        delay = self.hedge_delay()
+        started = time.perf_counter()
+        if delay is None:
+            result = await fn()
+            self.latencies.append(time.perf_counter() - started)
+            return result
+
+        first = asyncio.ensure_future(fn())
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                UPSTREAM_HEDGES.labels(self.name).inc()
+                tasks.add(asyncio.ensure_future(fn()))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        self.latencies.append(time.perf_counter() - started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, fn: Callable[[], Awaitable[T]], timeout: float = None) -> T:
+        """
+        Run `fn` (a zero-argument coroutine factory) under this upstream's policies
+
+        Raises Overloaded if no concurrency slot frees up in time; waiting for
+        one counts against the deadline.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        self.calls += 1
+        async with self.limiter.slot(deadline - loop.time()):
+            return await self._call(fn, deadline)
+
+    async def stream(self, open_stream: Callable[[], Awaitable], timeout: float = None) -> AsyncIterator:
+        """
+        Variant of call for streamed responses: opens the stream and yields its items
+
+        The concurrency slot and the deadline cover reading the whole stream,
+        not just opening it, until it ends or the consumer stops iterating.
+        Only opening the stream is retried.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        self.calls += 1
+        async with self.limiter.slot(deadline - loop.time()):
+            stream = await self._call(open_stream, deadline)
+            try:
+                while True:
+                    try:
+                        item = await asyncio.wait_for(stream.__anext__(), max(deadline - loop.time(), 0))
+                    except StopAsyncIteration:
+                        return
+                    except Exception:
+                        self.failures += 1
+                        raise
+                    yield item
+            finally:
+                # Release the connection of a stream that wasn't read to the end
+                response = getattr(stream, "response", None)
+                if response is not None:
+                    await response.aclose()
+
+    async def _call(self, fn: Callable[[], Awaitable[T]], deadline: float) -> T:
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await asyncio.wait_for(self._attempt(fn), max(deadline - loop.time(), 0))
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_ignored()
+                    self.failures += 1
+                    raise
+                self.breaker.record_failure()
+                delay = retry_delay(e, attempt, settings.UPSTREAM_RETRY_BASE_DELAY, settings.UPSTREAM_RETRY_MAX_DELAY)
+                if attempt >= self.max_retries or loop.time() + delay >= deadline:
+                    self.failures += 1
+                    raise
+                attempt += 1
+                self.retries += 1
+                UPSTREAM_RETRIES.labels(self.name).inc()
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: don't leave a half-open breaker waiting for this trial forever
+                self.breaker.record_ignored()
+                raise
+
+            self.breaker.record_success()
+            return result
+
+    def call_sync(self, fn: Callable[[], T], timeout: float = None) -> T:
+        """
+        Blocking variant of call, without hedging or concurrency limits
+
+        A running attempt can't be interrupted, so the deadline only limits
+        retries; the client's own timeout bounds each attempt.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self.calls += 1
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            started = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_ignored()
+                    self.failures += 1
+                    raise
+                self.breaker.record_failure()
+                delay = retry_delay(e, attempt, settings.UPSTREAM_RETRY_BASE_DELAY, settings.UPSTREAM_RETRY_MAX_DELAY)
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    self.failures += 1
+                    raise
+                attempt += 1
+                self.retries += 1
+                UPSTREAM_RETRIES.labels(self.name).inc()
+                time.sleep(delay)
+                continue
+
+            self.latencies.append(time.perf_counter() - started)
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> dict:
+        """Breaker state and call counters for monitoring"""
+        latencies = list(self.latencies)
+        hedge_delay = self.hedge_delay()
+        return {
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": hedge_delay * 1000 if hedge_delay is not None else None,
+            "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+            "admission": self.limiter.stats()
+        }
+
+
+# One instance per upstream, shared by everything in the process
+embedding_upstream = Upstream("embedding")
+completion_upstream = Upstream("completion", hedge=False)
+search_upstream = Upstream("search")
+
+UPSTREAMS = {upstream.name: upstream for upstream in (embedding_upstream, completion_upstream, search_upstream)}
+
+
+def upstream_stats() -> Dict[str, dict]:
+    return {name: upstream.stats() for name, upstream in UPSTREAMS.items()}
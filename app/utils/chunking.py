@@ -1,64 +1,250 @@
 import re
-from typing import List
+from dataclasses import dataclass, field
+from typing import Iterator, List, Tuple
 
+from app.utils.tokens import estimate_tokens
 
-def chunk_markdown(content: str, chunk_size: int = 500, chunk_overlap: int = 50) -> List[str]:
+# Bumped whenever chunk boundaries change, so ingestion re-embeds everything
+CHUNKER_VERSION = 2
+
+FRONTMATTER_PATTERN = re.compile(r"\A---\n.*?\n---\n", re.DOTALL)
+HEADING_PATTERN = re.compile(r"(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"\s*(`{3,}|~{3,})")
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+")
+WORD_PATTERN = re.compile(r"\S+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+CODE_BLOCK_PATTERN = re.compile(r"```[\s\S]*?```")
+
+# Unit kinds; sentences are the only units carried over as overlap
+HEADING, SENTENCE, CODE = "heading", "sentence", "code"
+
+
+@dataclass
+class Chunk:
+    """A chunk of a document, with where it came from"""
+    text: str
+    # Titles of the enclosing headings, outermost first
+    heading_path: List[str] = field(default_factory=list)
+    # Character offsets of the chunk in the original content: text == content[start:end]
+    start: int = 0
+    end: int = 0
+    tokens: int = 0
+
+
+def _lines(content: str, offset: int, end: int = None) -> Iterator[Tuple[int, str]]:
+    """(offset, line) pairs with line endings kept"""
+    for line in content[offset:end].splitlines(keepends=True):
+        yield offset, line
+        offset += len(line)
+
+
+def _split_words(content: str, start: int, end: int, max_tokens: int) -> Iterator[Tuple[int, int, int]]:
+    """Split an over-long span on whitespace into pieces of at most max_tokens"""
+    piece_start = piece_end = None
+    tokens = 0
+    for match in WORD_PATTERN.finditer(content, start, end):
+        word_tokens = estimate_tokens(match.group())
+        if piece_start is not None and tokens + word_tokens > max_tokens:
+            yield piece_start, piece_end, tokens
+            piece_start, tokens = None, 0
+        if piece_start is None:
+            piece_start = match.start()
+        piece_end = match.end()
+        tokens += word_tokens
+    if piece_start is not None:
+        yield piece_start, piece_end, tokens
+
+
+def _split_lines(content: str, start: int, end: int, max_tokens: int) -> Iterator[Tuple[int, int, int]]:
+    """Split an over-long span (e.g. a code block) on line boundaries, then words"""
+    piece_start = None
+    piece_end = start
+    tokens = 0
+    for line_start, line in _lines(content, start, end):
+        line_tokens = estimate_tokens(line)
+        if piece_start is not None and tokens + line_tokens > max_tokens:
+            yield piece_start, piece_end, tokens
+            piece_start, tokens = None, 0
+        if line_tokens > max_tokens:
+            yield from _split_words(content, line_start, line_start + len(line), max_tokens)
+            continue
+        if piece_start is None:
+            piece_start = line_start
+        piece_end = line_start + len(line.rstrip())
+        tokens += line_tokens
+    if piece_start is not None and tokens:
+        yield piece_start, piece_end, tokens
+
+
+def _units(content: str, max_tokens: int) -> Iterator[Tuple[str, int, int, int, Tuple[str, ...]]]:
+    """
+    Single pass over the lines yielding (kind, start, end, tokens, heading path)
+
+    Headings are their own units, fenced code blocks are kept whole (split only
+    on line boundaries if they exceed max_tokens), and paragraphs are split into
+    sentences.
+    """
+    frontmatter = FRONTMATTER_PATTERN.match(content)
+    offset = frontmatter.end() if frontmatter else 0
+
+    headings: List[Tuple[int, str]] = []
+    path: Tuple[str, ...] = ()
+    paragraph_start = None
+    paragraph_end = 0
+    fence = None
+    fence_start = 0
+
+    def paragraph_units(start: int, end: int):
+        text = content[start:end]
+        sentence_start = 0
+        for match in SENTENCE_END_PATTERN.finditer(text):
+            yield start + sentence_start, start + match.start()
+            sentence_start = match.end()
+        if sentence_start < len(text.rstrip()):
+            yield start + sentence_start, start + len(text.rstrip())
+
+    def emit(kind: str, start: int, end: int):
+        tokens = estimate_tokens(content[start:end])
+        if tokens > max_tokens:
+            split = _split_lines if kind == CODE else _split_words
+            for piece_start, piece_end, piece_tokens in split(content, start, end, max_tokens):
+                yield kind, piece_start, piece_end, piece_tokens, path
+        elif tokens:
+            yield kind, start, end, tokens, path
+
+    def flush_paragraph():
+        nonlocal paragraph_start
+        if paragraph_start is None:
+            return
+        for start, end in paragraph_units(paragraph_start, paragraph_end):
+            yield from emit(SENTENCE, start, end)
+        paragraph_start = None
+
+    for line_start, line in _lines(content, offset):
+        line_end = line_start + len(line.rstrip("\r\n"))
+
+        if fence is not None:
+            # Inside a code block only the matching closing fence matters
+            stripped = line.strip()
+            if stripped.startswith(fence) and stripped.rstrip(fence[0]) == "":
+                yield from emit(CODE, fence_start, line_end)
+                fence = None
+            continue
+
+        stripped = line.strip()
+        if not stripped:
+            yield from flush_paragraph()
+            continue
+
+        # Most lines are prose; only lines starting with a marker need the regexes
+        marker = stripped[0]
+        fence_match = FENCE_PATTERN.match(line) if marker in "`~" else None
+        if fence_match:
+            yield from flush_paragraph()
+            fence = fence_match.group(1)
+            fence_start = line_start + fence_match.start(1)
+            continue
+
+        heading_match = HEADING_PATTERN.match(line.rstrip("\r\n")) if marker == "#" else None
+        if heading_match:
+            yield from flush_paragraph()
+            level = len(heading_match.group(1))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, heading_match.group(2)))
+            path = tuple(title for _, title in headings)
+            yield from emit(HEADING, line_start, line_end)
+            continue
+
+        if paragraph_start is None:
+            paragraph_start = line_start + len(line) - len(line.lstrip())
+        paragraph_end = line_end
+
+    yield from flush_paragraph()
+    if fence is not None:
+        # Unterminated fence: keep what's there
+        yield from emit(CODE, fence_start, len(content.rstrip()))
+
+
+def iter_chunks(content: str, chunk_size: int = 128, chunk_overlap: int = 16) -> Iterator[Chunk]:
+    """
+    Chunk markdown/MDX content into pieces of about `chunk_size` tokens
+
+    Headings start a new chunk, and fenced code blocks stay whole unless a
+    single block exceeds `chunk_size`, in which case it's split between lines.
+    Consecutive chunks of the same section share up to `chunk_overlap` tokens
+    of whole sentences. Runs in a single pass over the content.
+
+    Args:
+        content: Markdown content to chunk
+        chunk_size: Target size of each chunk in estimated tokens
+        chunk_overlap: Tokens of trailing sentences repeated at the start of the next chunk
+
+    Yields:
+        Chunks with their heading path and character offsets
+    """
+    units: List[Tuple[str, int, int, int]] = []
+    tokens = 0
+    path: Tuple[str, ...] = ()
+    # Whether the buffer holds body text not already emitted as overlap
+    fresh = False
+
+    def make_chunk() -> Chunk:
+        start, end = units[0][1], units[-1][2]
+        return Chunk(text=content[start:end], heading_path=list(path), start=start, end=end, tokens=tokens)
+
+    for kind, start, end, unit_tokens, unit_path in _units(content, chunk_size):
+        if kind == HEADING:
+            # New section: emit what we have and don't carry overlap across it
+            if fresh:
+                yield make_chunk()
+            units, tokens, fresh = [], 0, False
+            path = unit_path
+
+        if units and tokens + unit_tokens > chunk_size:
+            if fresh:
+                yield make_chunk()
+            # Keep trailing sentences as overlap, as long as the new unit still fits
+            overlap: List[Tuple[str, int, int, int]] = []
+            overlap_tokens = 0
+            for unit in reversed(units):
+                if unit[0] != SENTENCE or overlap_tokens + unit[3] > chunk_overlap:
+                    break
+                overlap.insert(0, unit)
+                overlap_tokens += unit[3]
+            while overlap and overlap_tokens + unit_tokens > chunk_size:
+                overlap_tokens -= overlap.pop(0)[3]
+            units, tokens = overlap, overlap_tokens
+            fresh = False
+
+        units.append((kind, start, end, unit_tokens))
+        tokens += unit_tokens
+        # A heading alone isn't worth a chunk
+        fresh = fresh or kind != HEADING
+
+    if fresh:
+        yield make_chunk()
+
+
+def chunk_markdown(content: str, chunk_size: int = 128, chunk_overlap: int = 16) -> List[str]:
     """
     Chunk markdown content into smaller pieces for embedding
-    
+
     Args:
         content: Markdown content to chunk
-        chunk_size: Target size of each chunk in characters
-        chunk_overlap: Number of characters to overlap between chunks
-    
+        chunk_size: Target size of each chunk in estimated tokens
+        chunk_overlap: Tokens of whole sentences shared between consecutive chunks
+
     Returns:
         List of text chunks
     """
-    # Remove frontmatter
-    content = re.sub(r'^---\n.*?\n---\n', '', content, flags=re.DOTALL)
-    
-    # Split by headers first to maintain context
-    sections = re.split(r'\n(#{1,6}\s+.*?)\n', content)
-    
-    chunks = []
-    current_chunk = ""
-    current_header = ""
-    
-    for i, section in enumerate(sections):
-        # Check if this is a header
-        if re.match(r'^#{1,6}\s+', section):
-            current_header = section
-            continue
-        
-        # Add header to chunk if we have one
-        if current_header and not current_chunk:
-            current_chunk = current_header + "\n\n"
-        
-        # Split section into sentences
-        sentences = re.split(r'(?<=[.!?])\s+', section)
-        
-        for sentence in sentences:
-            # If adding this sentence would exceed chunk_size, save current chunk
-            if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
-                chunks.append(current_chunk.strip())
-                
-                # Start new chunk with overlap
-                overlap_text = current_chunk[-chunk_overlap:] if len(current_chunk) > chunk_overlap else current_chunk
-                current_chunk = overlap_text + " " + sentence
-            else:
-                current_chunk += " " + sentence
-    
-    # Add remaining chunk
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    
-    return chunks
+    return [chunk.text for chunk in iter_chunks(content, chunk_size, chunk_overlap)]
 
 
 def clean_text(text: str) -> str:
     """Clean text by removing extra whitespace and special characters"""
     # Remove multiple spaces
-    text = re.sub(r'\s+', ' ', text)
+    text = WHITESPACE_PATTERN.sub(' ', text)
     # Remove code blocks for cleaner embedding
-    text = re.sub(r'```[\s\S]*?```', '[CODE_BLOCK]', text)
+    text = CODE_BLOCK_PATTERN.sub('[CODE_BLOCK]', text)
     return text.strip()
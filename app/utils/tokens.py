@@ -0,0 +1,43 @@
+import re
+
+# Words, numbers and individual punctuation marks; roughly how BPE tokenizers split English prose
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Words long enough to count as more than one token
+_LONG_WORD_PATTERN = re.compile(r"\w{9,}")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of model tokens in text
+
+    Gemini's tokenizer isn't available locally, so this counts words and
+    punctuation, splitting long words every 8 characters the way subword
+    vocabularies do. Close enough for budgeting prompts, not for billing.
+    """
+    # Extra subword tokens are only possible for long words, so only those are measured
+    extra = sum((len(word) - 1) // 8 for word in _LONG_WORD_PATTERN.findall(text))
+    return len(_TOKEN_PATTERN.findall(text)) + extra
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, ending on a sentence or word boundary"""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    # Binary search on the character length that fits the budget
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+
+    sentence_end = max(cut.rfind(". "), cut.rfind(".\n"), cut.rfind("\n\n"))
+    if sentence_end > len(cut) // 2:
+        return cut[:sentence_end + 1].rstrip()
+    word_end = cut.rfind(" ")
+    return (cut[:word_end] if word_end > 0 else cut).rstrip()
@@ -1,89 +1,364 @@
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    Disabled, PointStruct, Filter, FieldCondition, MatchValue, PayloadSchemaType, PointIdsList, QueryRequest,
+    OverwritePayloadOperation, SetPayload
+)
 from app.config import settings
+from app.chunk_text_store import get_chunk_text_store
+from app.collection_schema import (
+    PAYLOAD_INDEX_FIELDS, embedding_dimension, hnsw_config, quantization_config, search_params, vectors_config
+)
+from app.metrics import timed
+from app.upstream import qdrant_client_options, search_upstream
 import uuid
-from typing import List, Dict, Optional
+from dataclasses import dataclass, field
+from typing import Any, List, Dict, Optional, Sequence, Tuple
+
+
+@dataclass
+class ScoredChunk:
+    """Search hit with the same shape as Qdrant's ScoredPoint, for non-Qdrant retrievers"""
+    id: str
+    score: float
+    payload: Dict[str, Any] = field(default_factory=dict)
+    vector: Optional[List[float]] = None
+
+
+# Bumped when build_payload changes; ingestion then rewrites payloads in place
+PAYLOAD_VERSION = 2
+
+# Payload fields search hits need: context packing, reranking and sources
+SEARCH_PAYLOAD_FIELDS = ["text", "heading", "module", "chapter", "file_path", "chunk_index"]
+
+# Namespace for deterministic chunk point ids
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c2a52-3f0e-4c8e-9a51-0b7d4e2c9f13")
+
+
+def chunk_point_id(file_path: str, chunk_index: int) -> str:
+    """Stable point id for a chunk, so re-ingesting a file overwrites its points"""
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{file_path}#{chunk_index}"))
+
+
+def build_point_id(meta: Dict) -> str:
+    """Deterministic id when the chunk's position is known, random otherwise"""
+    if meta.get("file_path") and "chunk_index" in meta:
+        return chunk_point_id(meta["file_path"], meta["chunk_index"])
+    return str(uuid.uuid4())
+
+
+def chunk_heading(meta: Dict) -> str:
+    """Heading shown for a chunk: its heading path, or the section when it has none"""
+    heading_path = meta.get("heading_path") or []
+    return " > ".join(heading_path) if heading_path else meta.get("section", "")
+
+
+def build_payload(chunk: str, meta: Dict) -> Dict:
+    """Payload stored alongside each chunk's vector"""
+    return {
+        "text": chunk,
+        "heading": chunk_heading(meta),
+        "module": meta.get("module", ""),
+        "chapter": meta.get("chapter", ""),
+        "section": meta.get("section", ""),
+        "file_path": meta.get("file_path", ""),
+        "chunk_index": meta.get("chunk_index", 0),
+        "heading_path": meta.get("heading_path", []),
+        "char_start": meta.get("char_start"),
+        "char_end": meta.get("char_end")
+    }
 
 
 class VectorStore:
     """Qdrant vector database integration"""
     
     def __init__(self):
-        self.client = QdrantClient(
-            url=settings.QDRANT_URL,
-            api_key=settings.QDRANT_API_KEY
-        )
+        # The sync client serves ingestion and admin work, the async one the request path
+        self.client = QdrantClient(**qdrant_client_options())
+        self.async_client = AsyncQdrantClient(**qdrant_client_options(timeout=settings.UPSTREAM_SEARCH_TIMEOUT))
         self.collection_name = settings.QDRANT_COLLECTION_NAME
+        # Chunk texts kept out of the payloads, if configured
+        self.text_store = get_chunk_text_store()
+
+    @property
+    def payload_format(self) -> str:
+        """What the stored payloads look like; ingestion rewrites them when this changes"""
+        return f"{PAYLOAD_VERSION}-external-text" if self.text_store is not None else str(PAYLOAD_VERSION)
+
+    def _point_payload(self, chunk: str, meta: Dict) -> Dict:
+        """build_payload, minus the text when it lives in the text store"""
+        payload = build_payload(chunk, meta)
+        if self.text_store is not None:
+            del payload["text"]
+        return payload
+
+    def _store_texts(self, chunks: List[str], metadata: List[Dict]):
+        if self.text_store is not None:
+            self.text_store.put_many((build_point_id(meta), chunk) for chunk, meta in zip(chunks, metadata))
+
+    def _hydrate(self, hits: List) -> List:
+        """Put the texts of hits back from the text store"""
+        return self.text_store.hydrate(hits) if self.text_store is not None else hits
     
-    def create_collection(self, vector_size: int = 1536):
-        """Create collection for OpenAI embeddings"""
+    def create_collection(self, vector_size: Optional[int] = None) -> bool:
+        """
+        Create the collection with the configured schema, returns False if it already exists
+
+        The vector size defaults to the embedding model's dimension.
+        """
+        vector_size = vector_size or embedding_dimension()
+        if not vector_size:
+            raise ValueError(
+                f"Unknown dimension for embedding model {settings.EMBEDDING_MODEL}, set EMBEDDING_DIMENSION"
+            )
+
         try:
             self.client.create_collection(
                 collection_name=self.collection_name,
-                vectors_config=VectorParams(
-                    size=vector_size,
-                    distance=Distance.COSINE
-                )
+                vectors_config=vectors_config(vector_size),
+                hnsw_config=hnsw_config(),
+                quantization_config=quantization_config()
             )
-            print(f"[SUCCESS] Collection '{self.collection_name}' created successfully")
         except Exception as e:
             print(f"[WARNING] Collection might already exist: {e}")
+            return False
+
+        self.ensure_payload_indexes()
+        print(f"[SUCCESS] Collection '{self.collection_name}' created successfully ({vector_size} dims)")
+        return True
+
+    def ensure_payload_indexes(self) -> List[str]:
+        """Create missing keyword indexes for the filtered payload fields, returns the fields indexed"""
+        existing = self.client.get_collection(self.collection_name).payload_schema or {}
+        created = []
+        for field_name in PAYLOAD_INDEX_FIELDS:
+            if field_name in existing:
+                continue
+            self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field_name,
+                field_schema=PayloadSchemaType.KEYWORD,
+                wait=True
+            )
+            created.append(field_name)
+        return created
+
+    def vector_size(self) -> Optional[int]:
+        """Vector size of the existing collection"""
+        vectors = self.client.get_collection(self.collection_name).config.params.vectors
+        return getattr(vectors, "size", None)
+
+    def apply_schema(self) -> Dict[str, Any]:
+        """
+        Bring an existing collection in line with the configured schema
+
+        Payload indexes, HNSW parameters and quantization can all change in
+        place; Qdrant rebuilds the affected segments in the background. The
+        vector size can't, so a mismatch is only reported.
+        """
+        expected_size = embedding_dimension()
+        actual_size = self.vector_size()
+
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            hnsw_config=hnsw_config(),
+            quantization_config=quantization_config() or Disabled.DISABLED
+        )
+        return {
+            "indexed_fields": self.ensure_payload_indexes(),
+            "vector_size": actual_size,
+            "expected_vector_size": expected_size,
+            "dimension_mismatch": bool(expected_size and actual_size and expected_size != actual_size),
+            "quantization": settings.QDRANT_QUANTIZATION,
+            "hnsw": {"m": settings.QDRANT_HNSW_M, "ef_construct": settings.QDRANT_HNSW_EF_CONSTRUCT}
+        }
+
+    def recreate_collection(self, vector_size: Optional[int] = None) -> bool:
+        """Drop and recreate the collection; its points must be re-ingested"""
+        self.client.delete_collection(self.collection_name)
+        return self.create_collection(vector_size)
     
     def upsert_chunks(self, chunks: List[str], embeddings: List[List[float]], metadata: List[Dict]):
-        """Store text chunks with embeddings"""
+        """
+        Store text chunks with embeddings
+
+        Chunks whose metadata carries file_path and chunk_index get deterministic
+        ids, so upserting them again replaces the existing points.
+        """
         points = [
             PointStruct(
-                id=str(uuid.uuid4()),
+                id=build_point_id(meta),
                 vector=embedding,
-                payload={
-                    "text": chunk,
-                    "module": meta.get("module", ""),
-                    "chapter": meta.get("chapter", ""),
-                    "section": meta.get("section", ""),
-                    "file_path": meta.get("file_path", "")
-                }
+                payload=self._point_payload(chunk, meta)
             )
             for chunk, embedding, meta in zip(chunks, embeddings, metadata)
         ]
         
+        self._store_texts(chunks, metadata)
         self.client.upsert(
             collection_name=self.collection_name,
             points=points
         )
         return len(points)
+
+    def upload_chunks(
+        self,
+        chunks: List[str],
+        embeddings: List[List[float]],
+        metadata: List[Dict],
+        batch_size: int = 256
+    ) -> int:
+        """
+        Bulk-store chunks with upload_points
+
+        Like upsert_chunks, but the points are sent in batches of `batch_size`
+        with failed batches retried, and the call returns once they're written.
+        """
+        points = (
+            PointStruct(id=build_point_id(meta), vector=embedding, payload=self._point_payload(chunk, meta))
+            for chunk, embedding, meta in zip(chunks, embeddings, metadata)
+        )
+        self._store_texts(chunks, metadata)
+        self.client.upload_points(
+            collection_name=self.collection_name,
+            points=points,
+            batch_size=batch_size,
+            wait=True
+        )
+        return len(chunks)
+
+    def update_payloads(self, chunks: List[str], metadata: List[Dict]) -> int:
+        """Rewrite the payloads of existing points without touching their vectors"""
+        if not chunks:
+            return 0
+
+        self._store_texts(chunks, metadata)
+        self.client.batch_update_points(
+            collection_name=self.collection_name,
+            update_operations=[
+                OverwritePayloadOperation(
+                    overwrite_payload=SetPayload(payload=self._point_payload(chunk, meta), points=[build_point_id(meta)])
+                )
+                for chunk, meta in zip(chunks, metadata)
+            ]
+        )
+        return len(chunks)
+
+    def delete_points(self, ids: List[str]) -> int:
+        """Delete points by id"""
+        if not ids:
+            return 0
+
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=PointIdsList(points=ids)
+        )
+        if self.text_store is not None:
+            self.text_store.delete_many(ids)
+        return len(ids)
     
+    def _build_filter(
+        self,
+        module_filter: Optional[str] = None,
+        chapter_filter: Optional[str] = None
+    ) -> Optional[Filter]:
+        """Build a Qdrant filter from optional module/chapter constraints"""
+        if not (module_filter or chapter_filter):
+            return None
+
+        conditions = []
+        if module_filter:
+            conditions.append(
+                FieldCondition(key="module", match=MatchValue(value=module_filter))
+            )
+        if chapter_filter:
+            conditions.append(
+                FieldCondition(key="chapter", match=MatchValue(value=chapter_filter))
+            )
+        return Filter(must=conditions)
+
     def search(
         self,
         query_vector: List[float],
         limit: int = 5,
         module_filter: Optional[str] = None,
-        chapter_filter: Optional[str] = None
+        chapter_filter: Optional[str] = None,
+        with_vectors: bool = False
     ):
-        """Search for relevant chunks with optional filters"""
-        search_filter = None
-
-        # Build filters if provided
-        if module_filter or chapter_filter:
-            conditions = []
-            if module_filter:
-                conditions.append(
-                    FieldCondition(key="module", match=MatchValue(value=module_filter))
-                )
-            if chapter_filter:
-                conditions.append(
-                    FieldCondition(key="chapter", match=MatchValue(value=chapter_filter))
-                )
-            search_filter = Filter(must=conditions)
+        """Search for relevant chunks with optional filters, and their vectors for reranking"""
+        with timed("search"):
+            results = search_upstream.call_sync(lambda: self.client.query_points(
+                collection_name=self.collection_name,
+                query=query_vector,
+                limit=limit,
+                query_filter=self._build_filter(module_filter, chapter_filter),
+                search_params=search_params(),
+                with_payload=SEARCH_PAYLOAD_FIELDS,
+                with_vectors=with_vectors
+            ))
 
-        results = self.client.query_points(
-            collection_name=self.collection_name,
-            query=query_vector,
-            limit=limit,
-            query_filter=search_filter
-        )
+        return self._hydrate(results.points)
+
+    async def asearch(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        module_filter: Optional[str] = None,
+        chapter_filter: Optional[str] = None,
+        with_vectors: bool = False
+    ):
+        """Async variant of search for use on the request path"""
+        with timed("search"):
+            results = await search_upstream.call(lambda: self.async_client.query_points(
+                collection_name=self.collection_name,
+                query=query_vector,
+                limit=limit,
+                query_filter=self._build_filter(module_filter, chapter_filter),
+                search_params=search_params(),
+                with_payload=SEARCH_PAYLOAD_FIELDS,
+                with_vectors=with_vectors
+            ))
+
+        return self._hydrate(results.points)
 
-        return results.points
+    async def asearch_batch(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        filters: Optional[Sequence[Tuple[Optional[str], Optional[str]]]] = None,
+        with_vectors: bool = False
+    ) -> List[List]:
+        """
+        Run several searches in one round trip
+
+        `filters` holds a (module, chapter) pair per query vector. Results come
+        back in the same order as the query vectors.
+        """
+        if not query_vectors:
+            return []
+        filters = filters or [(None, None)] * len(query_vectors)
+        requests = [
+            QueryRequest(
+                query=query_vector,
+                limit=limit,
+                filter=self._build_filter(module_filter, chapter_filter),
+                params=search_params(),
+                with_payload=SEARCH_PAYLOAD_FIELDS,
+                with_vector=with_vectors
+            )
+            for query_vector, (module_filter, chapter_filter) in zip(query_vectors, filters)
+        ]
+        with timed("search"):
+            responses = await search_upstream.call(lambda: self.async_client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=requests
+            ))
+
+        return [self._hydrate(response.points) for response in responses]
     
+    async def acollection_exists(self) -> bool:
+        """Whether the collection exists, over the request-path client"""
+        return await self.async_client.collection_exists(self.collection_name)
+
     def collection_info(self):
         """Get collection information"""
         try:
@@ -98,3 +373,13 @@ class VectorStore:
             }
         except Exception as e:
             return {"error": str(e)}
+
+
+def get_vector_store():
+    """Vector store for the configured VECTOR_BACKEND"""
+    if settings.VECTOR_BACKEND == "local":
+        from app.local_vector_store import LocalVectorStore
+        return LocalVectorStore()
+    if settings.VECTOR_BACKEND != "qdrant":
+        raise ValueError(f"Unknown VECTOR_BACKEND: {settings.VECTOR_BACKEND}")
+    return VectorStore()
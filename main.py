@@ -1,7 +1,61 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import chat, health
+from app.routers import chat, health, admin, metrics
 from app.config import settings
+from app.conversation_writer import get_conversation_writer
+from app.metrics import STARTUP_SECONDS, ServerTimingMiddleware
+from app.rag_engine import get_rag_engine
+from app.readiness import readiness
+
+
+async def warm_up():
+    """
+    Prime upstream connections before the first request
+
+    Runs the readiness checks, which open the Qdrant, database and LLM
+    connections and cache the collection check. Failures are logged, not
+    fatal: /health/ready keeps reporting them until the dependency is back.
+    """
+    try:
+        checks = await asyncio.wait_for(readiness.check_all(), settings.STARTUP_WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"[WARNING] Warm-up didn't finish within {settings.STARTUP_WARMUP_TIMEOUT}s")
+        return
+    for name, check in checks.items():
+        if check["ok"]:
+            print(f"[INFO] {name} reachable ({check['latency_ms']:.0f} ms)")
+        else:
+            print(f"[WARNING] {name} not reachable: {check['error']}")
+
+
+class ConfiguredCORSMiddleware(CORSMiddleware):
+    """CORS for CORS_ORIGINS, read when the middleware stack is built rather than at import"""
+
+    def __init__(self, app, **options):
+        super().__init__(app, allow_origins=settings.cors_origins_list, **options)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build clients and warm up on startup; drain queues and save caches on shutdown"""
+    started = time.perf_counter()
+    rag_engine = get_rag_engine()
+    conversation_writer = get_conversation_writer()
+    conversation_writer.start()
+    if settings.STARTUP_WARMUP:
+        await warm_up()
+    STARTUP_SECONDS.set(time.perf_counter() - started)
+    print(f"[SUCCESS] Startup finished in {time.perf_counter() - started:.2f}s")
+
+    yield
+
+    # Drain queued conversations and persist the query-embedding cache
+    await conversation_writer.stop()
+    rag_engine.embedding_cache.save()
+
 
 # Create FastAPI app
 app = FastAPI(
@@ -9,21 +63,27 @@ app = FastAPI(
     description="Retrieval-Augmented Generation API for the Physical AI textbook",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.cors_origins_list,
+    ConfiguredCORSMiddleware,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Per-stage latency breakdown on every response
+app.add_middleware(ServerTimingMiddleware)
+
 # Include routers
 app.include_router(health.router)
 app.include_router(chat.router, prefix="/api/chat")
+app.include_router(admin.router, prefix="/admin")
+app.include_router(metrics.router)
 
 
 @app.get("/")
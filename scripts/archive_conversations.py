@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Archive Conversations Script
+Moves conversations older than CONVERSATION_RETENTION_DAYS out of the
+database into gzipped JSON Lines files, so the table stops growing
+
+Rows are read in (created_at, id) order with keyset pagination, one batch
+at a time, and streamed from a server-side cursor straight into the batch's
+archive file. A batch is deleted only once its file is complete on disk. If
+a run is interrupted between the two, the next run writes the same file
+again under the same name. The analytics rollups are refreshed first, so
+archived rows stay counted in them.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import delete
+
+from app.config import settings
+from app.conversation_analytics import arefresh_rollups
+from app.database import Conversation, conversations_page, get_engine
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Ids per DELETE statement, well under every backend's bound-parameter limit
+DELETE_CHUNK_SIZE = 500
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Can't serialize {type(value).__name__}")
+
+
+def archive_batch(connection, after, cutoff: datetime, batch_size: int, output: Path, dry_run: bool):
+    """
+    Archive one page of rows older than `cutoff`
+
+    Returns the archived ids, the key of the last row (the next page starts
+    after it) and the archive file, or None when dry-running.
+    """
+    statement = conversations_page(after, batch_size, Conversation.created_at < cutoff)
+    # stream_results uses a server-side cursor where the driver has one (psycopg), so
+    # rows are fetched in chunks as they're written instead of all at once
+    result = connection.execution_options(stream_results=True, max_row_buffer=500).execute(statement)
+
+    ids = []
+    first = last = None
+    tmp_path = output / ".archive.jsonl.gz.tmp"
+    archive_file = None if dry_run else gzip.open(tmp_path, "wt", encoding="utf-8")
+    try:
+        for row in result.mappings():
+            first = first or row
+            last = row
+            ids.append(row["id"])
+            if archive_file is not None:
+                archive_file.write(json.dumps(dict(row), default=_json_default) + "\n")
+    finally:
+        if archive_file is not None:
+            archive_file.close()
+
+    if not ids or dry_run:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        return ids, (last["created_at"], last["id"]) if last else None, None
+
+    # Named after the first row, so re-archiving the same rows overwrites the file
+    path = output / f"conversations-{first['created_at']:%Y%m%dT%H%M%S%f}-{first['id'][:8]}.jsonl.gz"
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return ids, (last["created_at"], last["id"]), path
+
+
+def archive(days: int, batch_size: int, output: Path, dry_run: bool = False):
+    """Archive and delete conversations older than `days` days, batch by batch"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    output.mkdir(parents=True, exist_ok=True)
+    engine = get_engine()
+    print(f"[INFO] Archiving conversations from before {cutoff:%Y-%m-%d %H:%M} UTC to {output}")
+    if not dry_run:
+        folded = asyncio.run(arefresh_rollups())
+        print(f"[INFO] Folded {folded} new conversations into the analytics rollups")
+
+    archived = 0
+    after = None
+    while True:
+        with engine.connect() as connection:
+            ids, after, path = archive_batch(connection, after, cutoff, batch_size, output, dry_run)
+        if not ids:
+            break
+
+        if not dry_run:
+            with engine.begin() as connection:
+                for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+                    connection.execute(delete(Conversation).where(Conversation.id.in_(ids[i:i + DELETE_CHUNK_SIZE])))
+            print(f"   [SUCCESS] Archived {len(ids)} conversations to {path.name}")
+        archived += len(ids)
+
+    if dry_run:
+        print(f"[INFO] Dry run: {archived} conversations would be archived")
+    else:
+        print(f"[SUCCESS] Archived {archived} conversations")
+    return archived
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old conversations to gzipped JSON Lines files")
+    parser.add_argument("--days", type=int, default=settings.CONVERSATION_RETENTION_DAYS,
+                        help="Archive conversations older than this many days")
+    parser.add_argument("--batch-size", type=int, default=settings.CONVERSATION_ARCHIVE_BATCH_SIZE,
+                        help="Rows per archive file and per delete transaction")
+    parser.add_argument("--output", type=Path, default=Path(settings.CONVERSATION_ARCHIVE_PATH),
+                        help="Directory for the archive files")
+    parser.add_argument("--dry-run", action="store_true", help="Count the rows that would be archived")
+    args = parser.parse_args()
+
+    archive(args.days, args.batch_size, args.output, args.dry_run)
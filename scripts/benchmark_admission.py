@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Admission Control Benchmark
+Sends /api/chat requests at a multiple of what the completion upstream can
+serve, with admission control off and on.
+
+The stub upstream (scripts/stub_upstream.py) answers completions beyond
+--capacity in flight with 429, like an exhausted Gemini quota. Without
+admission control every request goes upstream, so requests run into 429s,
+retries and an open circuit breaker. With it, completions are capped at the
+upstream's capacity. Requests that can't be served in time are shed early
+with 429, and admitted requests keep their latency.
+
+Runs offline, like scripts/load_test.py.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+
+from scripts.load_test import build_environment, make_queries, percentile, seed, start_process
+
+
+async def spike(base_url: str, rate: float, duration: float) -> Dict:
+    """
+    Send requests at a fixed `rate` for `duration` seconds, whatever the responses
+
+    Open loop, like independent users: shed requests don't slow down arrivals.
+    Returns status counts and the latencies of successful requests.
+    """
+    queries = make_queries(int(rate * duration), 0.0, seed_value=1)
+    statuses = Counter()
+    latencies = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=httpx.Limits(max_connections=None)) as client:
+        async def send(query: Dict):
+            started = time.perf_counter()
+            try:
+                response = await client.post("/api/chat/", json=query)
+            except httpx.TransportError:
+                statuses["connection error"] += 1
+                return
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        tasks = []
+        for i, query in enumerate(queries):
+            await asyncio.sleep(max(0.0, started + i / rate - time.perf_counter()))
+            tasks.append(asyncio.create_task(send(query)))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - started
+
+    return {"statuses": statuses, "latencies": latencies, "wall": wall}
+
+
+def main(args):
+    workdir = Path(tempfile.mkdtemp(prefix="benchmark_admission_"))
+    env = build_environment(args, workdir)
+    print(f"[INFO] Seeding {args.points} chunks...")
+    seed(args, env)
+
+    stub = start_process(
+        [
+            sys.executable, "scripts/stub_upstream.py",
+            "--port", str(args.stub_port),
+            "--embedding-latency-ms", "20",
+            "--chat-latency-ms", str(args.chat_latency_ms),
+            "--jitter", "0.2",
+            "--dim", str(args.dim),
+            "--chat-capacity", str(args.capacity)
+        ],
+        env,
+        f"http://127.0.0.1:{args.stub_port}/stats"
+    )
+    modes = {
+        "off": {
+            "ADMISSION_MAX_CONCURRENCY": "0",
+            "UPSTREAM_EMBEDDING_MAX_CONCURRENCY": "0",
+            "UPSTREAM_COMPLETION_MAX_CONCURRENCY": "0",
+            "UPSTREAM_SEARCH_MAX_CONCURRENCY": "0"
+        },
+        # Admit about what the upstream can serve, with a short queue: queue
+        # wait is added to every admitted request's latency
+        "on": {
+            "ADMISSION_MAX_CONCURRENCY": str(args.capacity),
+            "ADMISSION_MAX_QUEUE": str(args.capacity),
+            "ADMISSION_QUEUE_TIMEOUT": str(args.queue_timeout),
+            "UPSTREAM_COMPLETION_MAX_CONCURRENCY": str(args.capacity)
+        }
+    }
+    upstream_rate = args.capacity / (args.chat_latency_ms / 1000)
+    rate = upstream_rate * args.overload
+    print(
+        f"[INFO] {rate:.0f} requests/s for {args.duration:.0f}s, the upstream serves about "
+        f"{upstream_rate:.0f}/s ({args.capacity} completions of {args.chat_latency_ms:.0f} ms at once)"
+    )
+    print(f"{'admission':<10} {'ok':>6} {'429':>6} {'503':>6} {'other':>6} {'ok/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    try:
+        for mode, overrides in modes.items():
+            api = start_process(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning",
+                 # Idle connections outlive the burst's pauses, so closes don't race new requests
+                 "--timeout-keep-alive", "60"],
+                {**env, **overrides},
+                f"http://127.0.0.1:{args.api_port}/health/ready"
+            )
+            try:
+                result = asyncio.run(spike(f"http://127.0.0.1:{args.api_port}", rate, args.duration))
+            finally:
+                api.terminate()
+                api.wait()
+
+            statuses, latencies = result["statuses"], result["latencies"]
+            other = sum(count for status, count in statuses.items() if status not in (200, 429, 503))
+            print(
+                f"{mode:<10} {statuses[200]:>6} {statuses[429]:>6} {statuses[503]:>6} {other:>6} "
+                f"{len(latencies) / result['wall']:>8.1f} "
+                f"{statistics.median(latencies) if latencies else 0:>8.1f} "
+                f"{percentile(latencies, 95) if latencies else 0:>8.1f} "
+                f"{percentile(latencies, 99) if latencies else 0:>8.1f}"
+            )
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /api/chat under overload with admission control off and on")
+    parser.add_argument("--overload", type=float, default=3.0, help="Request rate as a multiple of what the upstream serves")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of traffic")
+    parser.add_argument("--capacity", type=int, default=8, help="Completions the stub upstream takes at once")
+    parser.add_argument("--chat-latency-ms", type=float, default=1000)
+    parser.add_argument("--queue-timeout", type=float, default=0.25, help="ADMISSION_QUEUE_TIMEOUT for the 'on' run")
+    parser.add_argument("--points", type=int, default=1000, help="Chunks seeded into the vector store")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--stub-port", type=int, default=8107)
+    parser.add_argument("--api-port", type=int, default=8108)
+    args = parser.parse_args()
+    # Settings build_environment expects: local vector store, caches off
+    args.qdrant_url = None
+    args.caches = False
+    main(args)
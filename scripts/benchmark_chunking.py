@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Chunking Benchmark
+Generates a large synthetic MDX corpus (frontmatter, nested headings, prose,
+lists and fenced code blocks) and reports chunking throughput of the current
+chunker against the previous regex/string-concatenation implementation.
+
+Runs entirely offline; no API keys or services are needed.
+"""
+
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.utils.chunking import iter_chunks
+from app.utils.tokens import estimate_tokens
+
+WORDS = (
+    "robot joint sensor actuator topic node publisher subscriber message frame transform "
+    "controller trajectory planner lidar camera depth odometry simulation gazebo isaac "
+    "humanoid balance torque kinematics inverse forward policy reward episode latency"
+).split()
+
+CODE_SNIPPETS = [
+    "import rclpy\nfrom rclpy.node import Node\n\nnode = Node('talker')\nnode.get_logger().info('ready.')\n",
+    "ros2 launch my_robot bringup.launch.py use_sim_time:=true\nros2 topic echo /joint_states\n",
+    "def step(self, action):\n    obs = self.sim.step(action)\n    return obs, self.reward(obs), False, {}\n",
+]
+
+
+def legacy_chunk_markdown(content: str, chunk_size: int = 500, chunk_overlap: int = 50) -> List[str]:
+    """The chunker before CHUNKER_VERSION 2, kept here as the baseline"""
+    content = re.sub(r'^---\n.*?\n---\n', '', content, flags=re.DOTALL)
+    sections = re.split(r'\n(#{1,6}\s+.*?)\n', content)
+
+    chunks = []
+    current_chunk = ""
+    current_header = ""
+
+    for section in sections:
+        if re.match(r'^#{1,6}\s+', section):
+            current_header = section
+            continue
+
+        if current_header and not current_chunk:
+            current_chunk = current_header + "\n\n"
+
+        sentences = re.split(r'(?<=[.!?])\s+', section)
+
+        for sentence in sentences:
+            if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
+                chunks.append(current_chunk.strip())
+                overlap_text = current_chunk[-chunk_overlap:] if len(current_chunk) > chunk_overlap else current_chunk
+                current_chunk = overlap_text + " " + sentence
+            else:
+                current_chunk += " " + sentence
+
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+
+    return chunks
+
+
+def sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(6, 24))
+    return " ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!"])
+
+
+def synthetic_document(rng: random.Random, sections: int) -> str:
+    """One MDX chapter with a realistic mix of prose, lists and code"""
+    parts = [f"---\ntitle: Chapter {rng.randint(1, 99)}\nsidebar_position: {rng.randint(1, 9)}\n---\n"]
+    parts.append(f"# {sentence(rng)[:-1]}\n")
+    for _ in range(sections):
+        parts.append(f"{'#' * rng.randint(2, 4)} {' '.join(rng.choices(WORDS, k=3)).title()}\n")
+        for _ in range(rng.randint(1, 4)):
+            kind = rng.random()
+            if kind < 0.6:
+                parts.append(" ".join(sentence(rng) for _ in range(rng.randint(2, 8))) + "\n")
+            elif kind < 0.8:
+                parts.append("\n".join(f"- {sentence(rng)}" for _ in range(rng.randint(2, 6))) + "\n")
+            else:
+                # Code with '.' and '#' that must not be read as sentences or headings
+                body = "".join(rng.choices(CODE_SNIPPETS, k=rng.randint(1, 6)))
+                parts.append(f"```python\n# {rng.choice(WORDS)} example\n{body}```\n")
+    return "\n".join(parts)
+
+
+def bench(name: str, chunk, documents: List[str], repeats: int, chunk_size: int):
+    size_mb = sum(len(document.encode("utf-8")) for document in documents) / 1e6
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        chunks = [c for document in documents for c in chunk(document)]
+        timings.append(time.perf_counter() - started)
+    elapsed = statistics.median(timings)
+    tokens = [estimate_tokens(c) for c in chunks]
+    over_budget = sum(1 for count in tokens if count > chunk_size)
+    # An odd number of fences means a code block was cut in half
+    split_code = sum(1 for c in chunks if c.count("```") % 2)
+    print(
+        f"{name:<10} {size_mb / elapsed:>8.2f} {len(chunks) / elapsed:>10.0f} {len(chunks):>8} "
+        f"{statistics.mean(tokens):>10.1f} {max(tokens):>10} {over_budget:>11} {split_code:>10}"
+    )
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    documents = [synthetic_document(rng, args.sections) for _ in range(args.documents)]
+    size_mb = sum(len(document.encode("utf-8")) for document in documents) / 1e6
+    print(f"[INFO] {args.documents} documents, {size_mb:.1f} MB, median of {args.repeats} runs")
+    print(
+        f"{'chunker':<10} {'MB/s':>8} {'chunks/s':>10} {'chunks':>8} "
+        f"{'avg tokens':>10} {'max tokens':>10} {'over budget':>11} {'split code':>10}"
+    )
+
+    # The legacy chunker counted characters; ~4 chars per token keeps chunk sizes comparable
+    bench(
+        "legacy",
+        lambda d: legacy_chunk_markdown(d, args.chunk_size * 4, args.chunk_overlap * 4),
+        documents, args.repeats, args.chunk_size
+    )
+    bench(
+        "streaming",
+        lambda d: [c.text for c in iter_chunks(d, args.chunk_size, args.chunk_overlap)],
+        documents, args.repeats, args.chunk_size
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark markdown chunking throughput")
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--sections", type=int, default=20, help="Sections per document")
+    parser.add_argument("--chunk-size", type=int, default=128, help="Tokens per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Concurrency Benchmark
+Compares /api/chat throughput of the blocking (sync client) request path with
+the async path as the number of in-flight requests grows.
+
+Runs fully offline: upstream calls go to scripts/stub_upstream.py, Qdrant runs
+in-memory and conversations are written to a temporary SQLite database
+(requires the aiosqlite driver).
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+STUB_PORT = 8101
+DIM = 768
+
+# Point settings at local stand-ins before the app is imported
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}/"
+os.environ.setdefault("QDRANT_URL", "http://127.0.0.1:6333")
+os.environ.setdefault("QDRANT_API_KEY", "stub")
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench.db'}"
+# Both paths send the same queries, so with caching on later runs would be served from cache
+os.environ.update({"EMBEDDING_CACHE_SIZE": "0", "EMBEDDING_CACHE_PATH": "", "SEMANTIC_CACHE_SIZE": "0"})
+
+import httpx
+from fastapi import FastAPI
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import Distance, VectorParams, PointStruct
+from sqlalchemy import insert
+
+from scripts.stub_upstream import start_in_thread
+from app.conversation_writer import get_conversation_writer
+from app.database import Conversation, build_conversation_record, get_engine, init_db
+from app.models import ChatRequest, ChatResponse
+from app.rag_engine import get_rag_engine
+from app.routers import chat
+
+
+def seed_collection(client, points):
+    """Create the benchmark collection on an in-memory Qdrant client"""
+    client.create_collection(
+        collection_name=get_rag_engine().vector_store.collection_name,
+        vectors_config=VectorParams(size=DIM, distance=Distance.COSINE)
+    )
+    client.upsert(collection_name=get_rag_engine().vector_store.collection_name, points=points)
+
+
+async def aseed_collection(client, points):
+    """Async counterpart of seed_collection"""
+    await client.create_collection(
+        collection_name=get_rag_engine().vector_store.collection_name,
+        vectors_config=VectorParams(size=DIM, distance=Distance.COSINE)
+    )
+    await client.upsert(collection_name=get_rag_engine().vector_store.collection_name, points=points)
+
+
+def build_blocking_app() -> FastAPI:
+    """The pre-async request path: sync clients called from an async handler"""
+    app = FastAPI()
+
+    @app.post("/api/chat/", response_model=ChatResponse)
+    async def blocking_chat(request: ChatRequest):
+        result = get_rag_engine().chat(query=request.query, module=request.module)
+        record = build_conversation_record(
+            query=request.query,
+            response=result["response"],
+            sources=result["sources"],
+            module=request.module
+        )
+        # One blocking insert per request, as the handler did before write-behind
+        with get_engine().begin() as connection:
+            connection.execute(insert(Conversation), [record])
+        return ChatResponse(
+            response=result["response"],
+            conversation_id=record["session_id"],
+            sources=result["sources"]
+        )
+
+    return app
+
+
+def build_async_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/api/chat")
+    return app
+
+
+async def run_load(app: FastAPI, concurrency: int, total: int) -> float:
+    """Send `total` requests with `concurrency` in flight, return requests/sec"""
+    transport = httpx.ASGITransport(app=app)
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                response = await client.post("/api/chat/", json={"query": f"What is ROS 2? #{i}"})
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - started)
+
+
+async def main(args):
+    rng = random.Random(0)
+    points = [
+        PointStruct(
+            id=i,
+            vector=[rng.gauss(0.0, 1.0) for _ in range(DIM)],
+            payload={"text": f"Chunk {i} about ROS 2 nodes and topics. " * 10, "module": "module1", "chapter": "intro"}
+        )
+        for i in range(args.points)
+    ]
+
+    # Swap the remote Qdrant clients for seeded in-memory instances
+    vector_store = get_rag_engine().vector_store
+    vector_store.client = QdrantClient(location=":memory:")
+    vector_store.async_client = AsyncQdrantClient(location=":memory:")
+    seed_collection(vector_store.client, points)
+    await aseed_collection(vector_store.async_client, points)
+
+    print(f"{'concurrency':>12} {'blocking rps':>14} {'async rps':>12}")
+    for concurrency in args.concurrency:
+        total = max(args.requests, concurrency * 2)
+        blocking_rps = await run_load(build_blocking_app(), concurrency, total)
+        async_rps = await run_load(build_async_app(), concurrency, total)
+        print(f"{concurrency:>12} {blocking_rps:>14.1f} {async_rps:>12.1f}")
+
+    # The async path started the write-behind writer; drain it like the app's shutdown does
+    await get_conversation_writer().stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /api/chat throughput vs in-flight requests")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=32, help="Minimum requests per run")
+    parser.add_argument("--points", type=int, default=500, help="Points seeded into the in-memory collection")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    start_in_thread(
+        STUB_PORT,
+        embedding_latency=args.embedding_latency_ms / 1000,
+        chat_latency=args.chat_latency_ms / 1000,
+        dim=DIM
+    )
+    init_db()
+    asyncio.run(main(args))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Embedding Batcher Load Test
+Fires bursts of concurrent query embeddings through RAGEngine.agenerate_embedding
+with micro-batching off and on, and reports upstream request count and
+per-query latency percentiles.
+
+Runs offline against scripts/stub_upstream.py. The stub caps how many embedding
+requests it serves at once, like a real upstream's per-key limit, which is
+where one-request-per-query falls over under load.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+STUB_PORT = 8103
+
+# Point settings at the stub before the app is imported
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}/"
+os.environ.setdefault("QDRANT_URL", "http://127.0.0.1:6333")
+os.environ.setdefault("QDRANT_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ["VECTOR_BACKEND"] = "local"
+# Every query must reach the upstream
+os.environ["EMBEDDING_CACHE_SIZE"] = "0"
+
+import httpx
+
+from scripts.stub_upstream import start_in_thread
+from app.embedding_batcher import EmbeddingBatcher
+from app.rag_engine import RAGEngine
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run(engine, queries, concurrency):
+    """Embed all queries with at most `concurrency` in flight, return latencies and upstream requests"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(query):
+        async with semaphore:
+            started = time.perf_counter()
+            await engine.agenerate_embedding(query)
+            latencies.append(time.perf_counter() - started)
+
+    async with httpx.AsyncClient() as stats_client:
+        before = (await stats_client.get(f"http://127.0.0.1:{STUB_PORT}/stats")).json()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(query) for query in queries))
+        elapsed = time.perf_counter() - started
+        after = (await stats_client.get(f"http://127.0.0.1:{STUB_PORT}/stats")).json()
+
+    return latencies, elapsed, after["embedding_requests"] - before["embedding_requests"]
+
+
+async def main(args):
+    engine = RAGEngine()
+    configs = [("unbatched", 1, 0.0)]
+    configs += [(f"batched, wait {wait:g} ms", args.max_batch_size, wait / 1000) for wait in args.max_wait_ms]
+
+    print(f"{args.queries} queries per run, stub serves {args.upstream_concurrency} embedding requests at a time")
+    print(f"{'configuration':<24} {'concurrency':>11} {'requests':>9} {'qps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for concurrency in args.concurrency:
+        for label, batch_size, max_wait in configs:
+            engine.embedding_batcher = EmbeddingBatcher(
+                engine._aembed_texts,
+                max_batch_size=batch_size,
+                max_wait=max_wait
+            )
+            # Distinct texts per run so nothing is deduplicated across runs
+            queries = [f"{label} c{concurrency} question {i} about ROS 2 topics" for i in range(args.queries)]
+            latencies, elapsed, requests = await run(engine, queries, concurrency)
+            print(
+                f"{label:<24} {concurrency:>11} {requests:>9} {len(queries) / elapsed:>8.1f} "
+                f"{statistics.median(latencies) * 1000:>8.1f} "
+                f"{percentile(latencies, 95) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test query embedding micro-batching")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 64])
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, nargs="+", default=[2, 5])
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--upstream-concurrency", type=int, default=8, help="Embedding requests the stub serves at once")
+    args = parser.parse_args()
+
+    start_in_thread(
+        STUB_PORT,
+        embedding_latency=args.embedding_latency_ms / 1000,
+        dim=args.dim,
+        max_concurrency=args.upstream_concurrency
+    )
+    asyncio.run(main(args))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Filtered Search Benchmark
+Measures Qdrant search latency with module/chapter filters on a collection
+created the old way (no payload indexes, default HNSW) against the configured
+schema, with and without scalar quantization.
+
+Needs a Qdrant server; creates and drops its own benchmark collections.
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import numpy as np
+
+from scripts.benchmark_vector_store import synthetic_corpus, measure
+from app.collection_schema import vectors_config
+from app.config import settings
+from app.vector_store import VectorStore
+
+
+def wait_until_optimized(store: VectorStore, timeout: float = 300):
+    """Wait for Qdrant to finish building HNSW and payload indexes"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = store.client.get_collection(store.collection_name)
+        if str(getattr(info.status, "value", info.status)) == "green":
+            return
+        time.sleep(0.5)
+    print(f"[WARNING] {store.collection_name} still optimizing after {timeout:.0f}s")
+
+
+def build_collection(name: str, schema: bool, quantization: bool, dim: int, chunks, vectors, metadata) -> VectorStore:
+    """Create and fill one benchmark collection"""
+    settings.QDRANT_COLLECTION_NAME = name
+    settings.QDRANT_QUANTIZATION = quantization
+    store = VectorStore()
+    store.client.delete_collection(name)
+
+    if schema:
+        store.create_collection(dim)
+    else:
+        # What create_collection did before schema management: vectors only
+        store.client.create_collection(collection_name=name, vectors_config=vectors_config(dim))
+
+    for i in range(0, len(chunks), 1000):
+        store.upsert_chunks(chunks[i:i + 1000], vectors[i:i + 1000].tolist(), metadata[i:i + 1000])
+    wait_until_optimized(store)
+    return store
+
+
+def main(args):
+    settings.QDRANT_URL = args.qdrant_url
+    if args.search_ef:
+        settings.QDRANT_SEARCH_EF = args.search_ef
+
+    chunks, vectors, metadata = synthetic_corpus(args.points, args.dim, args.modules, args.chapters)
+    queries = np.random.default_rng(1).standard_normal((args.queries, args.dim), dtype=np.float32)
+    scenarios = [
+        ("unfiltered", {}),
+        ("module filter", {"module_filter": "module1"}),
+        ("module + chapter filter", {"module_filter": "module1", "chapter_filter": "module1-chapter1"})
+    ]
+    configs = [
+        ("before (no indexes)", "benchmark_schema_before", False, False),
+        ("after (indexed)", "benchmark_schema_after", True, False),
+        ("after + int8 quantized", "benchmark_schema_quantized", True, True)
+    ]
+
+    print(f"{args.points} points x {args.dim} dims, {args.queries} queries, search ef {settings.QDRANT_SEARCH_EF or 'default'}")
+    print(f"{'collection':<24} {'scenario':<26} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, name, schema, quantization in configs:
+        store = build_collection(name, schema, quantization, args.dim, chunks, vectors, metadata)
+        for scenario, filters in scenarios:
+            result = measure(store.search, queries, **filters)
+            print(f"{label:<24} {scenario:<26} {result['p50']:>8.2f} {result['p95']:>8.2f}")
+        if not args.keep:
+            store.client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark filtered Qdrant search before and after schema tuning")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--modules", type=int, default=4)
+    parser.add_argument("--chapters", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--search-ef", type=int, help="Override QDRANT_SEARCH_EF")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark collections")
+    main(parser.parse_args())
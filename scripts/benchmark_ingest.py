@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Ingestion Pipeline Benchmark
+Measures end-to-end throughput (chunks/sec) of the staged ingest pipeline
+(discover -> chunk -> embed -> upload) on a synthetic docs tree, with one
+chunk per request and one worker per stage as the baseline. A final run
+edits one file and re-ingests, to show what the manifest skips.
+
+Runs offline: embeddings come from scripts/stub_upstream.py and points are
+written to a local vector store in a temporary directory.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+STUB_PORT = 8102
+DIM = 64
+
+# Point settings at the stub before the app is imported
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}/"
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ["VECTOR_BACKEND"] = "local"
+
+import httpx
+
+from scripts.stub_upstream import start_in_thread
+from scripts.ingest_content import IngestManifest, IngestPipeline, create_embedding_client
+from app.lexical_index import BM25Index
+from app.local_vector_store import LocalVectorStore
+
+PARAGRAPH = (
+    "ROS 2 nodes communicate over topics, services and actions. A publisher sends messages "
+    "on a topic and every subscriber receives them, while services answer one request at a time. "
+)
+
+
+def write_docs(docs_path: Path, files: int, sections: int):
+    """Synthetic MDX tree: `files` chapters spread over four modules, `sections` headed sections each"""
+    for i in range(files):
+        chapter = docs_path / f"module{i % 4 + 1}" / f"chapter-{i}.mdx"
+        chapter.parent.mkdir(parents=True, exist_ok=True)
+        body = "\n\n".join(f"## Section {s}\n\n{PARAGRAPH * 4}Chapter {i}, part {s}." for s in range(sections))
+        chapter.write_text(f"# Chapter {i}\n\n{body}\n", encoding="utf-8")
+
+
+async def run(docs_path: Path, workdir: Path, **options):
+    """Ingest the docs tree into `workdir`'s store, return (chunks, seconds, embedding requests)"""
+    vector_store = LocalVectorStore(path=str(workdir / "vectors"), collection_name="benchmark")
+    with contextlib.redirect_stdout(io.StringIO()):
+        vector_store.create_collection(vector_size=DIM)
+    manifest = IngestManifest(str(workdir / "manifest.json"))
+    manifest.load()
+    lexical_index = BM25Index(str(workdir / "bm25.json"))
+    lexical_index.load()
+    pipeline = IngestPipeline(vector_store, create_embedding_client(), manifest, lexical_index, **options)
+
+    async with httpx.AsyncClient() as stats_client:
+        before = (await stats_client.get(f"http://127.0.0.1:{STUB_PORT}/stats")).json()
+        started = time.perf_counter()
+        # The pipeline logs every file; only the totals matter here
+        with contextlib.redirect_stdout(io.StringIO()):
+            await pipeline.run(sorted(docs_path.glob("**/*.mdx")), docs_path)
+        elapsed = time.perf_counter() - started
+        after = (await stats_client.get(f"http://127.0.0.1:{STUB_PORT}/stats")).json()
+
+    if pipeline.files_failed:
+        print(f"[WARNING] {pipeline.files_failed} files failed")
+    return pipeline.chunks_uploaded, elapsed, after["embedding_requests"] - before["embedding_requests"]
+
+
+async def main(args):
+    root = Path(tempfile.mkdtemp())
+    docs_path = root / "docs"
+    write_docs(docs_path, args.files, args.sections)
+
+    configs = [("sequential, 1 per request", dict(batch_size=1, concurrency=1, chunk_workers=1, upload_workers=1))]
+    configs += [
+        (f"batch {args.batch_size} x {c} concurrent", dict(batch_size=args.batch_size, concurrency=c))
+        for c in args.concurrency
+    ]
+
+    print(f"{args.files} files, {args.sections} sections each, {args.embedding_latency_ms:.0f} ms per embedding request")
+    print(f"{'configuration':<32} {'chunks':>8} {'chunks/sec':>12} {'requests':>10}")
+    workdir = None
+    for index, (label, options) in enumerate(configs):
+        workdir = root / f"run-{index}"
+        chunks, elapsed, requests = await run(docs_path, workdir, rate_limit=args.rate_limit, **options)
+        print(f"{label:<32} {chunks:>8} {chunks / elapsed:>12.1f} {requests:>10}")
+
+    # Incremental re-run against the last configuration's manifest
+    edited = docs_path / "module1" / "chapter-0.mdx"
+    edited.write_text(edited.read_text(encoding="utf-8") + f"\n{PARAGRAPH}\n", encoding="utf-8")
+    chunks, elapsed, requests = await run(docs_path, workdir, rate_limit=args.rate_limit, **configs[-1][1])
+    print(f"{'re-run, 1 file edited':<32} {chunks:>8} {'':>12} {requests:>10}  ({elapsed * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the staged ingestion pipeline")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--sections", type=int, default=10, help="Headed sections per file")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--rate-limit", type=float, default=0, help="Max requests/sec, 0 = unlimited")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub calls answered with 429")
+    args = parser.parse_args()
+
+    start_in_thread(
+        STUB_PORT,
+        embedding_latency=args.embedding_latency_ms / 1000,
+        error_rate=args.error_rate,
+        dim=DIM
+    )
+    asyncio.run(main(args))
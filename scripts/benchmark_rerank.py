@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Rerank Benchmark
+Measures what the second retrieval stage buys back when the first stage is
+approximate. The first stage ranks a clustered synthetic corpus by scalar-
+quantized vectors, like Qdrant with quantization and no rescoring. Its top-k,
+and its top-N reranked by LocalReranker with the exact vectors, are compared
+against the exact top-k (recall@k), along with the rerank time per query.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import numpy as np
+
+from app.reranker import LocalReranker
+from app.vector_store import ScoredChunk
+
+
+def clustered_corpus(points: int, dim: int, clusters: int, spread: float):
+    """Unit vectors around `clusters` centres, so near neighbours are close in score"""
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centres[rng.integers(0, clusters, points)] + spread * rng.standard_normal((points, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True), centres
+
+
+def quantize(vectors: np.ndarray, bits: int) -> np.ndarray:
+    """Per-dimension scalar quantization to `bits` bits, dequantized back to floats"""
+    levels = 2 ** bits - 1
+    low, high = vectors.min(axis=0), vectors.max(axis=0)
+    scale = np.maximum(high - low, 1e-12) / levels
+    return np.round((vectors - low) / scale) * scale + low
+
+
+def main(args):
+    vectors, centres = clustered_corpus(args.points, args.dim, args.clusters, args.spread)
+    approximate = quantize(vectors, args.bits)
+    rng = np.random.default_rng(1)
+    queries = centres[rng.integers(0, args.clusters, args.queries)] + args.spread * rng.standard_normal(
+        (args.queries, args.dim), dtype=np.float32
+    )
+    payloads = [{"text": f"chunk {i} " + "word " * 40, "heading": f"Section {i % 50}"} for i in range(args.points)]
+    # Exact cosine only, so recall measures the rescoring and not the boosts
+    reranker = LocalReranker(heading_weight=0.0, keyword_weight=0.0, short_penalty=0.0)
+
+    k = args.k
+    recalls = {"approximate top-k": [], f"approximate top-{args.candidates} + rerank": []}
+    rerank_ms = []
+    for query in queries:
+        exact = set(np.argsort(-(vectors @ query))[:k])
+        approximate_order = np.argsort(-(approximate @ query))
+        recalls["approximate top-k"].append(len(exact.intersection(approximate_order[:k])) / k)
+
+        candidates = [
+            ScoredChunk(id=str(row), score=float(approximate[row] @ query), payload=payloads[row], vector=vectors[row])
+            for row in approximate_order[:args.candidates]
+        ]
+        started = time.perf_counter()
+        reranked = reranker.rerank("", query, candidates, k)
+        rerank_ms.append((time.perf_counter() - started) * 1000)
+        recalls[f"approximate top-{args.candidates} + rerank"].append(
+            len(exact.intersection(int(hit.id) for hit in reranked)) / k
+        )
+
+    print(f"{args.points} points x {args.dim} dims in {args.clusters} clusters, {args.bits}-bit first stage, {args.queries} queries")
+    print(f"{'retrieval':<34} {'recall@' + str(k):>10}")
+    for label, values in recalls.items():
+        print(f"{label:<34} {statistics.mean(values):>10.3f}")
+    rerank_ms.sort()
+    print(f"\n[INFO] Rerank of {args.candidates} candidates: p50 {statistics.median(rerank_ms):.3f} ms, "
+          f"p95 {rerank_ms[int(len(rerank_ms) * 0.95) - 1]:.3f} ms per query")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark recall and cost of reranking an approximate first stage")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--spread", type=float, default=0.3, help="Noise around cluster centres")
+    parser.add_argument("--bits", type=int, default=8, help="Bits per dimension of the approximate first stage")
+    parser.add_argument("-k", type=int, default=5, help="Results kept")
+    parser.add_argument("--candidates", type=int, default=50, help="Candidates the first stage hands to the reranker")
+    parser.add_argument("--queries", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Upstream Client Benchmark
+Exercises the shared upstream layer (app/upstream.py) against
+scripts/stub_upstream.py, run in its own process:
+
+- tail latency of embedding calls with hedging off and on, when a share of
+  upstream requests is slow
+- success rate with and without retries when the upstream returns 429s
+- how fast calls fail once the circuit breaker opens during an outage
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+STUB_PORT = 8106
+
+# Point settings at the stub before the app is imported
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}/"
+os.environ.setdefault("QDRANT_URL", "http://127.0.0.1:6333")
+os.environ.setdefault("QDRANT_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import httpx
+
+from scripts.load_test import start_process
+from app.config import settings
+from app.upstream import CircuitBreaker, Upstream, UpstreamUnavailable, create_async_openai_client
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run(upstream: Upstream, client, calls: int, concurrency: int):
+    """Make `calls` embedding calls, return (latencies of successes, failures)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i: int):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await upstream.call(lambda: client.embeddings.create(model=settings.EMBEDDING_MODEL, input=f"q{i}"))
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                failures += 1
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies, failures
+
+
+def report(label: str, upstream: Upstream, latencies, failures):
+    print(
+        f"{label:<22} {len(latencies):>8} {failures:>8} {upstream.retries:>8} {upstream.hedges:>7} "
+        f"{statistics.median(latencies) * 1000 if latencies else 0:>8.1f} "
+        f"{percentile(latencies, 95) * 1000 if latencies else 0:>8.1f} "
+        f"{percentile(latencies, 99) * 1000 if latencies else 0:>8.1f}"
+    )
+
+
+def set_error_rate(error_rate: float):
+    httpx.post(f"http://127.0.0.1:{STUB_PORT}/control", json={"error_rate": error_rate}).raise_for_status()
+
+
+async def main(args):
+    client = create_async_openai_client()
+    print(f"{'scenario':<22} {'ok':>8} {'failed':>8} {'retries':>8} {'hedges':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+
+    # Tail latency: slow requests, with and without hedging
+    set_error_rate(0.0)
+    for hedge in (False, True):
+        upstream = Upstream("bench", timeout=10.0, hedge=hedge, breaker=CircuitBreaker("bench", threshold=1000))
+        # Warm up the latency history the hedge delay is derived from
+        await run(upstream, client, 50, args.concurrency)
+        upstream.retries = upstream.hedges = 0
+        latencies, failures = await run(upstream, client, args.calls, args.concurrency)
+        report(f"hedging {'on' if hedge else 'off'}", upstream, latencies, failures)
+
+    # Rate limiting: 429s with and without retries
+    set_error_rate(args.error_rate)
+    for retries in (0, settings.UPSTREAM_MAX_RETRIES):
+        upstream = Upstream("bench", timeout=10.0, hedge=False, max_retries=retries, breaker=CircuitBreaker("bench", threshold=1000))
+        latencies, failures = await run(upstream, client, args.calls, args.concurrency)
+        report(f"{args.error_rate:.0%} 429s, {retries} retries", upstream, latencies, failures)
+
+    # Outage: every call fails; the breaker should start failing fast
+    set_error_rate(1.0)
+    upstream = Upstream("bench", timeout=10.0, hedge=False, max_retries=0)
+    durations = {"upstream error": [], "breaker open": []}
+    for i in range(args.calls // 4):
+        started = time.perf_counter()
+        try:
+            await upstream.call(lambda: client.embeddings.create(model=settings.EMBEDDING_MODEL, input=f"o{i}"))
+        except UpstreamUnavailable:
+            durations["breaker open"].append(time.perf_counter() - started)
+        except Exception:
+            durations["upstream error"].append(time.perf_counter() - started)
+    print(f"\n[INFO] Outage: breaker opened after {upstream.breaker.threshold} failures")
+    for outcome, values in durations.items():
+        if values:
+            print(f"   {outcome:<15} {len(values):>4} calls, median {statistics.median(values) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark hedging, retries and the circuit breaker")
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--embedding-latency-ms", type=float, default=20)
+    parser.add_argument("--slow-rate", type=float, default=0.02, help="Share of upstream requests that are slow")
+    parser.add_argument("--slow-factor", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.2, help="Share of 429s in the retry scenario")
+    args = parser.parse_args()
+
+    stub = start_process(
+        [
+            sys.executable, "scripts/stub_upstream.py",
+            "--port", str(STUB_PORT),
+            "--embedding-latency-ms", str(args.embedding_latency_ms),
+            "--jitter", "0.2",
+            "--slow-rate", str(args.slow_rate),
+            "--slow-factor", str(args.slow_factor),
+            "--dim", "64"
+        ],
+        dict(os.environ),
+        f"http://127.0.0.1:{STUB_PORT}/stats"
+    )
+    try:
+        asyncio.run(main(args))
+    finally:
+        stub.terminate()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Vector Store Benchmark
+Measures search latency of the in-process NumPy backend, unfiltered and with
+module/chapter filters, and optionally of a Qdrant server for comparison.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import numpy as np
+
+from app.local_vector_store import LocalVectorStore
+
+
+def synthetic_corpus(points: int, dim: int, modules: int, chapters: int):
+    """Random vectors spread over modules and chapters"""
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((points, dim), dtype=np.float32)
+    metadata = []
+    for i in range(points):
+        module = f"module{i % modules + 1}"
+        metadata.append({
+            "module": module,
+            "chapter": f"{module}-chapter{i // modules % chapters + 1}",
+            "file_path": f"{module}/chapter{i // modules % chapters + 1}.mdx",
+            "chunk_index": i
+        })
+    return [f"chunk {i}" for i in range(points)], vectors, metadata
+
+
+def measure(search, queries, **filters) -> dict:
+    """Latency percentiles in milliseconds"""
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query.tolist(), limit=5, **filters)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1]
+    }
+
+
+def main(args):
+    chunks, vectors, metadata = synthetic_corpus(args.points, args.dim, args.modules, args.chapters)
+    queries = np.random.default_rng(1).standard_normal((args.queries, args.dim), dtype=np.float32)
+    scenarios = [
+        ("unfiltered", {}),
+        ("module filter", {"module_filter": "module1"}),
+        ("module + chapter filter", {"module_filter": "module1", "chapter_filter": "module1-chapter1"})
+    ]
+
+    backends = []
+    local = LocalVectorStore(path=tempfile.mkdtemp(), collection_name="benchmark")
+    local.create_collection(args.dim)
+    local.upsert_chunks(chunks, vectors, metadata)
+    backends.append(("local", local))
+
+    if args.qdrant_url:
+        from app.vector_store import VectorStore
+        from app.config import settings
+        settings.QDRANT_URL = args.qdrant_url
+        settings.QDRANT_COLLECTION_NAME = "benchmark_vector_store"
+        qdrant = VectorStore()
+        qdrant.create_collection(args.dim)
+        for i in range(0, args.points, 1000):
+            qdrant.upsert_chunks(chunks[i:i + 1000], vectors[i:i + 1000].tolist(), metadata[i:i + 1000])
+        backends.append(("qdrant", qdrant))
+
+    print(f"{args.points} points x {args.dim} dims, {args.queries} queries")
+    print(f"{'backend':<8} {'scenario':<26} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, store in backends:
+        for label, filters in scenarios:
+            result = measure(store.search, queries, **filters)
+            print(f"{name:<8} {label:<26} {result['p50']:>8.2f} {result['p95']:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark vector search latency")
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--modules", type=int, default=4)
+    parser.add_argument("--chapters", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--qdrant-url", help="Also benchmark a Qdrant server (creates a benchmark collection)")
+    main(parser.parse_args())
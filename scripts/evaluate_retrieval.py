@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Retrieval Evaluation Script
+Compares recall@k of dense (vector), lexical (BM25) and fused (RRF) retrieval
+over the ingested collection.
+
+Queries come from a JSONL file of {"query": ..., "relevant": [point ids]}, or
+are sampled from the indexed chunks themselves (one sentence per chunk, with
+that chunk as the only relevant result) when no file is given.
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.rag_engine import RAGEngine
+from app.lexical_index import reciprocal_rank_fusion
+from app.config import settings
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+def load_queries(path: str) -> list:
+    """Read an evaluation set from JSONL"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sample_queries(engine: RAGEngine, samples: int, seed: int) -> list:
+    """Use a sentence from each sampled chunk as a query for that chunk"""
+    rng = random.Random(seed)
+    docs = list(engine.lexical_index.docs.items())
+    rng.shuffle(docs)
+
+    queries = []
+    for point_id, doc in docs:
+        sentences = [
+            s for s in SENTENCE_PATTERN.split(doc["payload"].get("text", ""))
+            if 5 <= len(s.split()) <= 30 and not s.lstrip().startswith("#")
+        ]
+        if sentences:
+            queries.append({"query": rng.choice(sentences), "relevant": [point_id]})
+        if len(queries) >= samples:
+            break
+    return queries
+
+
+def recall_at_k(results, relevant: set, k: int) -> float:
+    retrieved = {str(hit.id) for hit in results[:k]}
+    return len(retrieved & relevant) / len(relevant)
+
+
+def main(args):
+    engine = RAGEngine()
+    if not len(engine.lexical_index):
+        print(f"[ERROR] Lexical index at {settings.lexical_index_path} is empty, run scripts/ingest_content.py first")
+        return
+
+    queries = load_queries(args.queries) if args.queries else sample_queries(engine, args.samples, args.seed)
+    print(f"[INFO] Evaluating {len(queries)} queries")
+
+    candidates = max(max(args.k), settings.HYBRID_CANDIDATES)
+    totals = {name: {k: 0.0 for k in args.k} for name in ("dense", "lexical", "fused")}
+
+    for item in queries:
+        relevant = {str(point_id) for point_id in item["relevant"]}
+        dense = engine.vector_store.search(engine.generate_embedding(item["query"]), limit=candidates)
+        lexical = engine.lexical_index.search(item["query"], limit=candidates)
+        fused = reciprocal_rank_fusion(
+            [dense, lexical],
+            weights=[settings.DENSE_WEIGHT, settings.LEXICAL_WEIGHT],
+            k=settings.RRF_K
+        )
+
+        for name, results in (("dense", dense), ("lexical", lexical), ("fused", fused)):
+            for k in args.k:
+                totals[name][k] += recall_at_k(results, relevant, k)
+
+    header = "".join(f"{f'recall@{k}':>12}" for k in args.k)
+    print(f"\n{'retriever':<10}{header}")
+    for name, by_k in totals.items():
+        row = "".join(f"{by_k[k] / len(queries):>12.3f}" for k in args.k)
+        print(f"{name:<10}{row}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare dense, lexical and fused retrieval recall")
+    parser.add_argument("--queries", help="JSONL evaluation set; sampled from the index when omitted")
+    parser.add_argument("--samples", type=int, default=100, help="Queries to sample when no file is given")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
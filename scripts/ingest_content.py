@@ -2,46 +2,58 @@
 """
 Content Ingestion Script
 Reads all MDX files from the docs directory and ingests them into Qdrant
+through a staged pipeline: discover -> chunk -> embed -> upload
 """
 
+import argparse
+import asyncio
+import hashlib
+import json
 import os
 import sys
 import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from openai import OpenAI
-from app.vector_store import VectorStore
-from app.utils.chunking import chunk_markdown, clean_text
+import httpx
+from openai import AsyncOpenAI
+from app.vector_store import get_vector_store, chunk_point_id, build_payload
+from app.lexical_index import BM25Index
+from app.collection_schema import embedding_dimension
+from app.utils.chunking import CHUNKER_VERSION, Chunk, clean_text, iter_chunks
+from app.upstream import create_async_openai_client, retry_delay
 from app.config import settings
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Configure OpenAI client for Gemini
-client = OpenAI(
-    api_key=settings.GEMINI_API_KEY,
-    base_url=settings.GEMINI_BASE_URL
-)
+
+def create_embedding_client() -> AsyncOpenAI:
+    """OpenAI client for Gemini on the shared upstream pool settings; retries are handled by embed_batch"""
+    return create_async_openai_client()
 
 
 def extract_metadata_from_path(file_path: str) -> dict:
     """Extract module and chapter information from file path"""
     parts = Path(file_path).parts
-    
+
     # Find module (e.g., module1, module2)
     module = ""
     for part in parts:
         if part.startswith("module"):
             module = part
             break
-    
+
     # Get chapter name from filename
     chapter = Path(file_path).stem
-    
+
     return {
         "module": module if module else "intro",
         "chapter": chapter,
@@ -49,78 +61,596 @@ def extract_metadata_from_path(file_path: str) -> dict:
     }
 
 
-def ingest_book_content():
-    """Read all MDX files and ingest into Qdrant"""
-    print("[INFO] Starting content ingestion...")
+def content_hash(text: str) -> str:
+    """SHA-256 of text, used to detect changed files and chunks"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-    # Initialize vector store
-    vector_store = VectorStore()
 
-    # Create collection
-    print("[INFO] Creating Qdrant collection...")
-    vector_store.create_collection(vector_size=1536)  # Gemini text-embedding-004 size
+class IngestManifest:
+    """
+    Record of what is already in the collection: per-file and per-chunk content hashes
 
+    The manifest is only valid for the collection, embedding model and chunking
+    settings it was built with; if any of those change, every file is re-embedded.
+    """
 
-    # Find all MDX files
-    docs_path = Path(__file__).parent.parent.parent / "docs"
-    mdx_files = list(docs_path.glob("**/*.mdx"))
+    def __init__(self, path: str):
+        self.path = path
+        self.settings_key = {
+            "collection": settings.QDRANT_COLLECTION_NAME,
+            "embedding_model": settings.EMBEDDING_MODEL,
+            "chunk_size": settings.CHUNK_SIZE,
+            "chunk_overlap": settings.CHUNK_OVERLAP,
+            "chunker": CHUNKER_VERSION
+        }
+        # relative file path -> {"hash": file hash, "chunks": [chunk hashes], "payloads": [payload hashes],
+        #                        "payload_format": vector store payload format}
+        self.files: Dict[str, Dict] = {}
 
-    print(f"[INFO] Found {len(mdx_files)} MDX files")
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("settings") == self.settings_key:
+            self.files = data.get("files", {})
+        else:
+            print("[INFO] Ingestion settings changed since the last run, re-indexing everything")
+
+    def save(self):
+        """Write atomically so an interrupted run never leaves a truncated manifest"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings_key, "files": self.files}, f, indent=2)
+        os.replace(tmp_path, self.path)
 
-    total_chunks = 0
 
-    for file_path in mdx_files:
-        print(f"\n[INFO] Processing: {file_path.name}")
+class RateLimiter:
+    """Spaces out request starts to stay under a requests-per-second budget"""
 
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def embed_batch(
+    client: AsyncOpenAI,
+    texts: List[str],
+    limiter: RateLimiter,
+    max_retries: int
+) -> List[List[float]]:
+    """Embed several texts in one request, retrying 429s and 5xx with backoff"""
+    attempt = 0
+    while True:
+        await limiter.wait()
         try:
-            # Read file
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            response = await client.embeddings.create(
+                model=settings.EMBEDDING_MODEL,
+                input=texts
+            )
+            # Results carry their input index; don't rely on response order
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as e:
+            # Ingestion can afford to wait out longer outages than the request path
+            delay = retry_delay(e, attempt, base=0.5, cap=30.0)
+            if delay is None or attempt >= max_retries:
+                raise
+            attempt += 1
+            print(f"   [WARNING] Embedding batch failed ({e}), retry {attempt}/{max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def chunk_file(content: str, metadata_base: dict, chunk_size: int, chunk_overlap: int, payload_format: str):
+    """
+    Chunk one file and hash its chunks; runs in the chunking process pool
+
+    Returns the chunks, their text hashes and their payload hashes.
+    """
+    chunks = list(iter_chunks(content, chunk_size, chunk_overlap))
+    chunk_hashes = [content_hash(chunk.text) for chunk in chunks]
+    payload_hashes = [
+        payload_hash(chunk_metadata(metadata_base, chunk, i), payload_format) for i, chunk in enumerate(chunks)
+    ]
+    return chunks, chunk_hashes, payload_hashes
+
+
+def chunk_metadata(metadata_base: dict, chunk: Chunk, chunk_index: int) -> dict:
+    """Point metadata for one chunk: file metadata plus where the chunk sits in the file"""
+    return {
+        **metadata_base,
+        "chunk_index": chunk_index,
+        "heading_path": chunk.heading_path,
+        "char_start": chunk.start,
+        "char_end": chunk.end
+    }
+
+
+def payload_hash(meta: dict, payload_format: str) -> str:
+    """Hash of a chunk's metadata; a new payload format changes every hash, so payloads get rewritten"""
+    return content_hash(json.dumps({"format": payload_format, **meta}, sort_keys=True))
+
+
+def index_lexical(lexical_index: BM25Index, chunks: List[Chunk], metadata_base: dict, indices):
+    """Add chunks to the BM25 index under the same ids as their vector points"""
+    for i in indices:
+        meta = chunk_metadata(metadata_base, chunks[i], i)
+        lexical_index.add(chunk_point_id(meta["file_path"], i), chunks[i].text, build_payload(chunks[i].text, meta))
+
+
+def notify_cache_invalidation():
+    """Tell the running API to drop cached answers built from the old corpus"""
+    if not settings.CACHE_INVALIDATION_URL:
+        return
+
+    try:
+        response = httpx.post(
+            settings.CACHE_INVALIDATION_URL,
+            headers={"X-Admin-Key": settings.ADMIN_API_KEY or ""},
+            timeout=10
+        )
+        response.raise_for_status()
+        print("[SUCCESS] Answer cache invalidated")
+    except httpx.HTTPError as e:
+        print(f"[WARNING] Could not invalidate answer cache: {e}")
+
+
+@dataclass
+class FileJob:
+    """One file on its way through the pipeline"""
+    relative_path: str
+    metadata_base: Dict
+    previous: Dict
+    file_hash: Optional[str] = None
+    content: str = ""
+    # The file is unchanged but missing from the lexical index
+    lexical_only: bool = False
+    # The file was deleted from the docs
+    deleted: bool = False
+    chunks: List[Chunk] = field(default_factory=list)
+    chunk_hashes: List[str] = field(default_factory=list)
+    payload_hashes: List[str] = field(default_factory=list)
+    # Chunk indices needing a new embedding, and those whose payload alone changed
+    changed: List[int] = field(default_factory=list)
+    moved: List[int] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    embeddings: Dict[int, List[float]] = field(default_factory=dict)
+    failed: bool = False
+
+    def diff(self):
+        """Work out which chunks changed, moved or disappeared since the manifest entry"""
+        previous_chunks = self.previous["chunks"]
+        previous_payloads = self.previous.get("payloads", [])
+        # Only chunks whose content moved or changed need a new embedding
+        self.changed = [
+            i for i, chunk_hash in enumerate(self.chunk_hashes)
+            if i >= len(previous_chunks) or previous_chunks[i] != chunk_hash
+        ]
+        # Same text, but an edit above it shifted its offsets or heading path
+        self.moved = [
+            i for i in range(min(len(self.chunks), len(previous_chunks)))
+            if previous_chunks[i] == self.chunk_hashes[i]
+            and (i >= len(previous_payloads) or previous_payloads[i] != self.payload_hashes[i])
+        ]
+        self.removed = [
+            chunk_point_id(self.relative_path, i)
+            for i in range(len(self.chunks), len(previous_chunks))
+        ]
 
-            # Extract metadata
-            metadata_base = extract_metadata_from_path(str(file_path))
 
-            # Chunk content
-            chunks = chunk_markdown(content, chunk_size=settings.CHUNK_SIZE)
-            print(f"   [INFO] Created {len(chunks)} chunks")
+class IngestPipeline:
+    """
+    Staged ingestion: discover -> chunk -> embed -> upload
 
-            if not chunks:
-                print(f"   [WARNING] No chunks created, skipping")
+    Stages are connected by bounded queues, so a slow stage holds back the
+    ones before it instead of buffering the whole corpus. Chunking runs in a
+    process pool, embedding batches are filled across files and sent
+    concurrently, and several upload workers write to the vector store.
+
+    A file is recorded in the manifest only once all of its points are
+    written, and the manifest is saved every INGEST_CHECKPOINT_INTERVAL
+    seconds, so an interrupted run picks up where it stopped.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        client: AsyncOpenAI,
+        manifest: IngestManifest,
+        lexical_index: BM25Index,
+        batch_size: int = None,
+        concurrency: int = None,
+        rate_limit: float = None,
+        chunk_workers: int = None,
+        upload_workers: int = None
+    ):
+        self.vector_store = vector_store
+        self.client = client
+        self.manifest = manifest
+        self.lexical_index = lexical_index
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.concurrency = concurrency or settings.INGEST_CONCURRENCY
+        self.limiter = RateLimiter(settings.INGEST_RATE_LIMIT if rate_limit is None else rate_limit)
+        self.chunk_workers = chunk_workers or settings.INGEST_CHUNK_WORKERS or os.cpu_count() or 1
+        self.upload_workers = upload_workers or settings.INGEST_UPLOAD_WORKERS
+
+        self.chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        self.embed_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        self.upload_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+
+        self.files_total = 0
+        self.files_done = 0
+        self.files_failed = 0
+        self.chunks_embedded = 0
+        self.chunks_uploaded = 0
+        self.points_deleted = 0
+        self.started = time.perf_counter()
+        self._last_checkpoint = time.monotonic()
+
+    async def discover(self, mdx_files: List[Path], docs_path: Path):
+        """Read files and queue the ones that changed since the manifest"""
+        seen_files = set()
+        for file_path in mdx_files:
+            # Paths relative to the docs root keep point ids stable across machines
+            relative_path = file_path.relative_to(docs_path).as_posix()
+            seen_files.add(relative_path)
+
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except OSError as e:
+                print(f"   [ERROR] Error reading {file_path.name}: {e}")
+                self.files_failed += 1
                 continue
 
-            # Generate embeddings using OpenAI SDK (Gemini endpoint)
-            print(f"   [INFO] Generating embeddings...")
-            embeddings = []
+            file_hash = content_hash(content)
+            previous = self.manifest.files.get(relative_path, {"hash": None, "chunks": []})
+            job = FileJob(relative_path, extract_metadata_from_path(relative_path), previous, file_hash, content)
+            # A new payload format only rewrites payloads: the chunk hashes still match
+            if previous["hash"] == file_hash and previous.get("payload_format") == self.vector_store.payload_format:
+                # Unchanged, but the lexical index may predate this file's points
+                if not previous["chunks"] or chunk_point_id(relative_path, 0) in self.lexical_index:
+                    continue
+                job.lexical_only = True
+
+            self.files_total += 1
+            await self.chunk_queue.put(job)
+
+        # Files that disappeared since the last run
+        for relative_path in sorted(set(self.manifest.files) - seen_files):
+            previous = self.manifest.files[relative_path]
+            job = FileJob(relative_path, extract_metadata_from_path(relative_path), previous, deleted=True)
+            job.removed = [chunk_point_id(relative_path, i) for i in range(len(previous["chunks"]))]
+            self.files_total += 1
+            await self.chunk_queue.put(job)
+
+        for _ in range(self.chunk_workers):
+            await self.chunk_queue.put(None)
+
+    async def chunk(self, pool: ProcessPoolExecutor):
+        """Chunk queued files in the process pool and pass them on for embedding"""
+        loop = asyncio.get_running_loop()
+        while (job := await self.chunk_queue.get()) is not None:
+            if job.deleted:
+                await self.embed_queue.put(job)
+                continue
 
-            for chunk in chunks:
-                cleaned_chunk = clean_text(chunk)
-                response = client.embeddings.create(
-                    model=settings.EMBEDDING_MODEL,
-                    input=cleaned_chunk
+            try:
+                job.chunks, job.chunk_hashes, job.payload_hashes = await loop.run_in_executor(
+                    pool, chunk_file, job.content, job.metadata_base, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP,
+                    self.vector_store.payload_format
                 )
-                embeddings.append(response.data[0].embedding)
+            except Exception as e:
+                print(f"   [ERROR] Error chunking {job.relative_path}: {e}")
+                self.files_failed += 1
+                continue
+            job.content = ""
+
+            if job.lexical_only:
+                index_lexical(self.lexical_index, job.chunks, job.metadata_base, range(len(job.chunks)))
+                self.files_done += 1
+                continue
+
+            job.diff()
+            print(
+                f"[INFO] {job.relative_path}: {len(job.chunks)} chunks, {len(job.changed)} changed, "
+                f"{len(job.moved)} moved, {len(job.removed)} removed"
+            )
+            await self.embed_queue.put(job)
+
+    async def embed(self):
+        """
+        Embed changed chunks in full batches across files
+
+        A partial batch is only sent when nothing else is waiting to be
+        embedded, so batches stay full while chunking keeps up.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        batch: List[Tuple[FileJob, int]] = []
+        # Chunks still waiting for a vector, per file
+        pending: Dict[int, int] = {}
+
+        async def send(items: List[Tuple[FileJob, int]]):
+            try:
+                texts = [clean_text(job.chunks[i].text) for job, i in items]
+                try:
+                    embeddings = await embed_batch(self.client, texts, self.limiter, settings.INGEST_MAX_RETRIES)
+                except Exception as e:
+                    print(f"   [ERROR] Embedding batch of {len(items)} chunks failed: {e}")
+                    embeddings = [None] * len(items)
+
+                for (job, i), embedding in zip(items, embeddings):
+                    if embedding is None:
+                        job.failed = True
+                    else:
+                        job.embeddings[i] = embedding
+                        self.chunks_embedded += 1
+                    pending[id(job)] -= 1
+                    if not pending[id(job)]:
+                        del pending[id(job)]
+                        await self.upload_queue.put(job)
+            finally:
+                semaphore.release()
+
+        async def flush():
+            nonlocal batch
+            if not batch:
+                return
+            await semaphore.acquire()
+            task = asyncio.create_task(send(batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            batch = []
+
+        while (job := await self.embed_queue.get()) is not None:
+            if not job.changed:
+                await self.upload_queue.put(job)
+            else:
+                pending[id(job)] = len(job.changed)
+                for i in job.changed:
+                    batch.append((job, i))
+                    if len(batch) >= self.batch_size:
+                        await flush()
+            if self.embed_queue.empty():
+                await flush()
 
-            # Create metadata for each chunk
-            metadata = [metadata_base.copy() for _ in chunks]
+        await flush()
+        if tasks:
+            await asyncio.gather(*tasks)
+        for _ in range(self.upload_workers):
+            await self.upload_queue.put(None)
 
-            # Upsert to Qdrant
-            print(f"   [INFO] Uploading to Qdrant...")
-            count = vector_store.upsert_chunks(chunks, embeddings, metadata)
-            total_chunks += count
+    async def upload(self):
+        """Write embedded files to the vector store, several files per upload"""
+        done = False
+        while not done:
+            job = await self.upload_queue.get()
+            if job is None:
+                break
+            jobs = [job]
+            points = len(job.changed)
+            # Top the upload up with whatever else is ready
+            while points < settings.INGEST_UPLOAD_BATCH_SIZE and not self.upload_queue.empty():
+                job = self.upload_queue.get_nowait()
+                if job is None:
+                    done = True
+                    break
+                jobs.append(job)
+                points += len(job.changed)
+            await self._write(jobs)
 
-            print(f"   [SUCCESS] Successfully ingested {count} chunks")
+    async def _write(self, jobs: List[FileJob]):
+        for job in jobs:
+            if job.failed:
+                print(f"   [ERROR] Skipping {job.relative_path}: some embeddings failed")
+                self.files_failed += 1
+        jobs = [job for job in jobs if not job.failed]
 
+        chunks, embeddings, metadata, moved_chunks, moved_metadata, stale_ids = [], [], [], [], [], []
+        for job in jobs:
+            for i in job.changed:
+                chunks.append(job.chunks[i].text)
+                embeddings.append(job.embeddings[i])
+                metadata.append(chunk_metadata(job.metadata_base, job.chunks[i], i))
+            # Moved chunks keep their vectors, only the payload is rewritten
+            for i in job.moved:
+                moved_chunks.append(job.chunks[i].text)
+                moved_metadata.append(chunk_metadata(job.metadata_base, job.chunks[i], i))
+            stale_ids.extend(job.removed)
+
+        def write() -> int:
+            if chunks:
+                self.vector_store.upload_chunks(chunks, embeddings, metadata, settings.INGEST_UPLOAD_BATCH_SIZE)
+            self.vector_store.update_payloads(moved_chunks, moved_metadata)
+            return self.vector_store.delete_points(stale_ids) if stale_ids else 0
+
+        try:
+            self.points_deleted += await asyncio.to_thread(write)
         except Exception as e:
-            print(f"   [ERROR] Error processing {file_path.name}: {e}")
-            continue
+            for job in jobs:
+                print(f"   [ERROR] Error uploading {job.relative_path}: {e}")
+            self.files_failed += len(jobs)
+            return
+
+        self.chunks_uploaded += len(chunks)
+        self.lexical_index.remove(stale_ids)
+        for job in jobs:
+            if job.deleted:
+                print(f"   [SUCCESS] Removed {job.relative_path}")
+                del self.manifest.files[job.relative_path]
+            else:
+                index_lexical(self.lexical_index, job.chunks, job.metadata_base, job.changed + job.moved)
+                self.manifest.files[job.relative_path] = {
+                    "hash": job.file_hash,
+                    "chunks": job.chunk_hashes,
+                    "payloads": job.payload_hashes,
+                    "payload_format": self.vector_store.payload_format
+                }
+                print(f"   [SUCCESS] Ingested {len(job.changed)} chunks from {job.relative_path}")
+            self.files_done += 1
+
+        if time.monotonic() - self._last_checkpoint >= settings.INGEST_CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Persist progress; only fully written files are in the manifest"""
+        self.lexical_index.save()
+        self.manifest.save()
+        self._last_checkpoint = time.monotonic()
+
+    def throughput(self) -> float:
+        return self.chunks_uploaded / max(time.perf_counter() - self.started, 1e-9)
+
+    async def report_progress(self, interval: float = 2.0):
+        while True:
+            await asyncio.sleep(interval)
+            print(
+                f"[INFO] Progress: {self.files_done}/{self.files_total} files, "
+                f"{self.chunks_embedded} chunks embedded, {self.chunks_uploaded} uploaded, "
+                f"{self.throughput():.1f} chunks/sec "
+                f"(queued: chunk {self.chunk_queue.qsize()}, embed {self.embed_queue.qsize()}, "
+                f"upload {self.upload_queue.qsize()})"
+            )
+
+    async def run(self, mdx_files: List[Path], docs_path: Path):
+        reporter = asyncio.create_task(self.report_progress())
+        try:
+            with ProcessPoolExecutor(max_workers=self.chunk_workers) as pool:
+                async def chunk_stage():
+                    await asyncio.gather(*(self.chunk(pool) for _ in range(self.chunk_workers)))
+                    await self.embed_queue.put(None)
 
+                await asyncio.gather(
+                    self.discover(mdx_files, docs_path),
+                    chunk_stage(),
+                    self.embed(),
+                    *(self.upload() for _ in range(self.upload_workers))
+                )
+        finally:
+            reporter.cancel()
+            # Also on Ctrl-C or a crash: keep whatever was fully written
+            self.checkpoint()
+
+
+async def ingest_book_content(
+    batch_size: int = None,
+    concurrency: int = None,
+    rate_limit: float = None,
+    docs_path: Optional[Path] = None,
+    full: bool = False,
+    chunk_workers: int = None,
+    upload_workers: int = None
+):
+    """
+    Read all MDX files and ingest into Qdrant
+
+    Ingestion is incremental: only chunks whose content changed since the last
+    run are embedded and upserted, and points of removed or shrunk files are
+    deleted. An interrupted run resumes from the last checkpoint.
+    """
+    print("[INFO] Starting content ingestion...")
+
+    # Initialize vector store
+    vector_store = get_vector_store()
+    client = create_embedding_client()
+
+    # Models missing from the dimension table are probed with one embedding
+    vector_size = embedding_dimension()
+    if vector_size is None:
+        probe = await embed_batch(client, ["dimension probe"], RateLimiter(0), settings.INGEST_MAX_RETRIES)
+        vector_size = len(probe[0])
+        print(f"[INFO] Detected {vector_size}-dimensional embeddings from {settings.EMBEDDING_MODEL}")
+
+    # Create collection
+    print("[INFO] Creating Qdrant collection...")
+    created = vector_store.create_collection(vector_size=vector_size)
+    if not created and vector_store.vector_size() != vector_size:
+        print(
+            f"[ERROR] Collection has {vector_store.vector_size()}-dimensional vectors but "
+            f"{settings.EMBEDDING_MODEL} produces {vector_size}. "
+            "Run scripts/migrate_collection.py --recreate, then ingest again."
+        )
+        return
+
+    manifest = IngestManifest(settings.INGEST_MANIFEST_PATH)
+    lexical_index = BM25Index(settings.lexical_index_path)
+    # A fresh collection holds none of the manifest's points
+    if not created:
+        manifest.load()
+        lexical_index.load()
+
+    if full:
+        # Forget the hashes but keep chunk counts so old points still get deleted.
+        # Saved right away, so an interrupted --full run resumes without --full.
+        for entry in manifest.files.values():
+            entry.update(hash=None, chunks=[None] * len(entry["chunks"]), payloads=[])
+        manifest.save()
+
+    # Find all MDX files
+    if docs_path is None:
+        docs_path = Path(__file__).parent.parent.parent / "docs"
+    mdx_files = sorted(docs_path.glob("**/*.mdx"))
+
+    print(f"[INFO] Found {len(mdx_files)} MDX files")
+
+    pipeline = IngestPipeline(
+        vector_store,
+        client,
+        manifest,
+        lexical_index,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        rate_limit=rate_limit,
+        chunk_workers=chunk_workers,
+        upload_workers=upload_workers
+    )
+    await pipeline.run(mdx_files, docs_path)
+
+    elapsed = time.perf_counter() - pipeline.started
     print(f"\n[SUCCESS] Ingestion complete!")
-    print(f"[INFO] Total chunks ingested: {total_chunks}")
+    print(f"[INFO] Files: {pipeline.files_done} done, {pipeline.files_failed} failed")
+    print(f"[INFO] Chunks upserted: {pipeline.chunks_uploaded}, points deleted: {pipeline.points_deleted}")
+    print(f"[INFO] Throughput: {pipeline.throughput():.1f} chunks/sec over {elapsed:.1f}s")
 
     # Show collection info
     info = vector_store.collection_info()
     print(f"[INFO] Collection info: {info}")
 
+    if pipeline.chunks_uploaded or pipeline.points_deleted:
+        notify_cache_invalidation()
+
 
 if __name__ == "__main__":
-    ingest_book_content()
+    parser = argparse.ArgumentParser(description="Ingest the book's MDX content into Qdrant")
+    parser.add_argument("--batch-size", type=int, help="Chunks per embedding request")
+    parser.add_argument("--concurrency", type=int, help="Embedding requests in flight")
+    parser.add_argument("--rate-limit", type=float, help="Max embedding requests/sec (0 = unlimited)")
+    parser.add_argument("--chunk-workers", type=int, help="Chunking processes (default: one per CPU)")
+    parser.add_argument("--upload-workers", type=int, help="Vector store uploads in flight")
+    parser.add_argument("--docs-path", type=Path, help="Docs directory (default: ../docs)")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-embed everything")
+    args = parser.parse_args()
+
+    asyncio.run(ingest_book_content(
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        rate_limit=args.rate_limit,
+        docs_path=args.docs_path,
+        full=args.full,
+        chunk_workers=args.chunk_workers,
+        upload_workers=args.upload_workers
+    ))
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Initialize Database Script
-Creates all necessary database tables
+Creates all necessary database tables and migrates existing ones
 """
 
 import sys
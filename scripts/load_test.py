@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+End-to-end Load Test
+Runs the API against local stand-ins and drives /api/chat at several
+concurrency levels, reporting latency percentiles, requests/sec and the
+per-stage breakdown from the Server-Timing header, plus the API's startup time
+(launch until /health/ready passes) and the latency of its first request.
+
+Everything runs offline: embeddings and completions come from
+scripts/stub_upstream.py, vectors live in the local NumPy backend (or a Qdrant
+server with --qdrant-url) and conversations go to a temporary SQLite database.
+The stub and the API each run in their own process.
+
+Results are written as JSON tagged with the git commit; pass an earlier file
+to --compare to see the change.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).parent.parent
+
+# Add parent directory to path
+sys.path.insert(0, str(ROOT))
+
+import httpx
+
+from scripts.stub_upstream import fake_embedding
+
+TOPICS = [
+    "ROS 2 nodes publish messages on topics and call services",
+    "URDF describes links and joints of a humanoid robot",
+    "Gazebo simulates sensors such as lidar, cameras and IMUs",
+    "Isaac Sim renders photorealistic scenes for synthetic data",
+    "Nav2 plans paths with costmaps and behaviour trees",
+    "Vision-language-action models map instructions to motor commands",
+    "rclpy timers and callbacks drive the executor loop",
+    "Inverse kinematics solves joint angles for an end effector pose",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean": round(statistics.fmean(values), 2),
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2)
+    }
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """`embedding;dur=12.3, search;dur=0.4` -> {"embedding": 12.3, "search": 0.4}"""
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if params.startswith("dur="):
+            stages[name] = float(params[4:])
+    return stages
+
+
+def git_revision() -> Dict:
+    """Commit the results belong to, and whether the tree had local changes"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "unknown", "dirty": None}
+
+
+def build_environment(args, workdir: Path) -> Dict[str, str]:
+    """Settings for both the seeding step and the API process"""
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_API_KEY": "stub",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{args.stub_port}/",
+        "EMBEDDING_DIMENSION": str(args.dim),
+        "DATABASE_URL": f"sqlite:///{workdir / 'load_test.db'}",
+        "LOCAL_VECTOR_STORE_PATH": str(workdir / "vectors"),
+        "LEXICAL_INDEX_PATH": str(workdir / "bm25.json"),
+        "QDRANT_COLLECTION_NAME": "load_test",
+        "EMBEDDING_CACHE_PATH": "",
+        "ENVIRONMENT": "load-test"
+    })
+    if args.qdrant_url:
+        env.update({"VECTOR_BACKEND": "qdrant", "QDRANT_URL": args.qdrant_url, "QDRANT_API_KEY": ""})
+    else:
+        env["VECTOR_BACKEND"] = "local"
+    if not args.caches:
+        # Every request runs the whole pipeline
+        env.update({"EMBEDDING_CACHE_SIZE": "0", "SEMANTIC_CACHE_SIZE": "0"})
+    return env
+
+
+def seed(args, env: Dict[str, str]):
+    """Fill the vector store, lexical index and database in a child process with the benchmark settings"""
+    script = f"""
+import sys
+sys.path.insert(0, {str(ROOT)!r})
+from scripts.load_test import seed_corpus
+seed_corpus({args.points}, {args.dim})
+"""
+    subprocess.run([sys.executable, "-c", script], env=env, check=True)
+
+
+def seed_corpus(points: int, dim: int):
+    """Synthetic chapters embedded the way the stub embeds queries"""
+    from app.database import init_db
+    from app.lexical_index import BM25Index
+    from app.vector_store import get_vector_store, build_payload, build_point_id
+    from app.config import settings
+
+    rng = random.Random(0)
+    vector_store = get_vector_store()
+    if hasattr(vector_store, "recreate_collection"):
+        vector_store.recreate_collection(dim)
+    lexical_index = BM25Index(settings.lexical_index_path)
+
+    chunks, embeddings, metadata = [], [], []
+    for i in range(points):
+        module = f"module{i % 4 + 1}"
+        chapter = f"{module}-chapter{i // 4 % 8 + 1}"
+        sentences = rng.sample(TOPICS, 4)
+        text = f"## Section {i}\n\n" + ". ".join(sentences) + "."
+        meta = {"module": module, "chapter": chapter, "file_path": f"{module}/{chapter}.mdx", "chunk_index": i}
+        chunks.append(text)
+        embeddings.append(fake_embedding(text, dim))
+        metadata.append(meta)
+        lexical_index.add(build_point_id(meta), text, build_payload(text, meta))
+
+    for start in range(0, points, 500):
+        vector_store.upsert_chunks(chunks[start:start + 500], embeddings[start:start + 500], metadata[start:start + 500])
+    lexical_index.save()
+    init_db()
+
+
+def start_process(command: List[str], env: Dict[str, str], health_url: str, timeout: float = 60) -> subprocess.Popen:
+    """Start a server process and wait until health_url answers"""
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{command[0]} exited: {process.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            if httpx.get(health_url, timeout=1).status_code < 500:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError(f"Timed out waiting for {health_url}")
+
+
+def make_queries(count: int, repeat_ratio: float, seed_value: int) -> List[Dict]:
+    """Chat requests; a share of them repeat earlier questions to exercise the caches"""
+    rng = random.Random(seed_value)
+    queries = []
+    for i in range(count):
+        if queries and rng.random() < repeat_ratio:
+            queries.append(rng.choice(queries))
+            continue
+        request = {"query": f"{rng.choice(TOPICS).split(' ', 3)[-1]}? (question {seed_value}-{i})"}
+        if rng.random() < 0.5:
+            request["module"] = f"module{rng.randint(1, 4)}"
+        queries.append(request)
+    return queries
+
+
+async def run_level(base_url: str, queries: List[Dict], concurrency: int) -> Dict:
+    """Send all queries with `concurrency` in flight and summarize the results"""
+    pending = iter(queries)
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    errors = 0
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            for request in pending:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/api/chat/", json=request)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                elapsed = (time.perf_counter() - started) * 1000
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+                latencies.append(elapsed)
+                for stage, duration in parse_server_timing(response.headers.get("server-timing")).items():
+                    stages.setdefault(stage, []).append(duration)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(queries),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 2),
+        "latency_ms": summarize(latencies) if latencies else None,
+        # Stages that didn't run for a request (e.g. skipped on a cache hit) are averaged over the requests that ran them
+        "stages_ms": {stage: summarize(values) for stage, values in sorted(stages.items())}
+    }
+
+
+def print_run(run: Dict):
+    latency = run["latency_ms"] or {"p50": 0, "p95": 0, "p99": 0}
+    print(
+        f"{run['concurrency']:>11} {run['rps']:>8.1f} {latency['p50']:>8.1f} {latency['p95']:>8.1f} "
+        f"{latency['p99']:>8.1f} {run['errors']:>6}"
+    )
+    print("            " + ", ".join(f"{stage} {values['mean']:.1f}" for stage, values in run["stages_ms"].items()))
+
+
+def compare(current: Dict, baseline_path: Path):
+    """Print the change against an earlier results file, matched by concurrency"""
+    baseline = json.loads(baseline_path.read_text())
+    previous = {run["concurrency"]: run for run in baseline["runs"]}
+    print(f"\n[INFO] Compared with {baseline['git']['commit']} ({baseline_path})")
+    if "startup" in baseline:
+        print(
+            f"[INFO] Startup {current['startup']['ready_s']:.2f}s (was {baseline['startup']['ready_s']:.2f}s), "
+            f"first request {current['startup']['first_request_ms']:.1f} ms "
+            f"(was {baseline['startup']['first_request_ms']:.1f} ms)"
+        )
+    print(f"{'concurrency':>11} {'rps':>16} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+
+    def change(new: float, old: float) -> str:
+        return f"{new:.1f} ({(new - old) / old * 100:+.0f}%)" if old else f"{new:.1f}"
+
+    for run in current["runs"]:
+        old = previous.get(run["concurrency"])
+        if not old or not run["latency_ms"] or not old["latency_ms"]:
+            continue
+        print(
+            f"{run['concurrency']:>11} {change(run['rps'], old['rps']):>16} "
+            + " ".join(
+                f"{change(run['latency_ms'][p], old['latency_ms'][p]):>18}" for p in ("p50", "p95", "p99")
+            )
+        )
+
+
+def main(args):
+    workdir = Path(tempfile.mkdtemp(prefix="load_test_"))
+    env = build_environment(args, workdir)
+    processes = []
+    try:
+        print(f"[INFO] Seeding {args.points} chunks into a {env['VECTOR_BACKEND']} store...")
+        seed(args, env)
+
+        processes.append(start_process(
+            [
+                sys.executable, "scripts/stub_upstream.py",
+                "--port", str(args.stub_port),
+                "--embedding-latency-ms", str(args.embedding_latency_ms),
+                "--chat-latency-ms", str(args.chat_latency_ms),
+                "--jitter", str(args.jitter),
+                "--dim", str(args.dim)
+            ],
+            env,
+            f"http://127.0.0.1:{args.stub_port}/stats"
+        ))
+        # Startup time: process launch until /health/ready reports every dependency reachable
+        started = time.perf_counter()
+        processes.append(start_process(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+            env,
+            f"http://127.0.0.1:{args.api_port}/health/ready"
+        ))
+        startup = {"ready_s": time.perf_counter() - started}
+        base_url = f"http://127.0.0.1:{args.api_port}"
+
+        # The first request pays for whatever startup left lazy
+        started = time.perf_counter()
+        httpx.post(f"{base_url}/api/chat/", json=make_queries(1, 0.0, seed_value=-1)[0], timeout=60).raise_for_status()
+        startup["first_request_ms"] = (time.perf_counter() - started) * 1000
+        print(f"[INFO] Ready after {startup['ready_s']:.2f}s, first request took {startup['first_request_ms']:.1f} ms")
+
+        # Warm up connections, the lexical index and the local store's memory map
+        asyncio.run(run_level(base_url, make_queries(args.warmup, 0.0, seed_value=0), 1))
+
+        results = {
+            "git": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "config": {
+                key: value for key, value in vars(args).items()
+                if key not in ("output", "compare", "stub_port", "api_port")
+            },
+            "startup": startup,
+            "runs": []
+        }
+
+        print(f"{'concurrency':>11} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+        for level, concurrency in enumerate(args.concurrency, start=1):
+            total = max(args.requests, concurrency * 4)
+            run = asyncio.run(run_level(base_url, make_queries(total, args.repeat_ratio, seed_value=level), concurrency))
+            results["runs"].append(run)
+            print_run(run)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    output = args.output or ROOT / "data" / "benchmarks" / f"load_test-{results['git']['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\n[SUCCESS] Results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end load test of /api/chat")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Minimum requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--points", type=int, default=2000, help="Chunks seeded into the vector store")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=500)
+    parser.add_argument("--jitter", type=float, default=0.2, help="Upstream latency varies by +/- this fraction")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="Share of requests repeating an earlier question")
+    parser.add_argument("--caches", action="store_true", help="Keep the embedding and answer caches enabled")
+    parser.add_argument("--qdrant-url", help="Use a Qdrant server instead of the local NumPy store")
+    parser.add_argument("--stub-port", type=int, default=8104)
+    parser.add_argument("--api-port", type=int, default=8105)
+    parser.add_argument("--output", type=Path, help="Results file (default data/benchmarks/load_test-<commit>.json)")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to compare against")
+    main(parser.parse_args())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Migrate Collection Script
+Applies the configured collection schema (payload indexes, HNSW parameters,
+scalar quantization) to an existing collection in place
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.vector_store import get_vector_store
+from app.config import settings
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+
+def migrate(recreate: bool = False):
+    """Update the collection schema, or drop and recreate it when the vector size is wrong"""
+    vector_store = get_vector_store()
+    print(f"[INFO] Migrating collection '{settings.QDRANT_COLLECTION_NAME}'...")
+
+    if recreate:
+        print("[WARNING] Dropping the collection; re-run scripts/ingest_content.py afterwards")
+        vector_store.recreate_collection()
+        return
+
+    report = vector_store.apply_schema()
+    if report["indexed_fields"]:
+        print(f"[SUCCESS] Created payload indexes: {', '.join(report['indexed_fields'])}")
+    else:
+        print("[INFO] Payload indexes already present")
+    if "hnsw" in report:
+        print(
+            f"[SUCCESS] HNSW m={report['hnsw']['m']} ef_construct={report['hnsw']['ef_construct']}, "
+            f"quantization {'on' if report['quantization'] else 'off'}; "
+            "Qdrant re-optimizes segments in the background"
+        )
+
+    if report["dimension_mismatch"]:
+        print(
+            f"[ERROR] Collection vectors are {report['vector_size']}-dimensional but "
+            f"{settings.EMBEDDING_MODEL} produces {report['expected_vector_size']}. "
+            "The size can't change in place: run with --recreate, then ingest again."
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the configured schema to an existing collection")
+    parser.add_argument(
+        "--recreate",
+        action="store_true",
+        help="Drop and recreate the collection (e.g. to fix the vector size); requires re-ingestion"
+    )
+    args = parser.parse_args()
+
+    migrate(recreate=args.recreate)
+    print("[SUCCESS] Migration complete!")
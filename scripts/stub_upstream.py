@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Stub Upstream Server
+OpenAI-compatible embeddings and chat completions endpoints with configurable
+latency, used to benchmark the backend without spending Gemini quota
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    """Deterministic pseudo-random unit vector for a text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+STUB_ANSWER = "This is a stub answer from the benchmark upstream."
+
+
+def create_app(
+    embedding_latency: float = 0.05,
+    chat_latency: float = 0.5,
+    dim: int = 768,
+    error_rate: float = 0.0,
+    max_inputs: int = 100,
+    max_concurrency: int = 0,
+    jitter: float = 0.0,
+    slow_rate: float = 0.0,
+    slow_factor: float = 10.0,
+    chat_capacity: int = 0
+) -> FastAPI:
+    """
+    Build the stub app
+
+    Latencies are in seconds and vary uniformly by +/- `jitter` (a fraction of
+    the latency); a `slow_rate` share of requests takes `slow_factor` times
+    longer, for a long tail. error_rate is the share of 429 responses, and can
+    be changed while running with POST /control.
+    max_concurrency caps embedding requests processed at once (0 = unlimited),
+    like a real upstream's per-key concurrency limit; the rest queue.
+    chat_capacity caps completions in flight (0 = unlimited); beyond it
+    completions are answered 429, like a quota being exhausted.
+    """
+    app = FastAPI(title="Stub upstream")
+    embedding_slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+
+    def delay(latency: float) -> float:
+        if slow_rate and random.random() < slow_rate:
+            latency *= slow_factor
+        return latency * random.uniform(1 - jitter, 1 + jitter) if jitter else latency
+
+    app.state.error_rate = error_rate
+    app.state.stats = {
+        "embedding_requests": 0,
+        "embedding_inputs": 0,
+        "chat_requests": 0,
+        "rate_limited": 0
+    }
+    app.state.chat_in_flight = 0
+
+    @app.post("/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        if len(inputs) > max_inputs:
+            return JSONResponse(
+                status_code=400,
+                content={"error": {"message": f"At most {max_inputs} inputs per request"}}
+            )
+        if random.random() < app.state.error_rate:
+            app.state.stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"Retry-After": "0.1"},
+                content={"error": {"message": "Resource has been exhausted"}}
+            )
+
+        app.state.stats["embedding_requests"] += 1
+        app.state.stats["embedding_inputs"] += len(inputs)
+        if embedding_slots is not None:
+            async with embedding_slots:
+                await asyncio.sleep(delay(embedding_latency))
+        else:
+            await asyncio.sleep(delay(embedding_latency))
+
+        # JSONResponse directly: FastAPI's encoder walks every float of large batches
+        return JSONResponse({
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, dim)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0}
+        })
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if chat_capacity and app.state.chat_in_flight >= chat_capacity:
+            app.state.stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"Retry-After": "1"},
+                content={"error": {"message": "Resource has been exhausted"}}
+            )
+        app.state.stats["chat_requests"] += 1
+
+        if body.get("stream"):
+            return StreamingResponse(stream_completion(body), media_type="text/event-stream")
+
+        app.state.chat_in_flight += 1
+        try:
+            await asyncio.sleep(delay(chat_latency))
+        finally:
+            app.state.chat_in_flight -= 1
+
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": STUB_ANSWER},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    async def stream_completion(body: dict):
+        # Spread the completion latency across the streamed words
+        words = STUB_ANSWER.split(" ")
+        latency = delay(chat_latency)
+        app.state.chat_in_flight += 1
+        try:
+            for i, word in enumerate(words):
+                await asyncio.sleep(latency / len(words))
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": word if i == 0 else " " + word},
+                        "finish_reason": None
+                    }]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+        finally:
+            app.state.chat_in_flight -= 1
+        yield "data: [DONE]\n\n"
+
+    @app.exception_handler(ClientDisconnect)
+    async def client_disconnected(request: Request, exc: ClientDisconnect):
+        # Hedged and timed-out calls hang up on purpose; nothing to log
+        return Response(status_code=499)
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    @app.post("/control")
+    async def control(request: Request):
+        """Change the error rate of a running stub, e.g. to simulate an outage"""
+        body = await request.json()
+        app.state.error_rate = float(body.get("error_rate", app.state.error_rate))
+        return {"error_rate": app.state.error_rate}
+
+    return app
+
+
+def start_in_thread(port: int, **kwargs) -> uvicorn.Server:
+    """Run the stub server on a background thread and wait until it accepts connections"""
+    config = uvicorn.Config(create_app(**kwargs), host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an OpenAI-compatible stub upstream")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=500)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of embedding calls answered with 429")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency varies by +/- this fraction")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of requests that are slow")
+    parser.add_argument("--slow-factor", type=float, default=10.0, help="How many times slower slow requests are")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Embedding requests processed at once, 0 = unlimited")
+    parser.add_argument("--chat-capacity", type=int, default=0, help="Completions in flight before 429s, 0 = unlimited")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(
+            embedding_latency=args.embedding_latency_ms / 1000,
+            chat_latency=args.chat_latency_ms / 1000,
+            dim=args.dim,
+            error_rate=args.error_rate,
+            max_concurrency=args.max_concurrency,
+            jitter=args.jitter,
+            slow_rate=args.slow_rate,
+            slow_factor=args.slow_factor,
+            chat_capacity=args.chat_capacity
+        ),
+        host="127.0.0.1",
+        port=args.port
+    )